@@ -0,0 +1,203 @@
+# _implementation/python/admission.py
+# This file defines how /command protects itself from duplicate and excess
+# work. The RequestCoalescer lets identical requests (speech recognition
+# sometimes sends an utterance twice) share one execution and one result
+# instead of each calling the LLM, queueing a generation and committing a
+# fork of the same history node. The AdmissionController limits how much
+# expensive work (LLM routing, music generation) each client can have
+# running, queueing a little and shedding the rest, so one busy client
+# cannot starve the others. Neither ever holds up record/stop.
+#
+# Both are used from the event loop only, so they need no locks.
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+from events import capture_events, current_event_sink
+
+
+class RequestCoalescer:
+    """
+    Runs requests with the same key once. A request whose key is already
+    running, or finished less than `window` seconds ago, gets that
+    execution's result instead of running again. The execution runs as its
+    own task, so one caller disconnecting does not cancel it for the others.
+    Its events are sent to every caller's event sink, including callers that
+    join later (they miss the events sent before they joined).
+    """
+    def __init__(self, window: float = 1.0, enabled: bool = True):
+        """
+        Args:
+            window (float): Seconds a finished result is still shared. 0 only
+                            shares executions that are still running.
+            enabled (bool): When False, every request runs on its own.
+        """
+        self.window = window
+        self.enabled = enabled
+        self._entries = {}  # key -> {"task", "sinks", "finished_at"}
+        self._stats = {"executions": 0, "coalesced": 0}
+
+    async def run(self, key, execute):
+        """
+        Returns the result of `execute()`, sharing it with identical requests.
+        The result is shared between callers and must not be mutated.
+
+        Args:
+            key: A hashable description of the request.
+            execute: An async function without arguments that runs the request.
+        """
+        if not self.enabled:
+            return await execute()
+        entry = self._entries.get(key)
+        if entry is not None and (entry["finished_at"] is None or time.monotonic() - entry["finished_at"] < self.window):
+            self._stats["coalesced"] += 1
+        else:
+            entry = {"task": None, "sinks": [], "finished_at": None}
+            self._entries[key] = entry
+            entry["task"] = asyncio.ensure_future(self._execute(key, entry, execute))
+            self._stats["executions"] += 1
+        sink = current_event_sink()
+        if sink is not None:
+            entry["sinks"].append(sink)
+        return await asyncio.shield(entry["task"])
+
+    async def _execute(self, key, entry: dict, execute):
+        def broadcast(event: str, data: dict):
+            for sink in list(entry["sinks"]):
+                sink(event, data)
+
+        try:
+            with capture_events(broadcast):
+                result = await execute()
+        except BaseException:
+            # Failures are not shared with later requests; they run again.
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+            raise
+        entry["finished_at"] = time.monotonic()
+        if self.window > 0:
+            asyncio.get_running_loop().call_later(self.window, self._expire, key, entry)
+        elif self._entries.get(key) is entry:
+            del self._entries[key]
+        return result
+
+    def _expire(self, key, entry: dict):
+        if self._entries.get(key) is entry:
+            del self._entries[key]
+
+    def stats(self) -> dict:
+        """Returns the number of executions, of requests that shared one, and of entries held."""
+        return {**self._stats, "entries": len(self._entries)}
+
+
+class Overloaded(Exception):
+    """Raised when a request is shed because its client has too much work running and queued."""
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Limits expensive work per client and overall. A client may have
+    `per_client_limit` expensive requests running; further requests wait, up
+    to `per_client_queue` of them for at most `queue_timeout` seconds, and
+    any beyond that are shed. Waiting requests are admitted in arrival order
+    as slots free up, skipping clients that are at their own limit.
+    """
+    def __init__(self, per_client_limit: int = 2, per_client_queue: int = 4, global_limit: int = 16,
+                 queue_timeout: float = 10.0):
+        """
+        Args:
+            per_client_limit (int): Expensive requests one client may have running.
+            per_client_queue (int): Expensive requests one client may have waiting.
+            global_limit (int): Expensive requests that may run across all clients.
+            queue_timeout (float): Seconds a request may wait before it is shed.
+        """
+        if per_client_limit < 1 or global_limit < 1:
+            raise ValueError("Admission limits must be at least 1.")
+        self.per_client_limit = per_client_limit
+        self.per_client_queue = per_client_queue
+        self.global_limit = global_limit
+        self.queue_timeout = queue_timeout
+        self._clients = {}  # client -> {"running", "waiting"}
+        self._running = 0
+        self._waiters = []  # (client state, future), in arrival order
+        self._stats = {"admitted": 0, "queued": 0, "shed": 0, "timed_out": 0}
+
+    def _can_run(self, client_state: dict) -> bool:
+        return client_state["running"] < self.per_client_limit and self._running < self.global_limit
+
+    def _start(self, client_state: dict):
+        client_state["running"] += 1
+        self._running += 1
+
+    @asynccontextmanager
+    async def admit(self, client: str):
+        """
+        Holds one slot for `client` while the block runs, waiting for one if needed.
+
+        Raises:
+            Overloaded: If the client's queue is full, or no slot freed up in time.
+        """
+        client_state = self._clients.setdefault(client, {"running": 0, "waiting": 0})
+        if self._can_run(client_state) and not any(state is client_state for state, _ in self._waiters):
+            self._start(client_state)
+        else:
+            await self._wait(client, client_state)
+        self._stats["admitted"] += 1
+        try:
+            yield
+        finally:
+            self._finish(client, client_state)
+
+    async def _wait(self, client: str, client_state: dict):
+        if client_state["waiting"] >= self.per_client_queue:
+            self._stats["shed"] += 1
+            self._forget(client, client_state)
+            raise Overloaded(f"Client '{client}' has too many commands running.", retry_after=1.0)
+        future = asyncio.get_running_loop().create_future()
+        waiter = (client_state, future)
+        self._waiters.append(waiter)
+        client_state["waiting"] += 1
+        self._stats["queued"] += 1
+        try:
+            await asyncio.wait_for(future, self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            elif future.done() and not future.cancelled():
+                # A slot was handed over just as the wait ended; give it back.
+                self._finish(client, client_state)
+            if isinstance(e, asyncio.TimeoutError):
+                self._stats["shed"] += 1
+                self._stats["timed_out"] += 1
+                raise Overloaded(f"No capacity for client '{client}' within {self.queue_timeout:.0f}s.",
+                                 retry_after=self.queue_timeout) from None
+            raise
+        finally:
+            client_state["waiting"] -= 1
+            self._forget(client, client_state)
+
+    def _finish(self, client: str, client_state: dict):
+        client_state["running"] -= 1
+        self._running -= 1
+        # Hand freed slots to waiters, reserving each slot before waking its waiter.
+        for waiter in list(self._waiters):
+            waiting_state, future = waiter
+            if future.done():
+                self._waiters.remove(waiter)
+            elif self._can_run(waiting_state):
+                self._waiters.remove(waiter)
+                self._start(waiting_state)
+                future.set_result(None)
+        self._forget(client, client_state)
+
+    def _forget(self, client: str, client_state: dict):
+        if not client_state["running"] and not client_state["waiting"] and self._clients.get(client) is client_state:
+            del self._clients[client]
+
+    def stats(self) -> dict:
+        """Returns admission counters and the work running and waiting now."""
+        return {**self._stats, "running": self._running, "waiting": len(self._waiters), "clients": len(self._clients)}
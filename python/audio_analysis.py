@@ -0,0 +1,372 @@
+# _implementation/python/audio_analysis.py
+# This file defines the audio analysis engine behind analysis_node. It decodes
+# a track's file to mono samples and measures its tempo, key, loudness and
+# spectral balance. The short-time spectrum is computed in fixed-size chunks
+# of frames, each transformed with one vectorized FFT, so memory stays bounded
+# however long the loop is. Results are cached by the file's content hash, so
+# a loop is analyzed once no matter how many suggestions are asked for.
+
+import hashlib
+import os
+import shutil
+import struct
+import subprocess
+import threading
+import wave
+from collections import OrderedDict
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from metrics import timed
+
+# Frame and hop sizes at DECODE_RATE; they scale with the sample rate so a
+# frame always covers about 93 ms.
+FRAME_SIZE = 2048
+HOP_SIZE = 512
+# Frames transformed per FFT call; bounds the spectrogram held in memory.
+CHUNK_FRAMES = 256
+# Files that need ffmpeg (MP3 and anything else) are decoded at this rate.
+DECODE_RATE = 22050
+
+MIN_BPM = 60
+MAX_BPM = 200
+# Band edges, in Hz, for the low / mid / high energy balance.
+LOW_MID_HZ = 250
+MID_HIGH_HZ = 4000
+
+NOTE_NAMES = ("C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B")
+# Krumhansl-Kessler key profiles, starting at the tonic.
+MAJOR_PROFILE = (6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88)
+MINOR_PROFILE = (6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17)
+
+
+class AudioDecodeError(Exception):
+    """Raised when a track's file cannot be decoded."""
+
+
+def _read_wav(path: str) -> tuple[np.ndarray, int]:
+    with wave.open(path, "rb") as wav:
+        channels, width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+        data = wav.readframes(wav.getnframes())
+    if width == 1:
+        samples = (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif width == 3:
+        raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3)
+        values = (raw[:, 0].astype(np.int32) | raw[:, 1].astype(np.int32) << 8 | raw[:, 2].astype(np.int32) << 16)
+        samples = (np.where(values >= 1 << 23, values - (1 << 24), values) / float(1 << 23)).astype(np.float32)
+    else:
+        dtype = {2: "<i2", 4: "<i4"}[width]
+        samples = np.frombuffer(data, dtype=dtype).astype(np.float32) / float(1 << (8 * width - 1))
+    return samples.reshape(-1, channels).mean(axis=1), rate
+
+
+def _read_caf(path: str) -> tuple[np.ndarray, int]:
+    """Reads a linear PCM Core Audio Format file, the format the client records loops in."""
+    with open(path, "rb") as f:
+        if f.read(8)[:4] != b"caff":
+            raise AudioDecodeError(f"{path} is not a CAF file.")
+        description = data = None
+        while data is None:
+            header = f.read(12)
+            if len(header) < 12:
+                break
+            chunk_type, size = header[:4], struct.unpack(">q", header[4:])[0]
+            if chunk_type == b"desc":
+                description = struct.unpack(">d4sIIIII", f.read(size))
+            elif chunk_type == b"data":
+                f.read(4)  # Edit count.
+                data = f.read() if size == -1 else f.read(size - 4)
+            else:
+                f.seek(size, os.SEEK_CUR)
+    if description is None or data is None:
+        raise AudioDecodeError(f"{path} has no audio description or data.")
+    rate, format_id, flags, _, _, channels, bits = description
+    if format_id != b"lpcm":
+        raise AudioDecodeError(f"{path} is not linear PCM.")
+    is_float, little_endian = flags & 1, flags & 2
+    kind = "f" if is_float else "i"
+    if bits not in (16, 32, 64) or (not is_float and bits == 64):
+        raise AudioDecodeError(f"{path} uses an unsupported {bits}-bit sample format.")
+    dtype = np.dtype(f"{'<' if little_endian else '>'}{kind}{bits // 8}")
+    samples = np.frombuffer(data[:len(data) - len(data) % (dtype.itemsize * channels)], dtype=dtype).astype(np.float32)
+    if not is_float:
+        samples /= float(1 << (bits - 1))
+    return samples.reshape(-1, channels).mean(axis=1), int(rate)
+
+
+def _read_with_ffmpeg(path: str) -> tuple[np.ndarray, int]:
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise AudioDecodeError(f"Decoding {os.path.basename(path)} needs ffmpeg, which is not installed.")
+    result = subprocess.run(
+        [ffmpeg, "-v", "error", "-i", path, "-f", "f32le", "-ac", "1", "-ar", str(DECODE_RATE), "-"],
+        capture_output=True,
+    )
+    if result.returncode != 0:
+        raise AudioDecodeError(f"ffmpeg could not decode {path}: {result.stderr.decode(errors='replace').strip()}")
+    return np.frombuffer(result.stdout, dtype="<f4"), DECODE_RATE
+
+
+def decode_audio(path: str) -> tuple[np.ndarray, int]:
+    """
+    Decodes an audio file to mono float32 samples in the range -1..1.
+    WAV and linear PCM CAF files are read directly; everything else (such as
+    the generated MP3s) is decoded with ffmpeg when it is installed.
+
+    Args:
+        path (str): The audio file.
+
+    Returns:
+        tuple[np.ndarray, int]: The samples and their sample rate.
+
+    Raises:
+        AudioDecodeError: If the file cannot be decoded.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    try:
+        if extension == ".wav":
+            return _read_wav(path)
+        if extension == ".caf":
+            return _read_caf(path)
+    except (wave.Error, KeyError, AudioDecodeError, struct.error):
+        pass  # Compressed or unusual variants of either container; let ffmpeg try.
+    return _read_with_ffmpeg(path)
+
+
+def _chroma_matrix(frequencies: np.ndarray) -> np.ndarray:
+    """
+    Maps FFT bins up to 5 kHz onto the 12 pitch classes (C = 0). Bins below
+    the frequency where one bin is narrower than a semitone are left out, as
+    their energy cannot be assigned to a single note.
+    """
+    matrix = np.zeros((12, len(frequencies)), dtype=np.float32)
+    lowest = max(55.0, (frequencies[1] - frequencies[0]) / (2 ** (1 / 12) - 1))
+    usable = (frequencies >= lowest) & (frequencies <= 5000)
+    pitch_classes = np.rint(12 * np.log2(frequencies[usable] / 440) + 69).astype(int) % 12
+    matrix[pitch_classes, np.flatnonzero(usable)] = 1
+    return matrix
+
+
+def _estimate_tempo(onsets: np.ndarray, frame_rate: float) -> tuple[float | None, float]:
+    """
+    Estimates the tempo from an onset-strength envelope by autocorrelation,
+    favouring tempos near 120 BPM to avoid picking a multiple of the beat.
+
+    Returns:
+        tuple[float | None, float]: The tempo in BPM (None if there is no
+                                    pulse to measure) and a 0..1 confidence.
+    """
+    if len(onsets) < 2 * frame_rate:
+        return None, 0.0
+    width = int(frame_rate / 2) | 1
+    envelope = np.maximum(onsets - np.convolve(onsets, np.ones(width) / width, mode="same"), 0)
+    if not envelope.any():
+        return None, 0.0
+    count = len(envelope)
+    size = 1 << (2 * count - 1).bit_length()
+    spectrum = np.fft.rfft(envelope, size)
+    correlation = np.fft.irfft(spectrum * np.conj(spectrum), size)[:count] / (count - np.arange(count))
+
+    lags = np.arange(int(frame_rate * 60 / MAX_BPM), min(count - 1, int(np.ceil(frame_rate * 60 / MIN_BPM))) + 1)
+    if len(lags) < 3 or correlation[0] <= 0:
+        return None, 0.0
+    prior = np.exp(-0.5 * np.log2(60 * frame_rate / lags / 120) ** 2)
+    best = int(np.argmax(correlation[lags] * prior))
+    lag = float(lags[best])
+    if 0 < best < len(lags) - 1:
+        # Parabolic interpolation between the neighbouring lags.
+        left, center, right = correlation[lags[best - 1:best + 2]]
+        curvature = left - 2 * center + right
+        if curvature < 0:
+            lag += 0.5 * (left - right) / curvature
+    confidence = float(np.clip(correlation[lags[best]] / correlation[0], 0, 1))
+    return round(60 * frame_rate / lag, 1), round(confidence, 3)
+
+
+def estimate_key(chroma: np.ndarray) -> tuple[str | None, float]:
+    """
+    Finds the major or minor key whose profile best correlates with a chroma vector.
+
+    Returns:
+        tuple[str | None, float]: The key, e.g. "A minor" (None for silence), and the correlation.
+    """
+    chroma = np.asarray(chroma, dtype=np.float64)
+    if chroma.std() == 0:
+        return None, 0.0
+    profiles = np.array([np.roll(profile, tonic) for profile in (MAJOR_PROFILE, MINOR_PROFILE) for tonic in range(12)])
+    profiles = (profiles - profiles.mean(axis=1, keepdims=True)) / profiles.std(axis=1, keepdims=True)
+    scores = profiles @ ((chroma - chroma.mean()) / chroma.std()) / 12
+    best = int(np.argmax(scores))
+    return f"{NOTE_NAMES[best % 12]} {'major' if best < 12 else 'minor'}", round(float(scores[best]), 3)
+
+
+def _decibels(value: float) -> float:
+    return round(float(20 * np.log10(max(value, 1e-10))), 1)
+
+
+def analyze_samples(samples: np.ndarray, sample_rate: int) -> dict:
+    """
+    Measures a mono signal's tempo, key, loudness and spectral balance.
+
+    Args:
+        samples (np.ndarray): Mono samples in the range -1..1.
+        sample_rate (int): Their sample rate.
+
+    Returns:
+        dict: The features. Loudness is RMS and peak level in dBFS, the band
+              balance is the fraction of spectral energy in each band, and the
+              chroma is the energy per pitch class (C first), scaled to a maximum of 1.
+    """
+    samples = np.asarray(samples, dtype=np.float32)
+    duration = len(samples) / sample_rate
+    scale = max(1, round(sample_rate / DECODE_RATE))
+    frame_size, hop_size = FRAME_SIZE * scale, HOP_SIZE * scale
+    if len(samples) < frame_size:
+        samples = np.pad(samples, (0, frame_size - len(samples)))
+
+    window = np.hanning(frame_size).astype(np.float32)
+    frequencies = np.fft.rfftfreq(frame_size, 1 / sample_rate)
+    # A strided view: no frame is copied until its chunk is transformed.
+    frames = sliding_window_view(samples, frame_size)[::hop_size]
+
+    magnitude_sum = np.zeros(len(frequencies))
+    power_sum = np.zeros(len(frequencies))
+    frame_rms = []
+    onsets = []
+    previous = None
+    for start in range(0, len(frames), CHUNK_FRAMES):
+        chunk = frames[start:start + CHUNK_FRAMES]
+        frame_rms.append(np.sqrt(np.mean(np.square(chunk), axis=1)))
+        magnitude = np.abs(np.fft.rfft(chunk * window, axis=1))
+        magnitude_sum += magnitude.sum(axis=0)
+        power_sum += np.square(magnitude).sum(axis=0)
+        # Spectral flux on log-compressed magnitudes, continued across chunks.
+        compressed = np.log1p(100 * magnitude)
+        stacked = compressed if previous is None else np.vstack((previous, compressed))
+        flux = np.maximum(np.diff(stacked, axis=0), 0).sum(axis=1)
+        onsets.append(flux if previous is not None else np.concatenate(([0.0], flux)))
+        previous = compressed[-1:]
+
+    frame_rms = np.concatenate(frame_rms)
+    tempo, tempo_confidence = _estimate_tempo(np.concatenate(onsets), sample_rate / hop_size)
+
+    chroma = _chroma_matrix(frequencies) @ magnitude_sum
+    key, key_confidence = estimate_key(chroma)
+    if chroma.max() > 0:
+        chroma = chroma / chroma.max()
+
+    total_power = power_sum.sum()
+    bands = {
+        "low": power_sum[frequencies < LOW_MID_HZ].sum(),
+        "mid": power_sum[(frequencies >= LOW_MID_HZ) & (frequencies < MID_HIGH_HZ)].sum(),
+        "high": power_sum[frequencies >= MID_HIGH_HZ].sum(),
+    }
+    audible = frame_rms[frame_rms > 1e-4]
+    return {
+        "duration_seconds": round(duration, 3),
+        "sample_rate": sample_rate,
+        "tempo_bpm": tempo,
+        "tempo_confidence": tempo_confidence,
+        "key": key,
+        "key_confidence": key_confidence,
+        "chroma": [round(float(value), 3) for value in chroma],
+        "loudness_dbfs": _decibels(np.sqrt(np.mean(np.square(samples)))),
+        "peak_dbfs": _decibels(np.abs(samples).max()),
+        "dynamic_range_db": round(float(np.subtract(*np.percentile(20 * np.log10(audible), [95, 10])))
+                                  if len(audible) else 0.0, 1),
+        "spectral_centroid_hz": round(float(power_sum @ frequencies / total_power), 1) if total_power else 0.0,
+        "band_balance": {band: round(float(energy / total_power), 3) if total_power else 0.0
+                         for band, energy in bands.items()},
+    }
+
+
+class AudioAnalyzer:
+    """
+    Analyzes track files and caches the results by content hash, so a loop is
+    decoded and measured once however many times it is asked about, and a
+    copy of a file (or a cached generation) reuses the first analysis. File
+    hashes are remembered by path, size and modification time, so asking
+    again does not even re-read the file.
+    """
+    def __init__(self, max_entries: int = 256):
+        """
+        Args:
+            max_entries (int): The number of analyses kept in memory. 0 disables the cache.
+        """
+        self.max_entries = max_entries
+        self._results = OrderedDict()
+        self._hashes = OrderedDict()
+        self._lock = threading.Lock()
+        # One lock per content hash, so concurrent requests for the same new
+        # file wait for a single analysis instead of each running their own.
+        self._file_locks = {}
+        self.analyzed = 0
+        self.hits = 0
+
+    def content_hash(self, path: str) -> str:
+        """Returns the hex SHA-256 digest of a file's contents."""
+        stat = os.stat(path)
+        signature = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            digest = self._hashes.get(signature)
+        if digest is not None:
+            return digest
+        hasher = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                hasher.update(block)
+        digest = hasher.hexdigest()
+        with self._lock:
+            self._hashes[signature] = digest
+            while len(self._hashes) > max(4 * self.max_entries, 64):
+                self._hashes.popitem(last=False)
+        return digest
+
+    def analyze(self, path: str) -> dict | None:
+        """
+        Returns the features of an audio file (see analyze_samples).
+
+        Args:
+            path (str): The audio file.
+
+        Returns:
+            dict | None: The features, or None if the file is missing or cannot be decoded.
+                         The dict is shared with the cache and must not be mutated.
+        """
+        try:
+            digest = self.content_hash(path)
+        except OSError as e:
+            print(f"Cannot analyze {path}: {e}")
+            return None
+        with self._lock:
+            file_lock = self._file_locks.setdefault(digest, threading.Lock())
+        with file_lock:
+            with self._lock:
+                features = self._results.get(digest)
+                if features is not None:
+                    self._results.move_to_end(digest)
+                    self.hits += 1
+                    return features
+            try:
+                with timed("analysis.decode"):
+                    samples, sample_rate = decode_audio(path)
+                with timed("analysis.features"):
+                    features = analyze_samples(samples, sample_rate)
+            except (AudioDecodeError, OSError, ValueError) as e:
+                print(f"Cannot analyze {path}: {e}")
+                features = None
+            with self._lock:
+                if features is not None:
+                    self.analyzed += 1
+                    if self.max_entries:
+                        self._results[digest] = features
+                        while len(self._results) > self.max_entries:
+                            self._results.popitem(last=False)
+                self._file_locks.pop(digest, None)
+        return features
+
+    def stats(self) -> dict:
+        """Returns the number of files analyzed and cache hits."""
+        with self._lock:
+            return {"analyzed": self.analyzed, "hits": self.hits, "cached": len(self._results)}
@@ -0,0 +1,161 @@
+# _implementation/python/audio_cache.py
+# This file defines the AudioCache, an on-disk, content-addressed cache for
+# generated audio. Entries are keyed by a hash of the model version and the
+# full model input (prompt included), so asking for the same music twice
+# becomes a local link or copy instead of a paid, multi-second Replicate call.
+
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+
+class AudioCache:
+    """
+    Stores generated audio files under a managed directory, with a SQLite index
+    of their sizes and last use. The total size is bounded: the least recently
+    used files are evicted first. Files are written to a temporary name and
+    renamed into place, so a crash never leaves a truncated entry behind.
+    """
+    def __init__(self, directory: str, max_bytes: int = 512 * 1024 * 1024):
+        """
+        Args:
+            directory (str): The directory that holds the cached files and index.
+            max_bytes (int): The maximum total size of the cached files.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(directory, "index.db"), check_same_thread=False)
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS audio_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    filename TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used_at REAL NOT NULL
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_audio_cache_last_used ON audio_cache(last_used_at)")
+
+    @staticmethod
+    def key_for(model: str, model_input: dict) -> str:
+        """
+        Computes the cache key for a generation request.
+
+        Args:
+            model (str): The model identifier, including its version hash.
+            model_input (dict): The complete input sent to the model.
+
+        Returns:
+            str: A hex SHA-256 digest of the model and its canonicalized input.
+        """
+        canonical = json.dumps({"model": model, "input": model_input}, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def fetch(self, cache_key: str, output_path: str) -> bool:
+        """
+        Places a cached file at `output_path`, as a hard link when possible and
+        a copy otherwise.
+
+        Returns:
+            bool: True on a cache hit, False if the key is not cached.
+        """
+        with self._lock:
+            row = self.conn.execute("SELECT filename FROM audio_cache WHERE cache_key = ?", (cache_key,)).fetchone()
+            if not row:
+                return False
+            cached_path = os.path.join(self.directory, row[0])
+            if not os.path.exists(cached_path):
+                # The file was removed behind our back; forget the entry.
+                with self.conn:
+                    self.conn.execute("DELETE FROM audio_cache WHERE cache_key = ?", (cache_key,))
+                return False
+            with self.conn:
+                self.conn.execute("UPDATE audio_cache SET last_used_at = ? WHERE cache_key = ?", (time.time(), cache_key))
+
+        output_directory = os.path.dirname(os.path.abspath(output_path))
+        fd, temp_path = tempfile.mkstemp(dir=output_directory, prefix=".audio-")
+        os.close(fd)
+        try:
+            try:
+                os.remove(temp_path)
+                os.link(cached_path, temp_path)
+            except OSError:
+                shutil.copyfile(cached_path, temp_path)
+            os.replace(temp_path, output_path)
+        except OSError as e:
+            print(f"Could not restore cached audio for {cache_key}: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return False
+        return True
+
+    def store(self, cache_key: str, source_path: str) -> bool:
+        """
+        Copies a freshly generated file into the cache, then evicts the least
+        recently used entries until the cache fits in `max_bytes`.
+
+        Returns:
+            bool: True if the file was cached.
+        """
+        extension = os.path.splitext(source_path)[1]
+        filename = f"{cache_key}{extension}"
+        size = os.path.getsize(source_path)
+        if size > self.max_bytes:
+            return False
+
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix=".incoming-")
+        os.close(fd)
+        try:
+            shutil.copyfile(source_path, temp_path)
+            os.replace(temp_path, os.path.join(self.directory, filename))
+        except OSError as e:
+            print(f"Could not cache generated audio {source_path}: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return False
+
+        now = time.time()
+        with self._lock:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO audio_cache (cache_key, filename, size, created_at, last_used_at) VALUES (?, ?, ?, ?, ?)",
+                    (cache_key, filename, size, now, now)
+                )
+            self._evict()
+        return True
+
+    def _evict(self):
+        """Removes least recently used entries beyond `max_bytes`. Must hold the lock."""
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM audio_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self.conn.execute("SELECT cache_key, filename, size FROM audio_cache ORDER BY last_used_at").fetchall()
+        with self.conn:
+            for cache_key, filename, size in rows:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.directory, filename))
+                except FileNotFoundError:
+                    pass
+                self.conn.execute("DELETE FROM audio_cache WHERE cache_key = ?", (cache_key,))
+                total -= size
+                print(f"Evicted cached audio {filename} ({size} bytes)")
+
+    def stats(self) -> dict:
+        """Returns the number of cached files and their total size."""
+        with self._lock:
+            count, total = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM audio_cache").fetchone()
+        return {"entries": count, "bytes": total, "max_bytes": self.max_bytes}
+
+    def close(self):
+        """Closes the index database."""
+        self.conn.close()
@@ -0,0 +1,168 @@
+# _implementation/python/benchmarks/bench_admission.py
+# Exercises request coalescing and admission control (see admission.py).
+#
+# - Duplicates: every utterance is sent twice, `--gap` seconds apart, from
+#   the same history node, as speech recognition sometimes does. With
+#   coalescing off each copy calls the LLM, generation commands queue two
+#   Replicate jobs, and the history forks; with it on, the copies share one
+#   execution and get the same response.
+# - Noisy client: one client fires a burst of LLM-routed commands while a
+#   second client sends a few of its own and record/stop keep arriving. The
+#   stand-in LLM serves a limited number of calls at once, like a rate-limited
+#   provider. Without admission limits the burst fills the provider and the
+#   second client waits behind it; with them, the burst is queued and shed
+#   instead. record/stop are not limited either way.
+#
+# Usage (from the python/ directory):
+#   python benchmarks/bench_admission.py --utterances 10 --gap 0.1 --burst 20 --llm-seconds 0.2
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import statistics
+import tempfile
+import time
+
+from stubs import ScriptedChatModel, install_replicate_stub, load_app, PYTHON_DIR
+
+from admission import RequestCoalescer, AdmissionController, Overloaded
+from generation_jobs import SUCCEEDED, FAILED
+
+UNLIMITED = 10 ** 6
+
+
+class LimitedChatModel(ScriptedChatModel):
+    """A scripted chat model that serves at most `capacity` calls at once."""
+    def __init__(self, capacity: int, **kwargs):
+        super().__init__(**kwargs)
+        self.capacity = capacity
+        self._semaphores = {}  # One per event loop; each scenario runs in its own.
+
+    async def ainvoke(self, command, *args, **kwargs):
+        semaphore = self._semaphores.setdefault(asyncio.get_running_loop(), asyncio.Semaphore(self.capacity))
+        async with semaphore:
+            return await super().ainvoke(command, *args, **kwargs)
+
+
+def chat_model(args) -> LimitedChatModel:
+    # Utterances mentioning "loop" tweak a track; anything else asks for music.
+    def route(command):
+        if "loop" in command:
+            return {"name": "modify_track_reverb", "args": {"track_id": "track_0", "reverb": 40.0}}
+        return {"name": "generate_new_music", "args": {"prompt": command}}
+    return LimitedChatModel(args.llm_capacity, default=route, latency=args.llm_seconds)
+
+
+async def wait_for_jobs(main, job_ids: set):
+    while any(main.generation_jobs.get(job_id)["status"] not in (SUCCEEDED, FAILED) for job_id in job_ids):
+        await asyncio.sleep(0.01)
+
+
+async def duplicates(main, args, coalesce: bool, counters: dict) -> dict:
+    """Sends each utterance twice and counts LLM calls, generations, commits and diverging replies."""
+    main.request_coalescer = RequestCoalescer(window=1.0, enabled=coalesce)
+    main.admission = AdmissionController(UNLIMITED, UNLIMITED, UNLIMITED)  # Measured separately below.
+    head = (await main.execute_command(main.CommandRequest(text="stop_recording")))["history_node_id"]
+    llm_calls, generations = main.llm_with_tools.calls, counters["generations"]
+    nodes_before = main.history.conn.execute("SELECT COUNT(*) FROM state_tree").fetchone()[0]
+
+    async def pair(text: str):
+        first = asyncio.ensure_future(main.execute_command(main.CommandRequest(text=text, history_node_id=head)))
+        await asyncio.sleep(args.gap)
+        second = await main.execute_command(main.CommandRequest(text=text, history_node_id=head))
+        return await first, second
+
+    # Texts differ between runs, so the route cache does not answer for the LLM.
+    run = "b" if coalesce else "a"
+    texts = [f"soak the first loop, take {run}{i}" if i % 2 else f"a dusty drum groove number {run}{i}"
+             for i in range(args.utterances)]
+    pairs = await asyncio.gather(*[pair(text) for text in texts])
+    job_ids = {response["job_id"] for pair_ in pairs for response in pair_ if "job_id" in response}
+    await wait_for_jobs(main, job_ids)
+    return {
+        "llm_calls": main.llm_with_tools.calls - llm_calls,
+        "jobs": len(job_ids),
+        "generations": counters["generations"] - generations,
+        "commits": main.history.conn.execute("SELECT COUNT(*) FROM state_tree").fetchone()[0] - nodes_before,
+        "diverging": sum(1 for first, second in pairs
+                         if (first.get("history_node_id"), first.get("job_id")) != (second.get("history_node_id"), second.get("job_id"))),
+    }
+
+
+async def noisy_client(main, args, limited: bool) -> dict:
+    """Returns the quiet client's and record/stop latencies while another client bursts."""
+    run = "limited" if limited else "unlimited"  # Keeps the route cache out of it, as above.
+    main.request_coalescer = RequestCoalescer(enabled=False)
+    main.admission = AdmissionController() if limited else AdmissionController(UNLIMITED, UNLIMITED, UNLIMITED)
+    shed = 0
+
+    async def noisy(i: int):
+        nonlocal shed
+        try:
+            await main.execute_command(main.CommandRequest(text=f"drench loop {i} in reverb, {run}", client_id="noisy"))
+        except Overloaded:
+            shed += 1
+
+    async def quiet() -> list[float]:
+        latencies = []
+        for i in range(args.quiet_commands):
+            start = time.perf_counter()
+            await main.execute_command(main.CommandRequest(text=f"warm up the first loop {i}, {run}", client_id="quiet"))
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    async def fast_path() -> list[float]:
+        latencies = []
+        for i in range(args.quiet_commands * 2):
+            start = time.perf_counter()
+            await main.execute_command(main.CommandRequest(text="record" if i % 2 == 0 else "stop_recording", client_id="noisy"))
+            latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(args.llm_seconds / 2)
+        return latencies
+
+    burst = [asyncio.ensure_future(noisy(i)) for i in range(args.burst)]
+    await asyncio.sleep(0.01)
+    quiet_latencies, fast_latencies = await asyncio.gather(quiet(), fast_path())
+    await asyncio.gather(*burst)
+    return {"quiet": quiet_latencies, "fast": fast_latencies, "shed": shed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark request coalescing and admission control.")
+    parser.add_argument("--utterances", type=int, default=10, help="Utterances sent twice each.")
+    parser.add_argument("--gap", type=float, default=0.1, help="Seconds between the two copies.")
+    parser.add_argument("--burst", type=int, default=20, help="Commands the noisy client sends at once.")
+    parser.add_argument("--quiet-commands", type=int, default=5, help="Commands the quiet client sends, one at a time.")
+    parser.add_argument("--llm-seconds", type=float, default=0.2, help="Simulated LLM latency.")
+    parser.add_argument("--llm-capacity", type=int, default=4, help="LLM calls served at once.")
+    parser.add_argument("--generation-seconds", type=float, default=0.3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = load_app(directory, chat_model(args))
+        counters = install_replicate_stub(generation_seconds=args.generation_seconds)
+        app.load_agent()
+        with contextlib.redirect_stdout(io.StringIO()):
+            dup_rows = [(coalesce, asyncio.run(duplicates(app, args, coalesce, counters))) for coalesce in (False, True)]
+            noisy_rows = [(limited, asyncio.run(noisy_client(app, args, limited))) for limited in (False, True)]
+        app.generation_jobs.shutdown()
+        app.history.close()
+        os.chdir(PYTHON_DIR)
+
+    print(f"{args.utterances} utterances, each sent twice {args.gap:.2f}s apart")
+    print(f"{'coalescing':<11} {'LLM calls':>10} {'jobs':>5} {'generations':>12} {'commits':>8} {'diverging replies':>18}")
+    for coalesce, row in dup_rows:
+        print(f"{'on' if coalesce else 'off':<11} {row['llm_calls']:>10} {row['jobs']:>5} {row['generations']:>12} "
+              f"{row['commits']:>8} {row['diverging']:>18}")
+
+    print(f"\nNoisy client bursts {args.burst} LLM commands; the LLM serves {args.llm_capacity} at a time, {args.llm_seconds:.2f}s each")
+    print(f"{'admission':<11} {'quiet p50 ms':>13} {'quiet max ms':>13} {'record/stop max ms':>19} {'burst shed':>11}")
+    for limited, row in noisy_rows:
+        print(f"{'limited' if limited else 'unlimited':<11} {statistics.median(row['quiet']) * 1000:>13.0f} "
+              f"{max(row['quiet']) * 1000:>13.0f} {max(row['fast']) * 1000:>19.1f} {row['shed']:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+# _implementation/python/benchmarks/bench_analysis.py
+# Measures audio analysis time per minute of audio. Synthetic loops (kick,
+# hi-hats, a chord and a melody at a known tempo and key) are written as WAV
+# files, then analyzed three ways: with a frame-by-frame loop over the same
+# STFT (the baseline the chunked engine replaces), with the vectorized engine
+# on a cold cache, and again through the AudioAnalyzer's content-hash cache,
+# which is what repeated suggestion requests hit.
+#
+# Usage (from the python/ directory):
+#   python benchmarks/bench_analysis.py --minutes 0.25 1 4 --rate 44100
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import wave
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from audio_analysis import AudioAnalyzer, FRAME_SIZE, HOP_SIZE, DECODE_RATE, NOTE_NAMES, decode_audio, analyze_samples
+
+MINOR_SCALE = (0, 2, 3, 5, 7, 8, 10)
+MAJOR_SCALE = (0, 2, 4, 5, 7, 9, 11)
+MELODY = (0, 2, 4, 2, 0, 4, 6, 4, 5, 3, 1, 0)
+
+
+def synthesize(seconds: float, bpm: float, tonic: int, minor: bool, rate: int, seed: int = 0) -> np.ndarray:
+    """Returns a loop with a kick on every beat, hi-hats on the off-beats, a sustained triad and a melody."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * rate)) / rate
+    out = np.zeros_like(t)
+    beat = 60 / bpm
+    scale = MINOR_SCALE if minor else MAJOR_SCALE
+
+    def note(degree: int, octave: float = 0) -> float:
+        return 440 * 2 ** ((tonic + scale[degree % 7] - 9) / 12 + octave)
+
+    for number, start in enumerate(np.arange(0, seconds, beat)):
+        i = int(start * rate)
+        kick = np.arange(min(int(0.25 * rate), len(t) - i)) / rate
+        out[i:i + len(kick)] += 0.8 * np.sin(2 * np.pi * 55 * kick) * np.exp(-kick * 18)
+        tone = np.arange(min(int(beat * rate), len(t) - i)) / rate
+        out[i:i + len(tone)] += 0.2 * np.sin(2 * np.pi * note(MELODY[number % len(MELODY)]) * tone) * np.exp(-tone * 3)
+        j = int((start + beat / 2) * rate)
+        if j < len(t):
+            hat = min(int(0.05 * rate), len(t) - j)
+            out[j:j + hat] += 0.1 * rng.standard_normal(hat) * np.exp(-np.arange(hat) / rate * 80)
+    for degree in (0, 2, 4):
+        out += 0.08 * np.sin(2 * np.pi * note(degree, octave=-1) * t)
+    return (out / np.abs(out).max() * 0.8).astype(np.float32)
+
+
+def write_wav(path: str, samples: np.ndarray, rate: int):
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes((samples * 32767).astype("<i2").tobytes())
+
+
+def frame_loop_baseline(samples: np.ndarray, rate: int):
+    """The same spectral pass, one frame and one FFT at a time."""
+    scale = max(1, round(rate / DECODE_RATE))
+    frame_size, hop_size = FRAME_SIZE * scale, HOP_SIZE * scale
+    window = np.hanning(frame_size)
+    magnitude_sum = np.zeros(frame_size // 2 + 1)
+    previous = None
+    onsets = []
+    for start in range(0, len(samples) - frame_size + 1, hop_size):
+        frame = samples[start:start + frame_size]
+        magnitude = np.abs(np.fft.rfft(frame * window))
+        magnitude_sum += magnitude
+        compressed = np.log1p(100 * magnitude)
+        onsets.append(0.0 if previous is None else float(np.maximum(compressed - previous, 0).sum()))
+        previous = compressed
+    return magnitude_sum, onsets
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark audio analysis time per minute of audio.")
+    parser.add_argument("--minutes", type=float, nargs="+", default=[0.25, 1, 4])
+    parser.add_argument("--rate", type=int, default=44100)
+    parser.add_argument("--repeats", type=int, default=20, help="Cached lookups timed per file.")
+    args = parser.parse_args()
+
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        for index, minutes in enumerate(args.minutes):
+            bpm, tonic, minor = (96, 120, 140, 75)[index % 4], (9, 0, 7, 2)[index % 4], index % 2 == 0
+            path = os.path.join(directory, f"loop_{index}.wav")
+            write_wav(path, synthesize(minutes * 60, bpm, tonic, minor, args.rate), args.rate)
+
+            start = time.perf_counter()
+            samples, rate = decode_audio(path)
+            decode = time.perf_counter() - start
+
+            start = time.perf_counter()
+            frame_loop_baseline(samples, rate)
+            baseline = time.perf_counter() - start
+
+            start = time.perf_counter()
+            features = analyze_samples(samples, rate)
+            vectorized = time.perf_counter() - start
+
+            analyzer = AudioAnalyzer()
+            start = time.perf_counter()
+            analyzer.analyze(path)
+            cold = time.perf_counter() - start
+            start = time.perf_counter()
+            for _ in range(args.repeats):
+                analyzer.analyze(path)
+            cached = (time.perf_counter() - start) / args.repeats
+
+            expected = f"{NOTE_NAMES[tonic]} {'minor' if minor else 'major'}"
+            rows.append((minutes, decode / minutes, baseline / minutes, vectorized / minutes, cold / minutes,
+                         cached * 1e6, f"{bpm}/{features['tempo_bpm']}", f"{expected}/{features['key']}"))
+
+    print(f"{args.rate} Hz mono WAV; times are ms per minute of audio, except the cached lookup")
+    print(f"{'minutes':>7} {'decode':>8} {'frame loop':>11} {'vectorized':>11} {'cold total':>11} "
+          f"{'cached µs':>10}  {'tempo (true/found)':<20} key (true/found)")
+    for minutes, decode, baseline, vectorized, cold, cached, tempo, key in rows:
+        print(f"{minutes:>7.2f} {decode * 1e3:>8.1f} {baseline * 1e3:>11.1f} {vectorized * 1e3:>11.1f} "
+              f"{cold * 1e3:>11.1f} {cached:>10.1f}  {tempo:<20} {key}")
+
+
+if __name__ == "__main__":
+    main()
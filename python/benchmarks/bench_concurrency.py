@@ -0,0 +1,103 @@
+# _implementation/python/benchmarks/bench_concurrency.py
+# Checks that the record/stop fast path stays responsive while slow music
+# generations are in flight. The LLM and Replicate are replaced with local
+# stand-ins (the generation stand-in just sleeps), so this runs offline.
+# Requires httpx for the in-process ASGI client.
+#
+# Usage (from the python/ directory):
+#   python benchmarks/bench_concurrency.py --generations 4 --generation-seconds 3
+
+import argparse
+import asyncio
+import math
+import os
+import statistics
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class ScriptedLLM:
+    """Stands in for the tool-bound chat model: every command asks for new music."""
+    async def ainvoke(self, command):
+        await asyncio.sleep(0.05)
+        return SimpleNamespace(tool_calls=[{"name": "generate_new_music", "args": {"prompt": command}}])
+
+
+def fake_generate_and_download_music(seconds: float):
+    def generate(prompt: str, output_path: str, cache=None) -> bool:
+        time.sleep(seconds)
+        with open(output_path, "wb") as f:
+            f.write(b"\0" * 1024)
+        return True
+    return generate
+
+
+async def measure_fast_path(client, samples: int) -> list[float]:
+    latencies = []
+    for i in range(samples):
+        text = "record" if i % 2 == 0 else "stop_recording"
+        start = time.perf_counter()
+        response = await client.post("/command", json={"text": text})
+        response.raise_for_status()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def summarize(label: str, latencies: list[float]):
+    ordered = sorted(latencies)
+    p95 = ordered[max(math.ceil(len(ordered) * 0.95) - 1, 0)]
+    print(f"{label:<28} p50 {statistics.median(ordered):7.2f} ms   p95 {p95:7.2f} ms   max {ordered[-1]:7.2f} ms")
+
+
+async def run(args):
+    import httpx
+    import main
+    import nodes.music_generation_node as music_generation_module
+
+    main.llm_with_tools = ScriptedLLM()
+    music_generation_module.generate_and_download_music = fake_generate_and_download_music(args.generation_seconds)
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        summarize("record/stop, idle", await measure_fast_path(client, args.samples))
+
+        start = time.perf_counter()
+        responses = await asyncio.gather(*[
+            client.post("/command", json={"text": f"a funky bassline {i}"}) for i in range(args.generations)
+        ])
+        print(f"{args.generations} generation commands acknowledged in {(time.perf_counter() - start) * 1000:.1f} ms")
+        job_ids = [response.json()["job_id"] for response in responses]
+
+        await asyncio.sleep(0.2)
+        summarize(f"record/stop, {args.generations} generating", await measure_fast_path(client, args.samples))
+
+        while True:
+            statuses = [(await client.get(f"/jobs/{job_id}")).json()["status"] for job_id in job_ids]
+            if all(status in ("succeeded", "failed") for status in statuses):
+                break
+            await asyncio.sleep(0.05)
+        print(f"{args.generations} generations of {args.generation_seconds:.1f}s finished in {time.perf_counter() - start:.2f}s")
+        print(f"queue stats: {(await client.get('/jobs/stats')).json()}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure record/stop latency while generations are in flight.")
+    parser.add_argument("--generations", type=int, default=4)
+    parser.add_argument("--generation-seconds", type=float, default=3.0)
+    parser.add_argument("--samples", type=int, default=40)
+    args = parser.parse_args()
+
+    os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+    # record/stop are repeated on purpose; each must really run.
+    os.environ.setdefault("JAM_COALESCE", "0")
+    with tempfile.TemporaryDirectory() as directory:
+        # main.py opens project.db and writes generated tracks in the working directory.
+        os.chdir(directory)
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
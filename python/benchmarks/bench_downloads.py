@@ -0,0 +1,160 @@
+# _implementation/python/benchmarks/bench_downloads.py
+# Exercises the Downloader against a local HTTP stand-in for Replicate's
+# delivery server, which supports Range requests and keep-alive and can be
+# told to drop connections part-way through a file. Two things are measured:
+#
+# - Throughput: the same files fetched the old way (a new requests.get per
+#   file, 8 KB writes straight to the destination) and with the Downloader
+#   (one pooled session, large buffered writes, atomic rename).
+# - Resilience: every first request is cut off half-way. The old way leaves
+#   truncated files behind; the Downloader resumes with a Range request and
+#   the SHA-256 of each file is checked against the original.
+#
+# Usage (from the python/ directory):
+#   python benchmarks/bench_downloads.py --files 40 --size-kb 512 --threads 4
+
+import argparse
+import contextlib
+import hashlib
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from downloads import Downloader, DownloadError
+
+
+class StandInServer:
+    """
+    Serves `payload` at any path over HTTP/1.1. When `drop_first` is set, the
+    first request for each path sends only half the body and closes the connection.
+    """
+    def __init__(self, payload: bytes, drop_first: bool = False):
+        self.payload = payload
+        self.drop_first = drop_first
+        self.requests = 0
+        self.connections = set()
+        self.range_requests = 0
+        self._seen = set()
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with server._lock:
+                    server.requests += 1
+                    server.connections.add(self.client_address)
+                    drop = server.drop_first and self.path not in server._seen
+                    server._seen.add(self.path)
+                body, start = server.payload, 0
+                range_header = self.headers.get("Range")
+                if range_header:
+                    with server._lock:
+                        server.range_requests += 1
+                    start = int(range_header.removeprefix("bytes=").split("-")[0])
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+                else:
+                    self.send_response(200)
+                self.send_header("Content-Type", "audio/mpeg")
+                self.send_header("Content-Length", str(len(body) - start))
+                self.end_headers()
+                if drop:
+                    self.wfile.write(body[start:start + (len(body) - start) // 2])
+                    self.wfile.flush()
+                    self.close_connection = True
+                    return
+                self.wfile.write(body[start:])
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def download_baseline(url: str, output_path: str) -> dict:
+    """The download as generate_and_download_music used to do it."""
+    response = requests.get(url, stream=True)
+    response.raise_for_status()
+    with open(output_path, "wb") as f:
+        for chunk in response.iter_content(chunk_size=8192):
+            f.write(chunk)
+    return {"bytes": os.path.getsize(output_path)}
+
+
+def run(label: str, fetch, server: StandInServer, directory: str, args, expected_sha256: str) -> tuple:
+    """Downloads `args.files` files with `fetch` and returns a report row."""
+    errors = []
+
+    def one(index: int):
+        try:
+            fetch(f"{server.url}/{label}/{index}.mp3", os.path.join(directory, f"{label}_{index}.mp3"))
+        except (DownloadError, requests.RequestException) as e:
+            errors.append(e)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        list(pool.map(one, range(args.files)))
+    elapsed = time.perf_counter() - start
+
+    # What the audio engine would find at each destination path.
+    intact = truncated = 0
+    for index in range(args.files):
+        path = os.path.join(directory, f"{label}_{index}.mp3")
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                if hashlib.sha256(f.read()).hexdigest() == expected_sha256:
+                    intact += 1
+                else:
+                    truncated += 1
+            os.remove(path)
+    leftovers = sum(1 for name in os.listdir(directory) if name.startswith(".download-"))
+    megabytes = args.files * args.size_kb / 1024
+    return (label, megabytes / elapsed, elapsed / args.files * 1000, intact, truncated, len(errors),
+            len(server.connections), leftovers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark generated-audio downloads against a local server.")
+    parser.add_argument("--files", type=int, default=40)
+    parser.add_argument("--size-kb", type=int, default=512)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    payload = os.urandom(args.size_kb * 1024)
+    expected = hashlib.sha256(payload).hexdigest()
+    rows = []
+    with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+        for drop_first in (False, True):
+            suffix = " (drops)" if drop_first else ""
+            for label, make_fetch in (("baseline", lambda: download_baseline),
+                                      ("downloader", lambda: Downloader(backoff=0.01).download)):
+                server = StandInServer(payload, drop_first=drop_first)
+                rows.append((label + suffix, *run(label, make_fetch(), server, directory, args, expected)[1:]))
+                server.close()
+
+    print(f"{args.files} files of {args.size_kb} KB, {args.threads} threads")
+    print(f"{'run':<20} {'MB/s':>8} {'ms/file':>8} {'intact':>7} {'truncated':>10} {'errors':>7} {'connections':>12} {'temp left':>10}")
+    for label, throughput, per_file, intact, truncated, failed, connections, leftovers in rows:
+        print(f"{label:<20} {throughput:>8.1f} {per_file:>8.2f} {intact:>7} {truncated:>10} {failed:>7} "
+              f"{connections:>12} {leftovers:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# _implementation/python/benchmarks/bench_fanout.py
+# Measures multi-track generation: one utterance asks for several tracks
+# ("a drum loop, a bassline and a pad"), and the time until all of them are
+# committed is compared with a fan-out limit of 1 (one generation at a time)
+# and with the full limit. Each prompt gets its own simulated Replicate time,
+# so with fan-out the total should be close to the slowest one. A last run
+# makes one generation fail and one overrun the deadline, to show the
+# per-track report.
+#
+# Usage (from the python/ directory):
+#   python benchmarks/bench_fanout.py --tracks 3 --generation-seconds 1.0 --fanout 4
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+from stubs import ScriptedChatModel, install_replicate_stub, load_app, PYTHON_DIR
+
+from generation_jobs import GenerationJobQueue, SUCCEEDED, FAILED
+
+PARTS = ["a drum loop", "a bassline", "a pad", "a lead melody", "some shakers", "a string section", "a vocal chop", "an arpeggio"]
+
+
+def install_variable_generation(base_seconds: float, fail: set, slow: dict):
+    """
+    Replaces the stubbed replicate.run with one whose time depends on the
+    prompt: the n-th part takes (1 + n/4) times `base_seconds`, prompts in
+    `fail` raise, and prompts in `slow` take the given time instead.
+    """
+    import replicate
+
+    def run(model, input):
+        prompt = input["prompt"]
+        if prompt in fail:
+            raise replicate.exceptions.ReplicateError("simulated failure")
+        time.sleep(slow.get(prompt, base_seconds * (1 + PARTS.index(prompt) / 4)))
+        return f"http://replicate.invalid/{PARTS.index(prompt)}.mp3"
+
+    replicate.run = run
+
+
+async def run_once(main, parts: list[str], fanout: int, deadline: float) -> tuple[float, dict]:
+    """Sends one multi-track command and returns the time until its job finished, and the job."""
+    jobs = GenerationJobQueue(main.history, audio_cache=None, fanout_limit=fanout, fanout_deadline=deadline)
+    main.generation_jobs = jobs
+    main.projects.get(None).graph = main.create_graph(main.history, jobs, main.audio_analyzer)
+    start = time.perf_counter()
+    response = await main.execute_command(main.CommandRequest(text="give me " + ", ".join(parts)))
+    while jobs.get(response["job_id"])["status"] not in (SUCCEEDED, FAILED):
+        await asyncio.sleep(0.005)
+    elapsed = time.perf_counter() - start
+    job = jobs.get(response["job_id"])
+    jobs.shutdown()  # Also waits out generations abandoned at the deadline.
+    return elapsed, job
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark concurrent generation of several tracks from one command.")
+    parser.add_argument("--tracks", type=int, default=3, help=f"Tracks per command (at most {len(PARTS)}).")
+    parser.add_argument("--generation-seconds", type=float, default=1.0, help="Simulated Replicate time of the first part.")
+    parser.add_argument("--fanout", type=int, default=4)
+    args = parser.parse_args()
+
+    parts = PARTS[:args.tracks]
+    slowest = args.generation_seconds * (1 + (len(parts) - 1) / 4)
+    total = sum(args.generation_seconds * (1 + index / 4) for index in range(len(parts)))
+    # The router asks for one generation per part, as the LLM does for such a command.
+    model = ScriptedChatModel(default=lambda command: [{"name": "generate_new_music", "args": {"prompt": part}}
+                                                       for part in command[len("give me "):].split(", ")])
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = load_app(directory, model)
+        install_replicate_stub()
+        app.load_agent()
+        results = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            install_variable_generation(args.generation_seconds, fail=set(), slow={})
+            for fanout in (1, args.fanout):
+                results.append((f"fan-out {fanout}", *asyncio.run(run_once(app, parts, fanout, deadline=total * 2))))
+            # One part fails and one overruns the deadline; the rest are still committed together.
+            install_variable_generation(args.generation_seconds, fail={parts[0]}, slow={parts[-1]: slowest * 4})
+            results.append(("partial", *asyncio.run(run_once(app, parts, args.fanout, deadline=slowest * 2))))
+        app.history.close()
+        os.chdir(PYTHON_DIR)
+
+    print(f"{len(parts)} tracks per command; slowest generation {slowest:.2f}s, sum of generations {total:.2f}s")
+    print(f"{'run':<12} {'seconds':>8} {'tracks':>7}  per-track outcome")
+    for label, elapsed, job in results:
+        outcomes = ", ".join(f"{g['prompt']}: {g['track_id'] or g['error']}" for g in job["generations"])
+        added = sum(1 for g in job["generations"] if g["status"] == SUCCEEDED)
+        print(f"{label:<12} {elapsed:>8.2f} {added:>7}  {outcomes}")
+
+
+if __name__ == "__main__":
+    main()
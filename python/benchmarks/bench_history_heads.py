@@ -0,0 +1,120 @@
+# _implementation/python/benchmarks/bench_history_heads.py
+# Measures the branch heads table (history_heads in history_manager.py). For
+# each history size a session with occasional undo-and-retake forks is
+# committed, then the report compares:
+#
+# - resume: finding where a client without a history node should continue.
+#   get_latest_node_id() reads the heads table; without it the options were
+#   the root (the old behaviour, which loses the session) or a scan for the
+#   newest leaf.
+# - takes: listing every branch tip, from the heads table and by scanning
+#   state_tree for leaves.
+# - commit: the time per commit with heads maintained in the commit's
+#   transaction, and with that step skipped, to show its cost. The two are
+#   run alternately for several rounds and the medians compared, as single
+#   runs vary by tens of percent. Updating the head touches one more table
+#   and two indexes per commit (node_id, and updated_at for resuming): about
+#   10-20% per commit on a local disk, more when the database is in memory.
+#
+# Each run also checks that the heads table lists exactly the leaves.
+#
+# Usage (from the python/ directory):
+#   python benchmarks/bench_history_heads.py --nodes 1000 10000 100000 --fork-rate 0.05
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from history_manager import HistoryManager
+
+LEAF_SCAN_SQL = ("SELECT node_id FROM state_tree s WHERE NOT EXISTS "
+                 "(SELECT 1 FROM state_tree c WHERE c.parent_id = s.node_id) ORDER BY s.rowid DESC")
+
+
+def simulate_takes(history: HistoryManager, commits: int, fork_rate: float, seed: int) -> list[str]:
+    """Commits volume tweaks, going back a few steps and retaking now and then. Returns the node IDs."""
+    rng = random.Random(seed)
+    state = {"tracks": [{"id": "track_0", "name": "Loop 0", "volume": 1.0, "is_playing": True}], "next_track_id": 1}
+    node_ids = [history.commit(state, parent_id=None)]
+    parent_id = node_ids[0]
+    for _ in range(commits):
+        if rng.random() < fork_rate:
+            parent_id = node_ids[max(0, len(node_ids) - rng.randint(2, 10))]
+        state = {"tracks": [{**state["tracks"][0], "volume": round(rng.random(), 2)}], "next_track_id": 1}
+        parent_id = history.commit(state, parent_id)
+        node_ids.append(parent_id)
+    return node_ids
+
+
+def per_call_ms(func, repetitions: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repetitions):
+        func()
+    return (time.perf_counter() - start) / repetitions * 1000
+
+
+def commit_seconds(path: str, commits: int, heads: bool) -> float:
+    history = HistoryManager(path, cache_size=0)
+    if not heads:
+        history._advance_heads = lambda node_id, parent_id, now: None
+    start = time.perf_counter()
+    simulate_takes(history, commits, 0.05, seed=3)
+    elapsed = time.perf_counter() - start
+    history.close()
+    return elapsed / commits
+
+
+def run(nodes: int, args, directory: str) -> tuple:
+    history = HistoryManager(os.path.join(directory, f"takes_{nodes}.db"), cache_size=0)
+    simulate_takes(history, nodes - 1, args.fork_rate, seed=7)
+    conn = history.conn
+
+    leaves = [row[0] for row in conn.execute(LEAF_SCAN_SQL)]
+    heads = [branch["node_id"] for branch in history.list_branches()]
+    consistent = sorted(leaves) == sorted(heads) and history.get_latest_node_id() == leaves[0]
+
+    repetitions = args.repetitions
+    latest_ms = per_call_ms(history.get_latest_node_id, repetitions)
+    root_ms = per_call_ms(history.get_root_node_id, repetitions)
+    scan_ms = per_call_ms(lambda: conn.execute(LEAF_SCAN_SQL + " LIMIT 1").fetchone(), max(repetitions // 100, 3))
+    list_ms = per_call_ms(history.list_branches, max(repetitions // 10, 3))
+    list_scan_ms = per_call_ms(lambda: conn.execute(LEAF_SCAN_SQL).fetchall(), max(repetitions // 100, 3))
+    history.close()
+    return nodes, len(heads), latest_ms, root_ms, scan_ms, list_ms, list_scan_ms, consistent
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the branch heads table.")
+    parser.add_argument("--nodes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--fork-rate", type=float, default=0.05, help="Chance that a commit goes back and starts a new take.")
+    parser.add_argument("--repetitions", type=int, default=1000, help="Lookups timed per measurement.")
+    parser.add_argument("--commits", type=int, default=2000, help="Commits timed per round.")
+    parser.add_argument("--rounds", type=int, default=5, help="Alternating rounds with and without heads.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        rows = [run(nodes, args, directory) for nodes in args.nodes]
+        with_heads, without_heads = [], []
+        for round_ in range(args.rounds):
+            with_heads.append(commit_seconds(os.path.join(directory, f"with_heads_{round_}.db"), args.commits, heads=True))
+            without_heads.append(commit_seconds(os.path.join(directory, f"without_heads_{round_}.db"), args.commits, heads=False))
+        with_heads, without_heads = statistics.median(with_heads), statistics.median(without_heads)
+
+    print(f"Fork rate {args.fork_rate:.2f}; times in ms per call")
+    print(f"{'nodes':>8} {'takes':>6} {'latest head':>12} {'root':>8} {'leaf scan':>10} "
+          f"{'list heads':>11} {'list scan':>10} {'consistent':>11}")
+    for nodes, takes, latest_ms, root_ms, scan_ms, list_ms, list_scan_ms, consistent in rows:
+        print(f"{nodes:>8} {takes:>6} {latest_ms:>12.4f} {root_ms:>8.4f} {scan_ms:>10.2f} "
+              f"{list_ms:>11.3f} {list_scan_ms:>10.2f} {'yes' if consistent else 'NO':>11}")
+    print(f"\nMedian ms per commit over {args.rounds} rounds of {args.commits}: {with_heads * 1000:.3f} with heads, "
+          f"{without_heads * 1000:.3f} without ({(with_heads / without_heads - 1) * 100:+.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# _implementation/python/benchmarks/bench_history_storage.py
+# Compares the HistoryManager's "full" and "delta" storage modes on a
+# simulated jam session: bytes stored per commit and get_state latency,
+# both for random (mostly uncached) nodes and for the hot head node.
+#
+# Usage (from the python/ directory):
+#   python benchmarks/bench_history_storage.py --commits 2000 --max-tracks 24
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from history_manager import HistoryManager
+
+
+def simulate_session(history: HistoryManager, commits: int, max_tracks: int, seed: int) -> list[str]:
+    """
+    Commits a session of loop recordings and track tweaks, mirroring what the
+    graph nodes write, and returns the committed node IDs in order.
+    """
+    rng = random.Random(seed)
+    state = {"tracks": [], "next_track_id": 0}
+    parent_id = history.commit(state, parent_id=None)
+    node_ids = [parent_id]
+
+    for _ in range(commits):
+        state = {**state, "tracks": [t.copy() for t in state["tracks"]]}
+        if not state["tracks"] or (len(state["tracks"]) < max_tracks and rng.random() < 0.1):
+            track_number = state["next_track_id"]
+            track = {"id": f"track_{track_number}", "name": f"Loop {track_number}", "volume": 1.0,
+                     "is_playing": True, "path": None, "reverb": 0.0, "delay": 0.0}
+            state["tracks"].append(track)
+            state["next_track_id"] += 1
+            state["response"] = {"action": "stop_recording_and_create_loop", "track": track}
+        else:
+            track = rng.choice(state["tracks"])
+            if rng.random() < 0.3:
+                track["is_playing"] = not track["is_playing"]
+                state["response"] = {"action": "mute_track", "track_id": track["id"], "volume": track["volume"]}
+            else:
+                track["volume"] = round(rng.random(), 2)
+                state["response"] = {"action": "set_volume", "track_id": track["id"], "volume": track["volume"]}
+        state["command"] = "benchmark command"
+        parent_id = history.commit(state, parent_id)
+        node_ids.append(parent_id)
+    return node_ids
+
+
+def run(storage_mode: str, args) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        database_path = os.path.join(directory, "bench.db")
+        history = HistoryManager(database_path, storage_mode=storage_mode, keyframe_interval=args.keyframe_interval,
+                                 cache_size=args.cache_size)
+
+        start = time.perf_counter()
+        node_ids = simulate_session(history, args.commits, args.max_tracks, args.seed)
+        commit_seconds = time.perf_counter() - start
+
+        stored_bytes = history.conn.execute("SELECT SUM(LENGTH(state_snapshot)) FROM state_tree").fetchone()[0]
+
+        rng = random.Random(args.seed)
+        sample = [rng.choice(node_ids) for _ in range(args.reads)]
+        start = time.perf_counter()
+        for node_id in sample:
+            history.get_state(node_id)
+        read_seconds = time.perf_counter() - start
+
+        # A live session keeps reading the same few head nodes.
+        start = time.perf_counter()
+        for _ in range(args.reads):
+            history.get_state(node_ids[-1])
+        hot_read_seconds = time.perf_counter() - start
+
+        history.close()
+        file_bytes = os.path.getsize(database_path)
+
+    return {
+        "mode": storage_mode,
+        "bytes_per_commit": stored_bytes / len(node_ids),
+        "file_bytes": file_bytes,
+        "commit_us": commit_seconds / len(node_ids) * 1e6,
+        "get_state_us": read_seconds / len(sample) * 1e6,
+        "hot_get_state_us": hot_read_seconds / args.reads * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark full vs delta snapshot storage.")
+    parser.add_argument("--commits", type=int, default=2000)
+    parser.add_argument("--max-tracks", type=int, default=24)
+    parser.add_argument("--keyframe-interval", type=int, default=32)
+    parser.add_argument("--reads", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--cache-size", type=int, default=128)
+    args = parser.parse_args()
+
+    print(f"{'mode':<6} {'bytes/commit':>13} {'db file bytes':>14} {'commit us':>10} {'get_state us':>13} {'hot get_state us':>17}")
+    for storage_mode in ("full", "delta"):
+        result = run(storage_mode, args)
+        print(f"{result['mode']:<6} {result['bytes_per_commit']:>13.0f} {result['file_bytes']:>14} "
+              f"{result['commit_us']:>10.1f} {result['get_state_us']:>13.1f} {result['hot_get_state_us']:>17.1f}")
+
+
+if __name__ == "__main__":
+    main()
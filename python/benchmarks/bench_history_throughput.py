@@ -0,0 +1,103 @@
+# _implementation/python/benchmarks/bench_history_throughput.py
+# Measures HistoryManager commit and read throughput with concurrent writer
+# and reader threads, for the default connection model, performance mode
+# (WAL, per-thread connections) and performance mode with group commit.
+# The state cache is disabled so every read reaches SQLite.
+#
+# Usage (from the python/ directory):
+#   python benchmarks/bench_history_throughput.py --writers 4 --readers 4 --commits 500
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from history_manager import HistoryManager
+
+CONFIGURATIONS = [
+    ("default", {}),
+    ("performance", {"performance_mode": True}),
+    ("default+group", {"group_commit": True}),
+    ("performance+group", {"performance_mode": True, "group_commit": True}),
+]
+
+
+def writer(history: HistoryManager, root_id: str, commits: int, node_ids: list, lock: threading.Lock, seed: int):
+    rng = random.Random(seed)
+    state = history.get_state(root_id)
+    parent_id = root_id
+    for i in range(commits):
+        state = {**state, "tracks": [t.copy() for t in state["tracks"]]}
+        if len(state["tracks"]) < 16 and rng.random() < 0.2:
+            state["tracks"].append({"id": f"track_{i}", "name": f"Loop {i}", "volume": 1.0,
+                                    "is_playing": True, "path": None, "reverb": 0.0, "delay": 0.0})
+        elif state["tracks"]:
+            rng.choice(state["tracks"])["volume"] = round(rng.random(), 2)
+        parent_id = history.commit(state, parent_id)
+        with lock:
+            node_ids.append(parent_id)
+
+
+def reader(history: HistoryManager, node_ids: list, lock: threading.Lock, stop: threading.Event, counter: list, seed: int):
+    rng = random.Random(seed)
+    reads = 0
+    while not stop.is_set():
+        with lock:
+            node_id = rng.choice(node_ids)
+        history.get_state(node_id)
+        reads += 1
+    with lock:
+        counter[0] += reads
+
+
+def run(options: dict, args) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        history = HistoryManager(os.path.join(directory, "bench.db"), cache_size=0, **options)
+        root_id = history.commit({"tracks": [], "next_track_id": 0}, parent_id=None)
+        node_ids = [root_id]
+        lock = threading.Lock()
+        stop = threading.Event()
+        read_counter = [0]
+
+        writers = [threading.Thread(target=writer, args=(history, root_id, args.commits, node_ids, lock, i))
+                   for i in range(args.writers)]
+        readers = [threading.Thread(target=reader, args=(history, node_ids, lock, stop, read_counter, i))
+                   for i in range(args.readers)]
+        start = time.perf_counter()
+        for thread in writers + readers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        stop.set()
+        for thread in readers:
+            thread.join()
+        history.close()
+
+    return {
+        "commits_per_second": args.writers * args.commits / elapsed,
+        "reads_per_second": read_counter[0] / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark HistoryManager throughput under concurrent writers.")
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--commits", type=int, default=500, help="Commits per writer thread.")
+    args = parser.parse_args()
+
+    print(f"{args.writers} writers x {args.commits} commits, {args.readers} readers")
+    print(f"{'configuration':<20} {'commits/s':>10} {'reads/s':>10}")
+    for name, options in CONFIGURATIONS:
+        result = run(options, args)
+        print(f"{name:<20} {result['commits_per_second']:>10.0f} {result['reads_per_second']:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
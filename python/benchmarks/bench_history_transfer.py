@@ -0,0 +1,124 @@
+# _implementation/python/benchmarks/bench_history_transfer.py
+# Measures streaming export and import of a history (see history_transfer.py).
+# For each history size a simulated session is committed, exported to an
+# NDJSON file and imported into a new database, and the report shows the
+# time and the peak Python memory of each direction: both should stay flat
+# as the history grows. Every imported state is compared with the original,
+# and so is a path export of the newest node imported on its own. A
+# truncated export is imported last, to check that it is rejected and
+# leaves nothing behind.
+#
+# Usage (from the python/ directory):
+#   python benchmarks/bench_history_transfer.py --nodes 10000 100000 --storage delta
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_history_storage import simulate_session
+from history_manager import HistoryManager
+from history_transfer import export_lines, chunked, import_new_database
+
+
+def measured(func):
+    """Runs func and returns its result, the seconds it took and its peak traced memory in MB."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak / 1024 / 1024
+
+
+def export_to(history: HistoryManager, path: str, node_id: str | None = None):
+    with open(path, "w", encoding="utf-8") as f:
+        for chunk in chunked(export_lines(history, node_id=node_id)):
+            f.write(chunk)
+
+
+def import_from(database_path: str, export_path: str) -> dict:
+    with open(export_path, "rb") as f:
+        return import_new_database(database_path, f)
+
+
+def mismatches(original: HistoryManager, imported: HistoryManager, node_ids: list[str]) -> int:
+    return sum(1 for node_id in node_ids if original.get_state(node_id) != imported.get_state(node_id))
+
+
+def run(nodes: int, args, directory: str) -> tuple:
+    source_path = os.path.join(directory, f"source_{nodes}.db")
+    history = HistoryManager(source_path, storage_mode=args.storage, cache_size=0, snapshot_codec=args.codec)
+    node_ids = simulate_session(history, nodes - 1, args.tracks, seed=11)
+
+    export_path = os.path.join(directory, f"export_{nodes}.ndjson")
+    _, export_seconds, export_mb = measured(lambda: export_to(history, export_path))
+    imported_path = os.path.join(directory, f"imported_{nodes}.db")
+    totals, import_seconds, import_mb = measured(lambda: import_from(imported_path, export_path))
+
+    imported = HistoryManager(imported_path, cache_size=0)
+    sample = random.Random(5).sample(node_ids, min(args.verify, len(node_ids)))
+    tree_errors = mismatches(history, imported, sample)
+    imported.close()
+
+    # The path to the newest node, into a database of its own.
+    path_export = os.path.join(directory, f"path_{nodes}.ndjson")
+    export_to(history, path_export, node_id=node_ids[-1])
+    path_db = os.path.join(directory, f"path_{nodes}.db")
+    path_totals = import_from(path_db, path_export)
+    path_history = HistoryManager(path_db, cache_size=0)
+    path_errors = mismatches(history, path_history, [node_ids[-1]])
+    path_history.close()
+    history.close()
+
+    return (nodes, totals["imported"], os.path.getsize(export_path) / 1024 / 1024, export_seconds, export_mb,
+            import_seconds, import_mb, path_totals["imported"], tree_errors + path_errors)
+
+
+def check_truncated(directory: str) -> bool:
+    """Imports an export cut off half-way and returns True if it was rejected without a trace."""
+    history = HistoryManager(os.path.join(directory, "truncated_source.db"), cache_size=0)
+    simulate_session(history, 200, 8, seed=2)
+    lines = list(export_lines(history))
+    history.close()
+    target = os.path.join(directory, "truncated.db")
+    try:
+        import_new_database(target, lines[:len(lines) // 2])
+    except ValueError:
+        return not os.path.exists(target) and not any(".import-" in name for name in os.listdir(directory))
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark streaming export and import of a history.")
+    parser.add_argument("--nodes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--tracks", type=int, default=16, help="Most tracks in the simulated session.")
+    parser.add_argument("--storage", choices=("full", "delta"), default="delta")
+    parser.add_argument("--codec", default="json")
+    parser.add_argument("--verify", type=int, default=2000, help="Imported states compared with the original.")
+    args = parser.parse_args()
+
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        for nodes in args.nodes:
+            rows.append(run(nodes, args, directory))
+        truncated_rejected = check_truncated(directory)
+
+    print(f"{args.storage} storage, {args.codec} codec, up to {args.tracks} tracks")
+    print(f"{'nodes':>8} {'imported':>9} {'export MB':>10} {'export s':>9} {'peak MB':>8} "
+          f"{'import s':>9} {'peak MB':>8} {'path nodes':>11} {'mismatches':>11}")
+    for nodes, imported, size_mb, export_s, export_mb, import_s, import_mb, path_nodes, errors in rows:
+        print(f"{nodes:>8} {imported:>9} {size_mb:>10.1f} {export_s:>9.2f} {export_mb:>8.2f} "
+              f"{import_s:>9.2f} {import_mb:>8.2f} {path_nodes:>11} {errors:>11}")
+    print(f"\nTruncated export rejected and cleaned up: {'yes' if truncated_rejected else 'NO'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# _implementation/python/benchmarks/bench_projects.py
+# Load test for multi-project serving. A fixed number of concurrent clients
+# send "stop recording" commands (the fast path, one history commit each)
+# through execute_command, spread round-robin over 1, 2, 4, ... projects.
+# Each project has its own database, so commits to different projects do
+# not wait on each other, and throughput should grow with the project count
+# until the history pool (JAM_HISTORY_WORKERS) or the disk is the limit.
+#
+# Usage (from the python/ directory):
+#   python benchmarks/bench_projects.py --clients 16 --commands 50 --projects 1 2 4 8 --workers 8
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import statistics
+import tempfile
+import time
+
+from stubs import ScriptedChatModel, load_app, PYTHON_DIR
+
+
+async def client(main, project_id: str, commands: int, latencies: list):
+    node_id = None
+    for _ in range(commands):
+        start = time.perf_counter()
+        response = await main.execute_command(main.CommandRequest(
+            text="stop recording", history_node_id=node_id, project_id=project_id))
+        latencies.append(time.perf_counter() - start)
+        node_id = response["history_node_id"]
+
+
+async def run_load(main, args, project_count: int, label: str) -> tuple[float, list[float]]:
+    """Returns the commands per second and the per-command latencies for one project count."""
+    project_ids = [f"{label}-{index}" for index in range(project_count)]
+    # Open the projects up front, so the timing covers commands only.
+    for project_id in project_ids:
+        main.projects.get(project_id)
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        client(main, project_ids[index % project_count], args.commands, latencies) for index in range(args.clients)
+    ])
+    elapsed = time.perf_counter() - start
+    return len(latencies) / elapsed, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark command throughput across many projects.")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--commands", type=int, default=50, help="Commands sent by each client.")
+    parser.add_argument("--projects", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--workers", type=int, default=8, help="Size of the history thread pool.")
+    parser.add_argument("--performance", action="store_true", help="Open the databases in performance mode (WAL).")
+    args = parser.parse_args()
+
+    # Both are read when the backend is imported.
+    os.environ["JAM_HISTORY_WORKERS"] = str(args.workers)
+    os.environ["JAM_HISTORY_PERFORMANCE"] = "1" if args.performance else "0"
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        app = load_app(directory, ScriptedChatModel())
+        with contextlib.redirect_stdout(io.StringIO()):
+            for run_number, project_count in enumerate(args.projects):
+                results.append((project_count, *asyncio.run(run_load(app, args, project_count, f"run{run_number}"))))
+        app.projects.close()
+        app.generation_jobs.shutdown()
+        os.chdir(PYTHON_DIR)
+
+    mode = "performance mode" if args.performance else "default mode"
+    print(f"{args.clients} clients x {args.commands} commits, {args.workers} history workers, {mode}")
+    print(f"{'projects':>8} {'commands/s':>11} {'p50 ms':>8} {'max ms':>8} {'speedup':>8}")
+    baseline = results[0][1]
+    for project_count, throughput, latencies in results:
+        print(f"{project_count:>8} {throughput:>11.1f} {statistics.median(latencies) * 1e3:>8.2f} "
+              f"{max(latencies) * 1e3:>8.2f} {throughput / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
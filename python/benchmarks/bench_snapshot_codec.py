@@ -0,0 +1,133 @@
+# _implementation/python/benchmarks/bench_snapshot_codec.py
+# Compares the snapshot codecs (see snapshot_codec.py) with today's JSON:
+# bytes per snapshot and microseconds to encode, decode and round-trip, for
+# full session states of several sizes and for a typical one-track delta.
+# It then stores a simulated session with each codec, in full and delta
+# storage, and finally checks that a database written with JSON is still
+# read correctly after switching it to the binary codec.
+#
+# Usage (from the python/ directory):
+#   python benchmarks/bench_snapshot_codec.py --tracks 1 8 32 --commits 1000
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_history_storage import simulate_session
+from history_manager import HistoryManager
+from snapshot_codec import CODECS, get_codec, decode_snapshot
+from snapshot_delta import diff_states
+from track_store import TrackStore
+
+
+def session_state(track_count: int, seed: int = 0) -> dict:
+    """Returns a state shaped like the ones the graph nodes commit."""
+    rng = random.Random(seed)
+    tracks = [{"id": f"track_{i}", "name": f"Loop {i}" if i % 2 else f"AI Loop {i}",
+               "volume": round(rng.random(), 2), "is_playing": rng.random() < 0.8,
+               "path": None if i % 2 else f"generated_track_{i}_{rng.getrandbits(32):08x}.mp3",
+               "reverb": rng.choice([0.0, 25.0, 40.5]), "delay": rng.choice([0.0, 10.0])} for i in range(track_count)]
+    return {
+        "tracks": TrackStore(tracks),
+        "next_track_id": track_count,
+        "history_node_id": "6f1c2b9e-3d4a-4e8f-9a7b-0c1d2e3f4a5b",
+        "command": "set the volume of track 0 to 0.4",
+        "modification_args": {"track_id": "track_0", "volume": 0.4},
+        "next_node": "modify_track_node",
+        "response": {"action": "set_volume", "track_id": "track_0", "volume": 0.4},
+    }
+
+
+def time_per_call(func, repeats: int) -> float:
+    """Returns the mean microseconds per call."""
+    start = time.perf_counter()
+    for _ in range(repeats):
+        func()
+    return (time.perf_counter() - start) / repeats * 1e6
+
+
+def bench_codecs(label: str, value: dict, repeats: int) -> list[tuple]:
+    rows = []
+    for name in CODECS:
+        codec = get_codec(name)
+        encoded = codec.encode(value)
+        assert decode_snapshot(encoded) == value, f"{name} did not round-trip {label}"
+        size = len(encoded.encode() if isinstance(encoded, str) else encoded)
+        encode_us = time_per_call(lambda: codec.encode(value), repeats)
+        decode_us = time_per_call(lambda: decode_snapshot(encoded), repeats)
+        rows.append((label, name, size, encode_us, decode_us, encode_us + decode_us))
+    return rows
+
+
+def bench_history(codec: str, storage_mode: str, args) -> tuple:
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.db")
+        history = HistoryManager(path, storage_mode=storage_mode, cache_size=0, snapshot_codec=codec)
+        start = time.perf_counter()
+        node_ids = simulate_session(history, args.commits, max(args.tracks), seed=7)
+        commit_us = (time.perf_counter() - start) / len(node_ids) * 1e6
+        stored = history.conn.execute("SELECT SUM(LENGTH(state_snapshot)) FROM state_tree").fetchone()[0]
+        sample = random.Random(7).choices(node_ids, k=500)
+        read_us = time_per_call(lambda: history.get_state(sample.pop()), len(sample))
+        history.close()
+        return codec, storage_mode, stored / len(node_ids), os.path.getsize(path), commit_us, read_us
+
+
+def check_mixed_rows(args) -> int:
+    """Writes a session with JSON, switches to the binary codec, adds more, and compares every state."""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "mixed.db")
+        history = HistoryManager(path, storage_mode="delta", cache_size=0)
+        node_ids = simulate_session(history, args.commits // 2, max(args.tracks), seed=3)
+        expected = {node_id: history.get_state(node_id) for node_id in node_ids}
+        history.close()
+
+        history = HistoryManager(path, storage_mode="delta", cache_size=0, snapshot_codec="binary+zlib")
+        state = history.get_state(node_ids[-1])
+        for i in range(args.commits // 2):
+            state = {**state, "command": f"more {i}"}
+            state_id = history.commit(state, state["history_node_id"])
+            expected[state_id] = history.get_state(state_id)
+            state = expected[state_id]
+        mismatches = sum(1 for node_id, value in expected.items() if history.get_state(node_id) != value)
+        history.close()
+        return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark snapshot codecs against JSON.")
+    parser.add_argument("--tracks", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--repeats", type=int, default=2000)
+    parser.add_argument("--commits", type=int, default=1000)
+    args = parser.parse_args()
+
+    rows = []
+    for track_count in args.tracks:
+        state = session_state(track_count)
+        rows += bench_codecs(f"state, {track_count} tracks", state, args.repeats)
+        tweaked = {**state, "tracks": state["tracks"].replace("track_0", volume=0.4)}
+        rows += bench_codecs(f"delta, {track_count} tracks", diff_states(state, tweaked), args.repeats)
+
+    print(f"{'snapshot':<18} {'codec':<12} {'bytes':>7} {'encode us':>10} {'decode us':>10} {'round trip us':>14}")
+    for label, name, size, encode_us, decode_us, round_trip_us in rows:
+        print(f"{label:<18} {name:<12} {size:>7} {encode_us:>10.1f} {decode_us:>10.1f} {round_trip_us:>14.1f}")
+
+    print(f"\nSimulated session: {args.commits} commits, up to {max(args.tracks)} tracks, state cache off")
+    print(f"{'codec':<12} {'storage':<8} {'bytes/commit':>13} {'db file bytes':>14} {'commit us':>10} {'get_state us':>13}")
+    for storage_mode in ("full", "delta"):
+        for codec in CODECS:
+            codec, storage_mode, per_commit, file_bytes, commit_us, read_us = bench_history(codec, storage_mode, args)
+            print(f"{codec:<12} {storage_mode:<8} {per_commit:>13.0f} {file_bytes:>14} {commit_us:>10.1f} {read_us:>13.1f}")
+
+    mismatches = check_mixed_rows(args)
+    print(f"\nJSON rows read back after switching to binary+zlib: {'OK' if not mismatches else f'{mismatches} mismatches'}")
+
+
+if __name__ == "__main__":
+    main()
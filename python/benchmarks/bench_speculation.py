@@ -0,0 +1,84 @@
+# _implementation/python/benchmarks/bench_speculation.py
+# Measures what speculative pre-generation saves. Each round asks for a
+# suggestion, "thinks" for a while, and then either accepts it ("yes") and
+# waits for the new track, or moves on. Rounds run once with speculation off
+# and once with it on. The report shows the time from "yes" to the finished
+# track, and the speculation counters (hits, joins, wasted generations).
+# Replicate is stubbed with a fixed generation time, and the audio cache is
+# off so every generation costs that time.
+#
+# Usage (from the python/ directory):
+#   python benchmarks/bench_speculation.py --rounds 10 --generation-seconds 2 --think-seconds 1 --accept-rate 0.7
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from stubs import ScriptedChatModel, install_replicate_stub, load_app, PYTHON_DIR
+
+from generation_jobs import GenerationJobQueue, SUCCEEDED, FAILED
+
+
+async def run_rounds(main, args, speculative_limit: int) -> tuple[list[float], dict]:
+    """Returns the accept-to-track latencies and the speculation counters for one mode."""
+    jobs = GenerationJobQueue(main.history, audio_cache=None, max_workers=2,
+                              speculative_limit=speculative_limit, speculative_ttl=args.ttl_seconds)
+    main.generation_jobs = jobs
+    main.projects.get(None).graph = main.create_graph(main.history, jobs, main.audio_analyzer)
+    rng = random.Random(args.seed)
+    latencies = []
+    for _ in range(args.rounds):
+        await main.execute_command(main.CommandRequest(text="give me a suggestion"))
+        await asyncio.sleep(args.think_seconds)
+        if rng.random() >= args.accept_rate:
+            continue
+        start = time.perf_counter()
+        response = await main.execute_command(main.CommandRequest(text="yes"))
+        while jobs.get(response["job_id"])["status"] not in (SUCCEEDED, FAILED):
+            await asyncio.sleep(0.005)
+        latencies.append(time.perf_counter() - start)
+    # Let unclaimed speculative results expire so they are counted as wasted.
+    await asyncio.sleep(args.ttl_seconds + args.generation_seconds)
+    stats = jobs.stats()["speculation"]
+    jobs.shutdown()
+    return latencies, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark speculative generation of suggested music.")
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--generation-seconds", type=float, default=2.0, help="Simulated Replicate time.")
+    parser.add_argument("--think-seconds", type=float, default=1.0, help="Time between the suggestion and the answer.")
+    parser.add_argument("--accept-rate", type=float, default=0.7)
+    parser.add_argument("--ttl-seconds", type=float, default=1.0, help="How long unclaimed results are kept.")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = load_app(directory, ScriptedChatModel(default={"name": "get_creative_suggestion", "args": {}}))
+        install_replicate_stub(generation_seconds=args.generation_seconds)
+        app.load_agent()
+        results = {}
+        with contextlib.redirect_stdout(io.StringIO()):
+            for label, limit in (("off", 0), ("on", 1)):
+                results[label] = asyncio.run(run_rounds(app, args, limit))
+        app.history.close()
+        os.chdir(PYTHON_DIR)
+
+    print(f"{args.rounds} rounds, {args.generation_seconds:.1f}s generations, {args.think_seconds:.1f}s think time, "
+          f"{args.accept_rate:.0%} accepted")
+    print(f"{'speculation':<12} {'accepted':>8} {'p50 s':>7} {'max s':>7} {'hits':>5} {'joined':>7} {'wasted':>7} {'hit rate':>9}")
+    for label, (latencies, stats) in results.items():
+        p50 = statistics.median(latencies) if latencies else 0.0
+        print(f"{label:<12} {len(latencies):>8} {p50:>7.2f} {max(latencies, default=0.0):>7.2f} {stats['hits']:>5} "
+              f"{stats['joined']:>7} {stats['wasted']:>7} {stats['hit_rate']:>9.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# _implementation/python/benchmarks/bench_startup.py
+# Measures backend cold start in fresh interpreters: how long `import main`
+# takes, when the record/stop fast path can first answer, and when the LLM
+# agent (chat client and compiled graph) is ready. It also breaks the import
+# time down by top-level package, from `python -X importtime`.
+#
+# Usage (from the python/ directory):
+#   python benchmarks/bench_startup.py --runs 5
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+
+PYTHON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in a fresh interpreter and prints its timings as JSON.
+PROBE = r"""
+import asyncio, json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import main
+imported = time.perf_counter()
+
+async def fast_path():
+    return await main.execute_command(main.CommandRequest(text="stop_recording"))
+
+response = asyncio.run(fast_path())
+assert response.get("action") == "stop_recording_and_create_loop", response
+fast_path_ready = time.perf_counter()
+main.load_agent()
+agent_ready = time.perf_counter()
+print("STARTUP " + json.dumps({
+    "import_s": imported - start,
+    "first_stop_s": fast_path_ready - start,
+    "agent_ready_s": agent_ready - start,
+}))
+"""
+
+
+def run_probe(directory: str) -> dict:
+    env = {**os.environ, "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "offline-benchmark")}
+    result = subprocess.run([sys.executable, "-c", PROBE, PYTHON_DIR], cwd=directory, env=env,
+                            capture_output=True, text=True, check=True)
+    line = next(line for line in result.stdout.splitlines() if line.startswith("STARTUP "))
+    return json.loads(line[len("STARTUP "):])
+
+
+def import_breakdown(directory: str, top: int) -> list[tuple[str, float]]:
+    """Returns the top-level packages that `import main` spends the most time in, in seconds."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import sys; sys.path.insert(0, {PYTHON_DIR!r}); import main"],
+                            cwd=directory, env={**os.environ, "OPENAI_API_KEY": "offline-benchmark"},
+                            capture_output=True, text=True, check=True)
+    totals = defaultdict(float)
+    for line in result.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, _, name = [part.strip() for part in line[len("import time:"):].split("|")]
+        totals[name.split(".")[0]] += int(self_us) / 1e6
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark backend cold start.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=12, help="Packages shown in the import breakdown.")
+    args = parser.parse_args()
+
+    samples = []
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory() as directory:
+            samples.append(run_probe(directory))
+
+    print(f"{args.runs} cold starts, median seconds")
+    for key, label in (("import_s", "import main"), ("first_stop_s", "first stop_recording answered"),
+                       ("agent_ready_s", "agent loaded")):
+        print(f"  {label:<32} {statistics.median(s[key] for s in samples):.3f}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        breakdown = import_breakdown(directory, args.top)
+    print("\nimport main, self time by top-level package")
+    for package, seconds in breakdown:
+        print(f"  {package:<32} {seconds:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# _implementation/python/benchmarks/bench_state_diff.py
+# Compares the response to an undo with and without `accept_diff`. A session
+# of N recorded loops gets one more change (a volume nudge, a mute, a new
+# loop), which is then undone twice from the same history node: once as a
+# 'load_state' response and once as an 'apply_state_diff' response. The
+# report shows the response size, the server time, and how many tracks the
+# client has to rebuild. Each diff is checked by applying it to the client's
+# state and comparing the result with the full state.
+#
+# Usage (from the python/ directory):
+#   python benchmarks/bench_state_diff.py --tracks 1 8 32 128 --repeats 50
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from stubs import ScriptedChatModel, load_app, PYTHON_DIR
+
+from snapshot_delta import apply_delta
+
+# (label, command) for the change that is undone.
+CHANGES = [
+    ("volume", "set the volume of track 0 to 0.5"),
+    ("mute", "mute track 0"),
+    ("new loop", "stop_recording"),
+]
+
+
+async def build_session(main, track_count: int) -> str:
+    """Records `track_count` loops and returns the resulting history node."""
+    node_id = None
+    for _ in range(track_count):
+        node_id = (await main.execute_command(main.CommandRequest(text="stop_recording", history_node_id=node_id)))["history_node_id"]
+    return node_id
+
+
+async def time_undo(main, node_id: str, accept_diff: bool, repeats: int) -> tuple[dict, float]:
+    """Undoes from `node_id` `repeats` times and returns the last response and the median milliseconds."""
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        response = await main.execute_command(main.CommandRequest(text="undo", history_node_id=node_id, accept_diff=accept_diff))
+        samples.append((time.perf_counter() - start) * 1000)
+    return response, statistics.median(samples)
+
+
+async def run(main, args) -> list[tuple]:
+    rows = []
+    for track_count in args.tracks:
+        session_id = await build_session(main, track_count)
+        for label, command in CHANGES:
+            node_id = (await main.execute_command(main.CommandRequest(text=command, history_node_id=session_id)))["history_node_id"]
+            client_state = main._client_state(main.history.get_state(node_id))
+            full, full_ms = await time_undo(main, node_id, False, args.repeats)
+            diffed, diff_ms = await time_undo(main, node_id, True, args.repeats)
+            expected = main._client_state(full["state"])
+            if diffed["action"] == "apply_state_diff":
+                correct = apply_delta(client_state, diffed["diff"]) == expected
+                track_diff = diffed["diff"].get("tracks", {})
+                rebuilt = sum(len(track_diff.get(key, ())) for key in ("changed", "added", "removed"))
+            else:
+                correct = diffed == full
+                rebuilt = len(expected["tracks"])
+            rows.append((track_count, label, len(json.dumps(full)), full_ms, diffed["action"],
+                         len(json.dumps(diffed)), diff_ms, len(expected["tracks"]), rebuilt, correct))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark diffed undo responses against full state reloads.")
+    parser.add_argument("--tracks", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--repeats", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = load_app(directory, ScriptedChatModel())
+        app.load_agent()
+        with contextlib.redirect_stdout(io.StringIO()):
+            rows = asyncio.run(run(app, args))
+        app.history.close()
+        os.chdir(PYTHON_DIR)
+
+    print(f"{'tracks':>6} {'undone':<9} {'full bytes':>10} {'full ms':>8} {'diff response':<17} {'bytes':>7} {'ms':>6} "
+          f"{'rebuilt':>8} {'correct':>8}")
+    for track_count, label, full_bytes, full_ms, action, diff_bytes, diff_ms, total, rebuilt, correct in rows:
+        print(f"{track_count:>6} {label:<9} {full_bytes:>10} {full_ms:>8.2f} {action:<17} {diff_bytes:>7} {diff_ms:>6.2f} "
+              f"{f'{rebuilt}/{total}':>8} {'yes' if correct else 'NO':>8}")
+
+
+if __name__ == "__main__":
+    main()
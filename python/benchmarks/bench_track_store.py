@@ -0,0 +1,123 @@
+# _implementation/python/benchmarks/bench_track_store.py
+# Measures the per-command cost of track edits as the session grows. The
+# node-only columns compare the previous approach (copy every track, scan for
+# the ID) with the TrackStore used by the nodes now (copy one track). The
+# end-to-end columns run the real modify/toggle nodes against a HistoryManager,
+# including get_state and the commit, in performance mode so that fsync
+# latency does not drown out the work that depends on the track count.
+#
+# Usage (from the python/ directory):
+#   python benchmarks/bench_track_store.py --commands 500 --tracks 4 16 64 256
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import tempfile
+import time
+
+from stubs import ScriptedChatModel, load_app, PYTHON_DIR
+
+from history_manager import HistoryManager
+from track_store import TrackStore
+
+
+class NullHistory:
+    """Accepts commits without storing them, to time a node on its own."""
+    def commit(self, state_snapshot: dict, parent_id: str | None) -> str:
+        state_snapshot["history_node_id"] = parent_id
+        return parent_id
+
+
+def legacy_modify_volume(state: dict, track_id: str, volume: float) -> dict:
+    """The node logic before the TrackStore: copy every track, then scan for the ID."""
+    new_state = state.copy()
+    new_state["tracks"] = [t.copy() for t in state["tracks"]]
+    for track in new_state["tracks"]:
+        if track["id"] == track_id:
+            track["volume"] = volume
+            break
+    return new_state
+
+
+def session(track_count: int) -> dict:
+    tracks = [{"id": f"track_{i}", "name": f"Loop {i}", "volume": 1.0, "is_playing": True,
+               "path": None, "reverb": 0.0, "delay": 0.0} for i in range(track_count)]
+    return {"tracks": tracks, "next_track_id": track_count}
+
+
+def commands(track_count: int, count: int, seed: int):
+    """Yields (node, modification_args) pairs: mostly volume tweaks, some mutes."""
+    rng = random.Random(seed)
+    for _ in range(count):
+        track_id = f"track_{rng.randrange(track_count)}"
+        if rng.random() < 0.2:
+            yield "toggle", {"track_id": track_id}
+        else:
+            yield "modify", {"track_id": track_id, "volume": round(rng.random(), 2)}
+
+
+def time_nodes_only(main, track_count: int, count: int) -> tuple[float, float]:
+    """Returns the mean µs per command for the legacy copy and the TrackStore node."""
+    state = session(track_count)
+    start = time.perf_counter()
+    for _, args in commands(track_count, count, seed=track_count):
+        state = legacy_modify_volume(state, args["track_id"], args.get("volume", 0.5))
+    legacy = (time.perf_counter() - start) / count * 1e6
+
+    history = NullHistory()
+    state = session(track_count)
+    state["tracks"] = TrackStore(state["tracks"])
+    start = time.perf_counter()
+    for _, args in commands(track_count, count, seed=track_count):
+        state["modification_args"] = {"track_id": args["track_id"], "volume": args.get("volume", 0.5)}
+        state = main.modify_track_node(state, history)
+    store = (time.perf_counter() - start) / count * 1e6
+    return legacy, store
+
+
+def time_end_to_end(main, storage_mode: str, track_count: int, count: int) -> float:
+    """Returns the mean µs per command for get_state + node + commit."""
+    with tempfile.TemporaryDirectory() as directory:
+        history = HistoryManager(os.path.join(directory, "bench.db"), storage_mode=storage_mode, performance_mode=True)
+        head = history.commit(session(track_count), parent_id=None)
+        nodes = {"modify": main.modify_track_node, "toggle": main.toggle_playback_node}
+        start = time.perf_counter()
+        for node, args in commands(track_count, count, seed=track_count):
+            state = history.get_state(head)
+            state["modification_args"] = args
+            head = nodes[node](state, history)["history_node_id"]
+        elapsed = time.perf_counter() - start
+        history.close()
+    return elapsed / count * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-command track edit cost against the number of tracks.")
+    parser.add_argument("--commands", type=int, default=500)
+    parser.add_argument("--tracks", type=int, nargs="+", default=[4, 16, 64, 256])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = load_app(directory, ScriptedChatModel())
+        rows = []
+        # The nodes print a line per call; keep that out of the timings.
+        with contextlib.redirect_stdout(io.StringIO()):
+            for track_count in args.tracks:
+                legacy, store = time_nodes_only(app, track_count, args.commands)
+                full = time_end_to_end(app, "full", track_count, args.commands)
+                delta = time_end_to_end(app, "delta", track_count, args.commands)
+                rows.append((track_count, legacy, store, full, delta))
+        app.generation_jobs.shutdown()
+        app.history.close()
+        os.chdir(PYTHON_DIR)
+
+    print(f"{args.commands} commands per row, mean µs per command")
+    print(f"{'tracks':>6} {'node: list copy':>16} {'node: TrackStore':>17} {'e2e full':>10} {'e2e delta':>10}")
+    for track_count, legacy, store, full, delta in rows:
+        print(f"{track_count:>6} {legacy:>16.1f} {store:>17.1f} {full:>10.1f} {delta:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+# _implementation/python/benchmarks/run_suite.py
+# An offline benchmark suite for the backend's own overhead. OpenAI and
+# Replicate are replaced by the stand-ins in stubs.py, so every number here
+# is time spent in this codebase. Results are written as JSON; pass an
+# earlier results file with --compare to see what changed between runs.
+#
+# Usage (from the python/ directory; requires httpx):
+#   python benchmarks/run_suite.py --output bench_results.json
+#   python benchmarks/run_suite.py --quick --compare bench_results.json
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from stubs import ScriptedChatModel, install_replicate_stub, load_app, PYTHON_DIR
+
+from history_manager import HistoryManager
+
+# Commands phrased so the local parser does not understand them, so they
+# exercise the (stubbed) LLM path, paired with the tool call the model returns.
+LLM_ROUTED_COMMANDS = {
+    "could you make the first loop a bit quieter": {"name": "modify_track_volume", "args": {"track_id": "track_0", "volume": 0.4}},
+    "drench the first loop in reverb": {"name": "modify_track_reverb", "args": {"track_id": "track_0", "reverb": 80.0}},
+    "give the first loop some echo": {"name": "modify_track_delay", "args": {"track_id": "track_0", "delay": 30.0}},
+    "silence the first loop for a bit": {"name": "toggle_track_playback", "args": {"track_id": "track_0"}},
+    "take that back": {"name": "undo", "args": {}},
+    "hmm what would sound good here": {"name": "get_creative_suggestion", "args": {}},
+    "first loop to half, mute the second and soak the third in reverb": [
+        {"name": "modify_track_volume", "args": {"track_id": "track_0", "volume": 0.5}},
+        {"name": "toggle_track_playback", "args": {"track_id": "track_1"}},
+        {"name": "modify_track_reverb", "args": {"track_id": "track_2", "reverb": 60.0}},
+    ],
+}
+
+# (scenario, node, command). Commands with a "{i}" are made unique per iteration.
+COMMAND_SCENARIOS = [
+    ("record", "record_node", "record"),
+    ("stop_recording", "stop_recording_node", "stop_recording"),
+    ("volume/local", "modify_track_node", "set the volume of track 0 to 0.5"),
+    ("volume/llm", "modify_track_node", "could you make the first loop a bit quieter"),
+    ("reverb/llm", "modify_track_node", "drench the first loop in reverb"),
+    ("delay/llm", "modify_track_node", "give the first loop some echo"),
+    ("toggle/local", "toggle_track_playback_node", "mute track 0"),
+    ("toggle/llm", "toggle_track_playback_node", "silence the first loop for a bit"),
+    ("undo/local", "undo_node", "undo"),
+    ("undo/llm", "undo_node", "take that back"),
+    ("suggestion/llm", "get_creative_suggestion_node", "hmm what would sound good here"),
+    ("generate/llm", "generate_new_music_node", "a dusty lo-fi drum loop number {i}"),
+    ("batch/llm", "batch_node", "first loop to half, mute the second and soak the third in reverb"),
+    ("fallback/llm", "fallback_node", "tell me a joke"),
+]
+
+
+def percentiles(samples: list[float]) -> dict:
+    """Summarizes latency samples in milliseconds."""
+    ordered = sorted(samples)
+
+    def pick(fraction):
+        return ordered[max(math.ceil(len(ordered) * fraction) - 1, 0)]
+
+    return {
+        "n": len(ordered),
+        "mean_ms": statistics.fmean(ordered),
+        "p50_ms": pick(0.50),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+        "max_ms": ordered[-1],
+    }
+
+
+async def bench_commands(main, iterations: int) -> dict:
+    """Measures /command latency per scenario, plus background generation time."""
+    import httpx
+
+    results = {}
+    # Server errors become 500 responses, counted per scenario, instead of aborting the run.
+    transport = httpx.ASGITransport(app=main.app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # A few loops to work on, so track_0 exists for every scenario.
+        head = None
+        for _ in range(4):
+            head = (await client.post("/command", json={"text": "stop_recording", "history_node_id": head})).json()["history_node_id"]
+
+        for scenario, node, command in COMMAND_SCENARIOS:
+            samples = []
+            job_ids = []
+            errors = 0
+            for i in range(iterations):
+                start = time.perf_counter()
+                response = await client.post("/command", json={"text": command.format(i=i), "history_node_id": head})
+                samples.append((time.perf_counter() - start) * 1000)
+                if response.status_code != 200:
+                    errors += 1
+                    continue
+                body = response.json()
+                if "job_id" in body:
+                    job_ids.append((body["job_id"], time.perf_counter()))
+            results[scenario] = {"node": node, "errors": errors, **percentiles(samples)}
+
+            if job_ids:
+                completion = []
+                for job_id, submitted in job_ids:
+                    while (await client.get(f"/jobs/{job_id}")).json()["status"] not in ("succeeded", "failed"):
+                        await asyncio.sleep(0.005)
+                    completion.append((time.perf_counter() - submitted) * 1000)
+                results[f"{scenario}/job_completion"] = {"node": node, **percentiles(completion)}
+    return results
+
+
+def bench_graph_compile(main, repetitions: int) -> dict:
+    samples = []
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        main.create_graph(main.history, main.generation_jobs)
+        samples.append((time.perf_counter() - start) * 1000)
+    return percentiles(samples)
+
+
+def build_history(history: HistoryManager, depth: int, track_count: int, seed: int) -> list[str]:
+    """Commits a linear history of `depth` tweaks over `track_count` tracks."""
+    rng = random.Random(seed)
+    tracks = [{"id": f"track_{i}", "name": f"Loop {i}", "volume": 1.0, "is_playing": True,
+               "path": None, "reverb": 0.0, "delay": 0.0} for i in range(track_count)]
+    state = {"tracks": tracks, "next_track_id": track_count}
+    node_ids = [history.commit(state, parent_id=None)]
+    for _ in range(depth):
+        state = {**state, "tracks": [t.copy() for t in state["tracks"]]}
+        rng.choice(state["tracks"])["volume"] = round(rng.random(), 2)
+        node_ids.append(history.commit(state, node_ids[-1]))
+    return node_ids
+
+
+def bench_history(depths: list[int], track_counts: list[int], reads: int) -> list[dict]:
+    """Measures commit and get_state throughput and DB growth against depth and track count."""
+    results = []
+    for storage_mode in ("full", "delta"):
+        for depth in depths:
+            for track_count in track_counts:
+                with tempfile.TemporaryDirectory() as directory:
+                    database_path = os.path.join(directory, "bench.db")
+                    history = HistoryManager(database_path, storage_mode=storage_mode, cache_size=0)
+                    start = time.perf_counter()
+                    node_ids = build_history(history, depth, track_count, seed=depth + track_count)
+                    commit_seconds = time.perf_counter() - start
+
+                    rng = random.Random(depth)
+                    sample = [rng.choice(node_ids) for _ in range(reads)]
+                    start = time.perf_counter()
+                    for node_id in sample:
+                        history.get_state(node_id)
+                    read_seconds = time.perf_counter() - start
+                    history.close()
+                    db_bytes = os.path.getsize(database_path)
+
+                results.append({
+                    "storage_mode": storage_mode,
+                    "depth": depth,
+                    "tracks": track_count,
+                    "commits_per_second": len(node_ids) / commit_seconds,
+                    "get_state_per_second": reads / read_seconds,
+                    "db_bytes": db_bytes,
+                    "db_bytes_per_node": db_bytes / len(node_ids),
+                })
+    return results
+
+
+def flatten(results: dict) -> dict:
+    """Flattens a results document into metric name -> number, for comparisons."""
+    metrics = {}
+    for scenario, stats in results["command_latency"].items():
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            metrics[f"command.{scenario}.{key}"] = stats[key]
+    metrics["graph_compile.p50_ms"] = results["graph_compile"]["p50_ms"]
+    for row in results["history"]:
+        prefix = f"history.{row['storage_mode']}.depth{row['depth']}.tracks{row['tracks']}"
+        for key in ("commits_per_second", "get_state_per_second", "db_bytes_per_node"):
+            metrics[f"{prefix}.{key}"] = row[key]
+    return metrics
+
+
+def compare(current: dict, baseline: dict, threshold: float):
+    """Prints the metrics that moved by more than `threshold` (a fraction) since the baseline."""
+    now, before = flatten(current), flatten(baseline)
+    print(f"\nChanges of more than {threshold:.0%} against the baseline:")
+    changed = False
+    for name in sorted(now.keys() & before.keys()):
+        if before[name] == 0:
+            continue
+        ratio = now[name] / before[name]
+        if abs(ratio - 1) > threshold:
+            changed = True
+            print(f"  {name:<70} {before[name]:>12.2f} -> {now[name]:>12.2f} ({ratio - 1:+.0%})")
+    if not changed:
+        print("  none")
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PYTHON_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark suite for the JamSession backend.")
+    parser.add_argument("--output", default="bench_results.json", help="Where to write the JSON results.")
+    parser.add_argument("--compare", help="An earlier results file to compare against.")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative change reported by --compare.")
+    parser.add_argument("--iterations", type=int, default=50, help="Requests per /command scenario.")
+    parser.add_argument("--quick", action="store_true", help="Fewer iterations and smaller histories.")
+    args = parser.parse_args()
+
+    iterations = 10 if args.quick else args.iterations
+    depths = [100, 1000] if args.quick else [100, 1000, 5000]
+    track_counts = [4, 32] if args.quick else [4, 16, 64]
+    output_path = os.path.abspath(args.output)
+
+    started = time.time()
+    with tempfile.TemporaryDirectory() as directory:
+        install_replicate_stub()
+        chat_model = ScriptedChatModel(script=LLM_ROUTED_COMMANDS, default=None)
+        chat_model.script.update({command.format(i=i): (lambda c: {"name": "generate_new_music", "args": {"prompt": c}})
+                                  for _, node, command in COMMAND_SCENARIOS if node == "generate_new_music_node"
+                                  for i in range(iterations)})
+        app = load_app(directory, chat_model)
+        app.load_agent()  # The server warms the agent at startup; keep that out of the latencies.
+        command_latency = asyncio.run(bench_commands(app, iterations))
+        graph_compile = bench_graph_compile(app, repetitions=iterations)
+        app.generation_jobs.shutdown()
+        app.history.close()
+        os.chdir(PYTHON_DIR)
+
+    results = {
+        "meta": {
+            "timestamp": started,
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "iterations": iterations,
+        },
+        "command_latency": command_latency,
+        "graph_compile": graph_compile,
+        "history": bench_history(depths, track_counts, reads=iterations * 20),
+    }
+    with open(output_path, "w") as f:
+        json.dump(results, f, indent=2)
+
+    print(f"\n{'scenario':<32} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for scenario, stats in command_latency.items():
+        print(f"{scenario:<32} {stats['p50_ms']:>8.2f} {stats['p95_ms']:>8.2f} {stats['p99_ms']:>8.2f} {stats.get('errors', 0):>7}")
+    print(f"graph compile p50: {graph_compile['p50_ms']:.2f} ms")
+    print(f"\n{'storage':<7} {'depth':>6} {'tracks':>6} {'commits/s':>10} {'get_state/s':>12} {'bytes/node':>11}")
+    for row in results["history"]:
+        print(f"{row['storage_mode']:<7} {row['depth']:>6} {row['tracks']:>6} {row['commits_per_second']:>10.0f} "
+              f"{row['get_state_per_second']:>12.0f} {row['db_bytes_per_node']:>11.0f}")
+    print(f"\nResults written to {output_path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f), args.threshold)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
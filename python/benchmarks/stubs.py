@@ -0,0 +1,118 @@
+# _implementation/python/benchmarks/stubs.py
+# Offline stand-ins for the backend's external services, shared by the
+# benchmarks: a chat model that returns scripted tool calls instead of
+# calling OpenAI, and a replacement for replicate.run plus the download.
+
+import asyncio
+import os
+import sys
+import time
+
+from langchain_core.messages import AIMessage
+
+PYTHON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PYTHON_DIR not in sys.path:
+    sys.path.insert(0, PYTHON_DIR)
+
+
+class ScriptedChatModel:
+    """
+    Stands in for the tool-bound chat model. Commands found in `script` return
+    their scripted tool call (or list of tool calls); anything else returns
+    `default` (or no tool call). `latency` simulates the model's response time.
+    """
+    def __init__(self, script: dict | None = None, default: dict | None = None, latency: float = 0.0):
+        self.script = script or {}
+        self.default = default
+        self.latency = latency
+        self.calls = 0
+
+    def _message(self, command: str) -> AIMessage:
+        self.calls += 1
+        tool_call = self.script.get(command, self.default)
+        if tool_call is None:
+            return AIMessage(content="")
+        if callable(tool_call):
+            tool_call = tool_call(command)
+        tool_calls = tool_call if isinstance(tool_call, list) else [tool_call]
+        return AIMessage(content="", tool_calls=[{"id": f"call_{self.calls}_{i}", **call} for i, call in enumerate(tool_calls)])
+
+    def invoke(self, command, *args, **kwargs) -> AIMessage:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._message(command)
+
+    async def ainvoke(self, command, *args, **kwargs) -> AIMessage:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._message(command)
+
+
+class _FakeDownload:
+    """Mimics the streaming requests.Response used to download generated audio."""
+    def __init__(self, payload: bytes, latency: float):
+        self.payload = payload
+        self.latency = latency
+        self.status_code = 200
+        self.headers = {"Content-Length": str(len(payload))}
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size: int = 8192):
+        if self.latency:
+            time.sleep(self.latency)
+        for start in range(0, len(self.payload), chunk_size):
+            yield self.payload[start:start + chunk_size]
+
+    def close(self):
+        pass
+
+
+def install_replicate_stub(generation_seconds: float = 0.0, download_seconds: float = 0.0, payload_bytes: int = 128 * 1024) -> dict:
+    """
+    Replaces replicate.run and the audio download used by music generation
+    with local stand-ins that sleep for the given times.
+
+    Returns:
+        dict: Counters of stubbed generations and downloads.
+    """
+    import replicate
+    import requests
+
+    os.environ.setdefault("REPLICATE_API_TOKEN", "offline-benchmark")
+    counters = {"generations": 0, "downloads": 0}
+    payload = b"\xff\xfb" + b"\0" * (payload_bytes - 2)
+
+    def run(model, input):
+        counters["generations"] += 1
+        time.sleep(generation_seconds)
+        return f"http://replicate.invalid/{counters['generations']}.mp3"
+
+    def get(session, url, *args, **kwargs):
+        counters["downloads"] += 1
+        return _FakeDownload(payload, download_seconds)
+
+    replicate.run = run
+    # Downloads go through the Downloader's pooled session (see downloads.py).
+    requests.Session.get = get
+    return counters
+
+
+def load_app(directory: str, chat_model):
+    """
+    Imports main.py with its working directory (project.db, generated audio,
+    audio cache) inside `directory`, swaps in the given chat model and opens
+    the app's services.
+
+    Returns:
+        module: The imported main module.
+    """
+    os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+    # The benchmarks repeat identical commands on purpose; each must really run.
+    os.environ.setdefault("JAM_COALESCE", "0")
+    os.chdir(directory)
+    import main
+    main.llm_with_tools = chat_model
+    main.init_services()
+    return main
@@ -0,0 +1,213 @@
+# _implementation/python/downloads.py
+# This file defines the Downloader, which fetches generated audio from
+# Replicate's delivery URLs. All downloads share one pooled HTTP session, so
+# repeat downloads reuse warm connections. A download is written to a
+# temporary file next to its destination and renamed into place only once it
+# is complete, so the audio engine never sees a truncated MP3. Dropped
+# connections and timeouts are retried, resuming with a Range request from
+# the bytes already received, and every finished file's size and SHA-256 are
+# reported.
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+POOL_SIZE = int(os.environ.get("JAM_DOWNLOAD_POOL_SIZE", "8"))
+CONNECT_TIMEOUT = float(os.environ.get("JAM_DOWNLOAD_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.environ.get("JAM_DOWNLOAD_READ_TIMEOUT", "30"))
+MAX_ATTEMPTS = int(os.environ.get("JAM_DOWNLOAD_ATTEMPTS", "4"))
+
+# Statuses worth retrying: the server is overloaded or briefly unavailable.
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+class DownloadError(Exception):
+    """Raised when a file could not be downloaded completely."""
+
+
+class _Retryable(Exception):
+    """An attempt failed in a way another attempt may not."""
+
+
+class Downloader:
+    """
+    Downloads files over a shared, pooled requests session, with timeouts,
+    retries that resume where the last attempt stopped, and atomic writes.
+    Safe to use from several threads at once.
+    """
+    def __init__(self, pool_size: int = POOL_SIZE, connect_timeout: float = CONNECT_TIMEOUT,
+                 read_timeout: float = READ_TIMEOUT, max_attempts: int = MAX_ATTEMPTS,
+                 backoff: float = 0.5, chunk_size: int = 256 * 1024):
+        """
+        Args:
+            pool_size (int): The number of connections kept open per host.
+            connect_timeout (float): Seconds to wait for a connection.
+            read_timeout (float): Seconds to wait for each read from the server.
+            max_attempts (int): Attempts per download, including the first.
+            backoff (float): Seconds before the first retry; doubled for each later one.
+            chunk_size (int): Bytes read and written at a time.
+        """
+        # Imported on first use, so starting the server does not pay for it.
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.chunk_size = chunk_size
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._retryable_errors = (requests.ConnectionError, requests.Timeout,
+                                  requests.exceptions.ChunkedEncodingError, _Retryable)
+        self._lock = threading.Lock()
+        self._stats = {"downloads": 0, "failed": 0, "bytes": 0, "retries": 0, "resumed": 0}
+
+    def download(self, url: str, output_path: str) -> dict:
+        """
+        Downloads a URL to `output_path`. The file only appears at that path
+        once it is complete.
+
+        Args:
+            url (str): The URL to download.
+            output_path (str): Where to save the file.
+
+        Returns:
+            dict: The saved file's 'path', 'bytes' and 'sha256', and the
+                  download's 'attempts', 'resumed' (Range resumes) and 'seconds'.
+
+        Raises:
+            DownloadError: If the file could not be downloaded completely.
+        """
+        start = time.perf_counter()
+        directory = os.path.dirname(os.path.abspath(output_path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".download-")
+        progress = {"received": 0, "total": None, "sha256": hashlib.sha256(), "resumed": 0, "encoded": False}
+        attempts = 0
+        try:
+            with os.fdopen(fd, "wb", buffering=self.chunk_size) as f:
+                while True:
+                    attempts += 1
+                    try:
+                        self._fetch(url, f, progress)
+                        break
+                    except self._retryable_errors as e:
+                        if attempts >= self.max_attempts:
+                            raise DownloadError(f"Gave up on {url} after {attempts} attempts: {e}") from e
+                        delay = self.backoff * 2 ** (attempts - 1)
+                        print(f"Download of {url} interrupted at {progress['received']} bytes ({e}); retrying in {delay:.1f}s.")
+                        with self._lock:
+                            self._stats["retries"] += 1
+                        time.sleep(delay)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, output_path)
+        except BaseException:
+            with self._lock:
+                self._stats["failed"] += 1
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        with self._lock:
+            self._stats["downloads"] += 1
+            self._stats["bytes"] += progress["received"]
+            self._stats["resumed"] += progress["resumed"]
+        return {
+            "path": output_path,
+            "bytes": progress["received"],
+            "sha256": progress["sha256"].hexdigest(),
+            "attempts": attempts,
+            "resumed": progress["resumed"],
+            "seconds": time.perf_counter() - start,
+        }
+
+    def _fetch(self, url: str, f, progress: dict):
+        """
+        Makes one attempt at the rest of a download, appending to `f`. When
+        bytes were already received, asks for the remainder with a Range
+        request; a server that ignores it sends the whole file, which then
+        replaces what was received.
+
+        Raises:
+            _Retryable: If the server is unavailable or the body ended early.
+            DownloadError: If the server refused the request.
+        """
+        offset = progress["received"]
+        # Sizes and Range offsets count the bytes on the wire, which are only
+        # the file's bytes when the body is not compressed in transit.
+        headers = {"Accept-Encoding": "identity"}
+        if offset and not progress["encoded"]:
+            headers["Range"] = f"bytes={offset}-"
+        response = self.session.get(url, stream=True, timeout=self.timeout, headers=headers)
+        try:
+            if response.status_code in RETRYABLE_STATUSES:
+                raise _Retryable(f"HTTP {response.status_code}")
+            if response.status_code == 416 and offset and offset == progress["total"]:
+                return  # Everything had already arrived.
+            if response.status_code >= 400:
+                raise DownloadError(f"HTTP {response.status_code} for {url}")
+
+            if offset and response.status_code == 206:
+                content_range = response.headers.get("Content-Range", "")
+                if not content_range.startswith(f"bytes {offset}-"):
+                    raise DownloadError(f"Unexpected Content-Range '{content_range}' for {url}")
+                size = content_range.rpartition("/")[2]
+                progress["total"] = int(size) if size.isdigit() else progress["total"]
+                progress["resumed"] += 1
+            else:
+                if offset:
+                    # The server ignored the Range header and is sending the whole file.
+                    f.seek(0)
+                    f.truncate()
+                    progress["received"] = 0
+                    progress["sha256"] = hashlib.sha256()
+                length = response.headers.get("Content-Length")
+                progress["total"] = int(length) if length and length.isdigit() else None
+                if response.headers.get("Content-Encoding", "identity").lower() != "identity":
+                    # Compressed anyway: the received (decoded) bytes cannot be checked
+                    # against the length, and a retry starts over instead of resuming.
+                    progress["encoded"] = True
+                    progress["total"] = None
+
+            for chunk in response.iter_content(chunk_size=self.chunk_size):
+                f.write(chunk)
+                progress["sha256"].update(chunk)
+                progress["received"] += len(chunk)
+        finally:
+            response.close()
+
+        if progress["total"] is not None and progress["received"] != progress["total"]:
+            if progress["received"] > progress["total"]:
+                raise DownloadError(f"Received {progress['received']} bytes of {progress['total']} from {url}")
+            raise _Retryable(f"body ended at {progress['received']} of {progress['total']} bytes")
+
+    def stats(self) -> dict:
+        """Returns counts of finished and failed downloads, bytes received, retries and resumes."""
+        with self._lock:
+            return dict(self._stats)
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_downloader() -> Downloader:
+    """Returns the process-wide Downloader, creating it on first use."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = Downloader()
+        return _shared
+
+
+def stats() -> dict:
+    """Returns the shared Downloader's stats, without creating it."""
+    with _shared_lock:
+        downloader = _shared
+    if downloader is None:
+        return {"downloads": 0, "failed": 0, "bytes": 0, "retries": 0, "resumed": 0}
+    return downloader.stats()
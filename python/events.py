@@ -0,0 +1,58 @@
+# _implementation/python/events.py
+# This file defines the staged events that nodes emit while a command runs
+# (routing decision, spoken text, audio-engine action, progress). A streaming
+# request installs a sink for the duration of the command; everywhere else
+# emitting an event is a cheap no-op.
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_event_sink = ContextVar("event_sink", default=None)
+
+
+def emit_event(event: str, data: dict):
+    """
+    Sends an event to the current command's sink, if one is installed.
+    Safe to call from executor threads; the sink is responsible for handing
+    the event back to the event loop.
+
+    Args:
+        event (str): The event name, e.g. "route", "action" or "progress".
+        data (dict): A JSON-serializable payload.
+    """
+    sink = _event_sink.get()
+    if sink is not None:
+        sink(event, data)
+
+
+def emit_response(response: dict):
+    """
+    Emits a node's response as soon as it is known, before it is persisted:
+    a "speak" event for the spoken text and an "action" event for the
+    audio-engine action.
+    """
+    if _event_sink.get() is None:
+        return
+    if "speak" in response:
+        emit_event("speak", {"speak": response["speak"]})
+    if "action" in response:
+        emit_event("action", {key: value for key, value in response.items() if key not in ("speak", "history_node_id")})
+
+
+def current_event_sink():
+    """Returns the installed sink, so work handed to another thread can keep emitting to it."""
+    return _event_sink.get()
+
+
+@contextmanager
+def capture_events(sink):
+    """
+    Installs `sink(event, data)` as the event sink for the current context.
+    Contexts copied from this one (asyncio tasks, executor calls made through
+    executors.run_blocking) inherit it.
+    """
+    token = _event_sink.set(sink)
+    try:
+        yield
+    finally:
+        _event_sink.reset(token)
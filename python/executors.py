@@ -0,0 +1,48 @@
+# _implementation/python/executors.py
+# This file defines the bounded thread pool that blocking history work runs
+# on, so the FastAPI event loop never waits on SQLite. Music generation runs
+# on the GenerationJobQueue's own pool (see generation_jobs.py), so a burst of
+# slow generations cannot delay the record/stop path. Audio analysis for
+# suggestions has a pool of its own for the same reason.
+
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+HISTORY_WORKERS = int(os.environ.get("JAM_HISTORY_WORKERS", "4"))
+GENERATION_WORKERS = int(os.environ.get("JAM_GENERATION_WORKERS", "2"))
+ANALYSIS_WORKERS = int(os.environ.get("JAM_ANALYSIS_WORKERS", "2"))
+
+history_executor = ThreadPoolExecutor(max_workers=HISTORY_WORKERS, thread_name_prefix="history")
+analysis_executor = ThreadPoolExecutor(max_workers=ANALYSIS_WORKERS, thread_name_prefix="analysis")
+
+
+async def run_blocking(executor: ThreadPoolExecutor, func, *args, **kwargs):
+    """
+    Runs a blocking function on the given executor and awaits its result.
+    The caller's context variables (such as the event sink) are carried over.
+
+    Args:
+        executor (ThreadPoolExecutor): The pool to run the function on.
+        func: The blocking callable.
+        *args, **kwargs: Arguments for the callable.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(executor, partial(context.run, func, *args, **kwargs))
+
+
+def offload(func, executor: ThreadPoolExecutor):
+    """
+    Wraps a blocking LangGraph node function in an async node that runs it on
+    the given executor.
+
+    Args:
+        func: The blocking node function, taking the graph state.
+        executor (ThreadPoolExecutor): The pool to run the node on.
+    """
+    async def node(state):
+        return await run_blocking(executor, func, state)
+    return node
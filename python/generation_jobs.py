@@ -0,0 +1,558 @@
+# _implementation/python/generation_jobs.py
+# This file defines the GenerationJobQueue, which runs music generation in the
+# background. A /command that asks for new music returns as soon as its job is
+# queued; a bounded worker pool calls Replicate and downloads the audio, and
+# the new track is committed to history when the job finishes, on top of
+# whatever the session committed in the meantime.
+#
+# The queue can also generate speculatively: when a suggestion proposes some
+# music, its audio is generated in the background, within a budget, so that a
+# "yes" picks up the finished file (or joins the running generation) instead
+# of starting a new multi-second Replicate call.
+#
+# An utterance that asks for several tracks becomes one group job: its
+# generations run concurrently on a fan-out pool, and the tracks that finish
+# before the deadline are committed together as a single history node.
+
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from events import capture_events, current_event_sink, emit_event
+from intent_parser import normalize_command
+from nodes.music_generation_node import add_generated_tracks, generate_and_download_music, generate_track
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class GenerationJobQueue:
+    """
+    Runs music generation jobs on a bounded worker pool and keeps their status
+    for polling. Jobs are plain dicts, so a status snapshot can be returned
+    straight from the HTTP endpoints.
+    """
+    def __init__(self, history, audio_cache=None, max_workers: int = 2, max_retained: int = 256,
+                 speculative_limit: int = 0, speculative_budget: int = 20, speculative_ttl: float = 600.0,
+                 fanout_limit: int = 4, fanout_deadline: float = 120.0):
+        """
+        Args:
+            history: The HistoryManager finished generations are committed to.
+            audio_cache (AudioCache | None): The cache repeat prompts are served from.
+            max_workers (int): The number of generations that may run at once.
+            max_retained (int): The number of finished jobs kept for polling.
+            speculative_limit (int): The most speculative generations held at once, running
+                                     or waiting to be claimed. 0 disables speculation.
+            speculative_budget (int): The most speculative generations started per hour.
+            speculative_ttl (float): Seconds an unclaimed speculative result is kept before
+                                     it is discarded and counted as wasted.
+            fanout_limit (int): The number of a group job's generations that may run at once.
+            fanout_deadline (float): Seconds a group job waits for its generations before it
+                                     commits the tracks that are ready and gives up on the rest.
+        """
+        self.history = history
+        self.audio_cache = audio_cache
+        self.max_workers = max_workers
+        self.max_retained = max_retained
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="generation")
+        self._jobs = OrderedDict()
+        # job ID -> the HistoryManager an unfinished job will commit to.
+        self._job_histories = {}
+        self._lock = threading.Lock()
+        self._completed = 0
+        self._failed = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._total_run = 0.0
+        self._max_run = 0.0
+
+        self.speculative_limit = speculative_limit
+        self.speculative_budget = speculative_budget
+        self.speculative_ttl = speculative_ttl
+        # Speculative generations run on their own pool, so they never take a
+        # worker from a generation the user actually asked for.
+        self._speculative_executor = (ThreadPoolExecutor(max_workers=speculative_limit, thread_name_prefix="speculative")
+                                      if speculative_limit > 0 else None)
+        self._speculative = OrderedDict()  # normalized prompt -> speculative entry
+        self._speculative_starts = deque()  # start times within the last hour, for the budget
+        self._suggestions = OrderedDict()  # history node ID -> prompt of the last suggestion made there
+        self._speculation = {"started": 0, "hits": 0, "joined": 0, "released": 0, "wasted": 0, "failed": 0,
+                             "over_budget": 0, "over_limit": 0}
+
+        self.fanout_limit = fanout_limit
+        self.fanout_deadline = fanout_deadline
+        # The generations of group jobs run here; the group itself holds no thread
+        # while it waits, so a group never takes a worker from a single job.
+        self._fanout_executor = ThreadPoolExecutor(max_workers=fanout_limit, thread_name_prefix="fanout")
+
+    def submit(self, state: dict, prompt: str, history=None) -> dict:
+        """
+        Queues a generation for the given session state. If the same prompt
+        was generated speculatively, the job claims that result (or waits for
+        that generation to finish) instead of generating again.
+
+        Args:
+            state (dict): The session state the new track should be added to.
+            prompt (str): The text prompt for the music generation.
+            history: The HistoryManager of the state's project. Defaults to the queue's.
+
+        Returns:
+            dict: A status snapshot of the new job. Its 'speculative' field is
+                  'hit' or 'joined' when it reuses a speculative generation.
+        """
+        job_id = str(uuid.uuid4())
+        snapshot = state.copy()  # The track store is immutable, so it is safe to share.
+        speculative = self._claim_speculative(prompt)
+        job = {
+            "job_id": job_id,
+            "status": QUEUED,
+            "prompt": prompt,
+            "parent_node_id": state.get("history_node_id"),
+            "output_path": f"generated_track_{state['next_track_id']}_{job_id[:8]}.mp3",
+            "submitted_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "result": None,
+            "speculative": speculative["claim"] if speculative else None,
+        }
+        history = history or self.history
+        with self._lock:
+            self._jobs[job_id] = job
+            self._job_histories[job_id] = history
+            snapshot_job = dict(job)
+        self._executor.submit(self._run, job, snapshot, self._job_sink(job_id, current_event_sink()), speculative)
+        print(f"Queued generation job {job_id} for prompt: {prompt}")
+        return snapshot_job
+
+    def submit_group(self, state: dict, prompts: list[str], history=None, deadline: float | None = None) -> dict:
+        """
+        Queues one job that generates a track for each prompt. The generations
+        run concurrently (up to `fanout_limit` at a time), so the job takes
+        about as long as the slowest of them. When all have finished, or the
+        deadline passes, the tracks that succeeded are added to the state and
+        committed as one history node. The outcome of each generation is
+        reported in the job's 'generations' list.
+
+        Args:
+            state (dict): The session state the new tracks should be added to.
+            prompts (list[str]): The text prompts, one per track, in order.
+            history: The HistoryManager of the state's project. Defaults to the queue's.
+            deadline (float | None): Seconds to wait for the generations. Defaults to `fanout_deadline`.
+
+        Returns:
+            dict: A status snapshot of the new job.
+        """
+        job_id = str(uuid.uuid4())
+        snapshot = state.copy()
+        deadline = self.fanout_deadline if deadline is None else deadline
+        job = {
+            "job_id": job_id,
+            "status": QUEUED,
+            "prompt": "; ".join(prompts),
+            "parent_node_id": state.get("history_node_id"),
+            "output_path": None,
+            "submitted_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "result": None,
+            "speculative": None,
+            "deadline_at": time.time() + deadline,
+            "generations": [{
+                "prompt": prompt,
+                "status": QUEUED,
+                "output_path": f"generated_track_{state['next_track_id'] + index}_{job_id[:8]}.mp3",
+                "track_id": None,
+                "error": None,
+            } for index, prompt in enumerate(prompts)],
+        }
+        sink = self._job_sink(job_id, current_event_sink())
+        timer = threading.Timer(deadline, self._finish_group, args=(job, snapshot, sink))
+        timer.daemon = True
+        job["_timer"] = timer
+        with self._lock:
+            self._jobs[job_id] = job
+            self._job_histories[job_id] = history or self.history
+            snapshot_job = self._snapshot(job)
+        timer.start()
+        for index, generation in enumerate(job["generations"]):
+            speculative = self._claim_speculative(generation["prompt"])
+            member_sink = (lambda event, data, index=index: sink(event, {**data, "track": index})) if sink else None
+            self._fanout_executor.submit(self._run_generation, job, generation, snapshot, member_sink, sink, speculative)
+        print(f"Queued group generation job {job_id} for {len(prompts)} prompts: {job['prompt']}")
+        return snapshot_job
+
+    def suggest(self, state: dict, prompt: str) -> bool:
+        """
+        Records music suggested from a session state, so that accepting the
+        suggestion (see take_suggestion) knows what to generate, and starts
+        generating it speculatively if the limit and budget allow.
+
+        Args:
+            state (dict): The session state the suggestion was made from.
+            prompt (str): The generation prompt for the suggested music.
+
+        Returns:
+            bool: True if the suggested music is being (or has been) generated speculatively.
+        """
+        with self._lock:
+            self._suggestions[state.get("history_node_id")] = prompt
+            while len(self._suggestions) > self.max_retained:
+                self._suggestions.popitem(last=False)
+        if self._speculative_executor is None:
+            return False
+
+        key = normalize_command(prompt)
+        now = time.time()
+        with self._lock:
+            self._expire_speculative(now)
+            if key in self._speculative:
+                return True
+            if len(self._speculative) >= self.speculative_limit:
+                self._speculation["over_limit"] += 1
+                return False
+            if len(self._speculative_starts) >= self.speculative_budget:
+                self._speculation["over_budget"] += 1
+                return False
+            entry = {
+                "prompt": prompt,
+                "output_path": f"speculative_{uuid.uuid4().hex[:8]}.mp3",
+                "status": RUNNING,
+                "started_at": now,
+                "finished_at": None,
+            }
+            entry["future"] = self._speculative_executor.submit(self._run_speculative, entry)
+            self._speculative[key] = entry
+            self._speculative_starts.append(now)
+            self._speculation["started"] += 1
+        print(f"Started speculative generation for prompt: {prompt}")
+        return True
+
+    def has_suggestion(self, history_node_id: str | None) -> bool:
+        """Returns True if music was suggested from a history node and not yet taken."""
+        with self._lock:
+            return history_node_id in self._suggestions
+
+    def take_suggestion(self, history_node_id: str | None) -> str | None:
+        """
+        Returns (and forgets) the prompt of the last music suggested from a
+        history node, or None if nothing was suggested there.
+        """
+        with self._lock:
+            return self._suggestions.pop(history_node_id, None)
+
+    def _run_speculative(self, entry: dict) -> bool:
+        """Generates a speculative entry's audio on the speculative pool."""
+        try:
+            succeeded = generate_and_download_music(entry["prompt"], entry["output_path"], cache=self.audio_cache)
+        except Exception as e:
+            print(f"Speculative generation failed: {e}")
+            succeeded = False
+        with self._lock:
+            entry["status"] = SUCCEEDED if succeeded else FAILED
+            entry["finished_at"] = time.time()
+            if not succeeded:
+                self._speculation["failed"] += 1
+                if self._speculative.get(normalize_command(entry["prompt"])) is entry:
+                    del self._speculative[normalize_command(entry["prompt"])]
+        return succeeded
+
+    def _claim_speculative(self, prompt: str) -> dict | None:
+        """
+        Takes the speculative generation for a prompt, if there is one that
+        has not failed, and counts it as a hit (finished) or a join (running).
+        """
+        with self._lock:
+            self._expire_speculative(time.time())
+            entry = self._speculative.pop(normalize_command(prompt), None)
+            if entry is None:
+                return None
+            entry["claim"] = "hit" if entry["status"] == SUCCEEDED else "joined"
+            self._speculation["hits" if entry["claim"] == "hit" else "joined"] += 1
+            return entry
+
+    def _release_speculative(self, entry: dict | None):
+        """
+        Returns a claimed speculative generation that its job ended up not
+        using (a group job passed its deadline first) to the pool. It can be
+        claimed again, and is discarded like any unclaimed result once its
+        TTL has run out.
+        """
+        if entry is None:
+            return
+        key = normalize_command(entry["prompt"])
+        with self._lock:
+            self._speculation["hits" if entry.pop("claim") == "hit" else "joined"] -= 1
+            self._speculation["released"] += 1
+            if entry["status"] == FAILED:
+                return
+            if key not in self._speculative:
+                if entry["finished_at"] is not None:
+                    entry["finished_at"] = time.time()  # Its TTL starts again.
+                self._speculative[key] = entry
+                return
+            self._speculation["wasted"] += 1
+
+        # A newer speculation for the same prompt took its place.
+        def discard(_):
+            try:
+                os.remove(entry["output_path"])
+            except OSError:
+                pass
+        entry["future"].add_done_callback(discard)
+
+    def _expire_speculative(self, now: float):
+        """
+        Discards finished speculative results nobody claimed within the TTL,
+        and forgets budget entries older than an hour. Must hold the lock.
+        """
+        while self._speculative_starts and now - self._speculative_starts[0] > 3600:
+            self._speculative_starts.popleft()
+        for key, entry in list(self._speculative.items()):
+            if entry["status"] == SUCCEEDED and now - entry["finished_at"] > self.speculative_ttl:
+                del self._speculative[key]
+                self._speculation["wasted"] += 1
+                try:
+                    os.remove(entry["output_path"])
+                except OSError:
+                    pass
+
+    @staticmethod
+    def _job_sink(job_id: str, sink):
+        """
+        Wraps the submitting command's event sink (if it is streaming) so the
+        job's events reach it tagged with the job ID.
+        """
+        if sink is None:
+            return None
+        return lambda event, data: sink(event, {**data, "job_id": job_id})
+
+    def _run(self, job: dict, state: dict, sink=None, speculative: dict | None = None):
+        """Runs one job on a worker thread and records its outcome."""
+        with capture_events(sink):
+            self._execute(job, state, speculative)
+
+    def _execute(self, job: dict, state: dict, speculative: dict | None = None):
+        """Generates the track (or claims a speculative one) and records the job's outcome and timings."""
+        with self._lock:
+            job["status"] = RUNNING
+            job["started_at"] = time.time()
+        emit_event("progress", {"stage": RUNNING})
+        try:
+            pregenerated = self._take_speculative(speculative, job["output_path"])
+            with self._lock:
+                history = self._job_histories[job["job_id"]]
+            new_state = generate_track(state, job["prompt"], job["output_path"], history, cache=self.audio_cache,
+                                       pregenerated=pregenerated, requested_at=job["submitted_at"])
+            result = dict(new_state["response"])
+            succeeded = result.get("action") == "add_new_track"
+            if succeeded:
+                result["history_node_id"] = new_state["history_node_id"]
+        except Exception as e:
+            print(f"Generation job {job['job_id']} failed: {e}")
+            succeeded = False
+            result = {"speak": "I wasn't able to create any music right now."}
+
+        with self._lock:
+            job["status"] = SUCCEEDED if succeeded else FAILED
+            job["finished_at"] = time.time()
+            job["result"] = result
+            self._job_histories.pop(job["job_id"], None)
+            wait = job["started_at"] - job["submitted_at"]
+            run = job["finished_at"] - job["started_at"]
+            self._completed += succeeded
+            self._failed += not succeeded
+            self._total_wait += wait
+            self._max_wait = max(self._max_wait, wait)
+            self._total_run += run
+            self._max_run = max(self._max_run, run)
+            self._evict_finished()
+        print(f"Generation job {job['job_id']} {job['status']} in {run:.2f}s (waited {wait:.2f}s)")
+        emit_event("job_result", {"status": job["status"], "result": result})
+
+    @staticmethod
+    def _take_speculative(speculative: dict | None, output_path: str) -> bool:
+        """
+        Waits for a claimed speculative generation and moves its audio to
+        `output_path`. Returns True if there was audio to take.
+        """
+        if speculative is None or not speculative["future"].result():
+            return False
+        os.replace(speculative["output_path"], output_path)
+        emit_event("progress", {"stage": "speculative_" + speculative["claim"]})
+        return True
+
+    def _run_generation(self, job: dict, generation: dict, state: dict, sink=None, job_sink=None,
+                        speculative: dict | None = None):
+        """Runs one generation of a group job on the fan-out pool, then finishes the group if it was the last."""
+        with self._lock:
+            if job["status"] == QUEUED:
+                job["status"] = RUNNING
+                job["started_at"] = time.time()
+            timed_out = job["finished_at"] is not None
+            if not timed_out:
+                generation["status"] = RUNNING
+        if timed_out:
+            self._release_speculative(speculative)
+            return
+        pregenerated = False
+        with capture_events(sink):
+            emit_event("progress", {"stage": RUNNING})
+            try:
+                pregenerated = self._take_speculative(speculative, generation["output_path"])
+                succeeded = pregenerated or generate_and_download_music(generation["prompt"], generation["output_path"],
+                                                                        cache=self.audio_cache)
+                error = None if succeeded else "generation failed"
+            except Exception as e:
+                print(f"Generation of '{generation['prompt']}' in job {job['job_id']} failed: {e}")
+                succeeded, error = False, str(e)
+        with self._lock:
+            late = job["finished_at"] is not None
+            if not late:
+                generation["status"] = SUCCEEDED if succeeded else FAILED
+                generation["error"] = error
+            remaining = sum(1 for g in job["generations"] if g["status"] in (QUEUED, RUNNING))
+        if late:
+            # The group gave up on this generation at its deadline; its audio is not used.
+            if pregenerated:
+                os.replace(generation["output_path"], speculative["output_path"])
+                self._release_speculative(speculative)
+            elif succeeded:
+                try:
+                    os.remove(generation["output_path"])
+                except OSError:
+                    pass
+            return
+        if remaining == 0:
+            self._finish_group(job, state, job_sink)
+
+    def _finish_group(self, job: dict, state: dict, sink=None):
+        """
+        Commits the tracks of a group job's finished generations as one history
+        node and records the job's outcome. Runs once: when the last generation
+        finishes, or at the deadline, whichever comes first. Generations still
+        queued or running at the deadline are reported as failed.
+        """
+        with self._lock:
+            if job["finished_at"] is not None:
+                return
+            job["finished_at"] = time.time()
+            for generation in job["generations"]:
+                if generation["status"] in (QUEUED, RUNNING):
+                    generation["status"] = FAILED
+                    generation["error"] = "deadline exceeded"
+            history = self._job_histories[job["job_id"]]
+        job["_timer"].cancel()
+
+        with capture_events(sink):
+            succeeded_generations = [g for g in job["generations"] if g["status"] == SUCCEEDED]
+            failed_prompts = [g["prompt"] for g in job["generations"] if g["status"] == FAILED]
+            try:
+                new_state = add_generated_tracks(state, [g["output_path"] for g in succeeded_generations],
+                                                 history, failed_prompts=failed_prompts,
+                                                 requested_at=job["submitted_at"])
+                result = dict(new_state["response"])
+                succeeded = bool(succeeded_generations)
+                if succeeded:
+                    result["history_node_id"] = new_state["history_node_id"]
+            except Exception as e:
+                print(f"Group generation job {job['job_id']} failed: {e}")
+                succeeded = False
+                result = {"speak": "I wasn't able to create any music right now."}
+
+            with self._lock:
+                if succeeded:
+                    for generation, action in zip(succeeded_generations, result["actions"]):
+                        generation["track_id"] = action["track"]["id"]
+                result["generations"] = [{key: g[key] for key in ("prompt", "status", "track_id", "error")}
+                                         for g in job["generations"]]
+                job["status"] = SUCCEEDED if succeeded else FAILED
+                job["started_at"] = job["started_at"] or job["finished_at"]
+                job["result"] = result
+                self._job_histories.pop(job["job_id"], None)
+                wait = job["started_at"] - job["submitted_at"]
+                run = job["finished_at"] - job["started_at"]
+                self._completed += succeeded
+                self._failed += not succeeded
+                self._total_wait += wait
+                self._max_wait = max(self._max_wait, wait)
+                self._total_run += run
+                self._max_run = max(self._max_run, run)
+                self._evict_finished()
+            print(f"Group generation job {job['job_id']} {job['status']}: {len(succeeded_generations)} of "
+                  f"{len(job['generations'])} tracks in {run:.2f}s (waited {wait:.2f}s)")
+            emit_event("job_result", {"status": job["status"], "result": result})
+
+    def _evict_finished(self):
+        """Drops the oldest finished jobs beyond `max_retained`. Must hold the lock."""
+        finished = [job_id for job_id, job in self._jobs.items() if job["status"] in (SUCCEEDED, FAILED)]
+        for job_id in finished[:max(len(finished) - self.max_retained, 0)]:
+            del self._jobs[job_id]
+
+    def pending_for(self, history) -> int:
+        """Returns the number of unfinished jobs that will commit to the given HistoryManager."""
+        with self._lock:
+            return sum(1 for job_history in self._job_histories.values() if job_history is history)
+
+    def get(self, job_id: str) -> dict | None:
+        """
+        Returns a status snapshot of a job, or None if it is unknown or was evicted.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return self._snapshot(job) if job else None
+
+    @staticmethod
+    def _snapshot(job: dict) -> dict:
+        """Returns a copy of a job for callers, without its internal ('_') fields."""
+        snapshot = {key: value for key, value in job.items() if not key.startswith("_")}
+        if "generations" in snapshot:
+            snapshot["generations"] = [dict(generation) for generation in snapshot["generations"]]
+        return snapshot
+
+    def stats(self) -> dict:
+        """
+        Returns queue depth, in-flight count and wait/run time aggregates, for
+        sizing the worker pool.
+        """
+        with self._lock:
+            statuses = [job["status"] for job in self._jobs.values()]
+            finished = self._completed + self._failed
+            return {
+                "max_workers": self.max_workers,
+                "queued": statuses.count(QUEUED),
+                "running": statuses.count(RUNNING),
+                "succeeded": self._completed,
+                "failed": self._failed,
+                "avg_wait_seconds": self._total_wait / finished if finished else 0.0,
+                "max_wait_seconds": self._max_wait,
+                "avg_run_seconds": self._total_run / finished if finished else 0.0,
+                "max_run_seconds": self._max_run,
+                "speculation": self._speculation_stats(),
+            }
+
+    def _speculation_stats(self) -> dict:
+        """
+        Returns the speculative generation counters. The hit rate is the share
+        of speculative generations a later request used. Must hold the lock.
+        """
+        self._expire_speculative(time.time())
+        claimed = self._speculation["hits"] + self._speculation["joined"]
+        return {
+            **self._speculation,
+            "enabled": self._speculative_executor is not None,
+            "pending": len(self._speculative),
+            "budget_remaining": max(self.speculative_budget - len(self._speculative_starts), 0),
+            "hit_rate": claimed / self._speculation["started"] if self._speculation["started"] else 0.0,
+        }
+
+    def shutdown(self, wait: bool = True):
+        """Stops accepting jobs and, by default, waits for running ones to finish."""
+        self._executor.shutdown(wait=wait)
+        self._fanout_executor.shutdown(wait=wait)
+        if self._speculative_executor is not None:
+            self._speculative_executor.shutdown(wait=wait)
@@ -0,0 +1,131 @@
+# _implementation/python/history_cli.py
+# This file is a small command-line tool for maintaining a project's
+# history database outside of the running server.
+#
+# Usage:
+#   python history_cli.py migrate project.db --storage delta --keyframe-interval 32
+#   python history_cli.py migrate project.db --storage full --codec binary+zlib
+#   python history_cli.py compact project.db --keep-recent 500
+#   python history_cli.py export project.db --output backup.ndjson [--node NODE_ID]
+#   python history_cli.py import restored.db backup.ndjson
+#   python history_cli.py branches project.db [--name verse NODE_ID]
+
+import argparse
+import sys
+import time
+
+from history_manager import HistoryManager, STORAGE_MODES
+from history_transfer import export_lines, chunked, import_lines
+from snapshot_codec import CODECS
+
+
+def migrate(args):
+    """
+    Re-encodes an existing history database in the requested storage mode and
+    codec. Without --codec, the database keeps the codec it was written with.
+    """
+    history = HistoryManager(args.database)
+    try:
+        converted = history.convert_storage(args.storage, keyframe_interval=args.keyframe_interval,
+                                            snapshot_codec=args.codec or history.stored_codec())
+        print(f"Re-encoded {converted} history nodes as '{args.storage}' snapshots with the '{history.codec.name}' codec.")
+    finally:
+        history.close()
+
+
+def compact(args):
+    """Prunes abandoned history branches and releases the space they used."""
+    history = HistoryManager(args.database)
+    try:
+        stats = history.compact(heads=args.head, keep_recent=args.keep_recent, archive=not args.no_archive,
+                                batch_size=args.batch_size)
+        print(f"Kept {stats['kept']} history nodes, archived {stats['archived']}, discarded {stats['discarded']}; "
+              f"released {stats['pages_freed']} pages.")
+    finally:
+        history.close()
+
+
+def export(args):
+    """Writes the history (or the path to one node) as newline-delimited JSON."""
+    history = HistoryManager(args.database)
+    output = open(args.output, "w", encoding="utf-8") if args.output != "-" else sys.stdout
+    try:
+        for chunk in chunked(export_lines(history, node_id=args.node, page_size=args.batch_size)):
+            output.write(chunk)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        history.close()
+
+
+def import_(args):
+    """Adds the nodes of an export to a database, which is created if it does not exist."""
+    history = HistoryManager(args.database, snapshot_codec=args.codec)
+    source = open(args.input, "rb") if args.input != "-" else sys.stdin.buffer
+    try:
+        totals = import_lines(history, source, batch_size=args.batch_size)
+        print(f"Imported {totals['imported']} history nodes; skipped {totals['skipped']} that already existed.")
+    finally:
+        if source is not sys.stdin.buffer:
+            source.close()
+        history.close()
+
+
+def branches(args):
+    """Lists the branches of the history, after naming one if asked to."""
+    history = HistoryManager(args.database)
+    try:
+        if args.name:
+            history.name_branch(*args.name)
+        for branch in history.list_branches():
+            updated = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(branch["updated_at"]))
+            print(f"{branch['branch']:<24} {branch['node_id']}  {updated}{'  (named)' if branch['named'] else ''}")
+    finally:
+        history.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintenance commands for a JamSession history database.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = subparsers.add_parser("migrate", help="Convert the snapshot storage format of a database.")
+    migrate_parser.add_argument("database", help="Path to the project database, e.g. project.db.")
+    migrate_parser.add_argument("--storage", choices=STORAGE_MODES, default="delta", help="The target storage mode.")
+    migrate_parser.add_argument("--keyframe-interval", type=int, default=32, help="Maximum delta chain length in delta mode.")
+    migrate_parser.add_argument("--codec", choices=tuple(CODECS), default=None,
+                                help="The snapshot encoding to write. Defaults to the one the database already uses.")
+    migrate_parser.set_defaults(func=migrate)
+
+    compact_parser = subparsers.add_parser("compact", help="Prune abandoned branches and vacuum the database.")
+    compact_parser.add_argument("database", help="Path to the project database, e.g. project.db.")
+    compact_parser.add_argument("--head", action="append", help="A node to keep reachable (repeatable). Defaults to the most recent node and the named branches.")
+    compact_parser.add_argument("--keep-recent", type=int, default=500, help="Also keep the ancestry of this many most recent nodes.")
+    compact_parser.add_argument("--no-archive", action="store_true", help="Discard pruned nodes instead of archiving them.")
+    compact_parser.add_argument("--batch-size", type=int, default=200, help="Nodes removed per transaction.")
+    compact_parser.set_defaults(func=compact)
+
+    export_parser = subparsers.add_parser("export", help="Stream the history out as newline-delimited JSON.")
+    export_parser.add_argument("database", help="Path to the project database, e.g. project.db.")
+    export_parser.add_argument("--output", default="-", help="The file to write. Defaults to standard output.")
+    export_parser.add_argument("--node", help="Export only the path from the root to this node.")
+    export_parser.add_argument("--batch-size", type=int, default=500, help="Nodes read from the database at a time.")
+    export_parser.set_defaults(func=export)
+
+    import_parser = subparsers.add_parser("import", help="Add the nodes of an export to a database, in one transaction.")
+    import_parser.add_argument("database", help="Path to the project database; created if it does not exist.")
+    import_parser.add_argument("input", nargs="?", default="-", help="The export to read. Defaults to standard input.")
+    import_parser.add_argument("--codec", choices=tuple(CODECS), default="json", help="The snapshot encoding to write.")
+    import_parser.add_argument("--batch-size", type=int, default=500, help="Nodes inserted per statement.")
+    import_parser.set_defaults(func=import_)
+
+    branches_parser = subparsers.add_parser("branches", help="List the branches of the history, most recent first.")
+    branches_parser.add_argument("database", help="Path to the project database, e.g. project.db.")
+    branches_parser.add_argument("--name", nargs=2, metavar=("NAME", "NODE_ID"), help="Name the branch ending at a node first.")
+    branches_parser.set_defaults(func=branches)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,151 @@
 
 import sqlite3
 import json
+import threading
+import time
 import uuid
+import zlib
+from contextlib import nullcontext
+from functools import wraps
+from collections import OrderedDict
+
+from metrics import instrument
+from snapshot_codec import FIRST_BYTE_CODECS, get_codec, decode_snapshot
+from snapshot_delta import diff_states, apply_delta
+from track_store import TrackStore
+
+STORAGE_MODES = ("full", "delta")
+
+# Applied to every connection in performance mode. WAL lets readers run
+# alongside the writer, and synchronous=NORMAL only fsyncs at checkpoints.
+PERFORMANCE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16384",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+
+# Deltas smaller than this are stored without first encoding the full state
+# to check that the delta is the smaller of the two. Skipping that check keeps
+# a one-track tweak from paying for serializing every track.
+SMALL_DELTA_BYTES = 1024
+
+# The recursive step that extends a CTE named keep(node_id) with the parents
+# of the nodes already in it, so it ends up holding their full ancestry.
+_PARENT_STEP = "SELECT s.parent_id FROM state_tree s JOIN keep ON s.node_id = keep.node_id WHERE s.parent_id IS NOT NULL"
+
+INSERT_NODE_SQL = "INSERT INTO state_tree (node_id, parent_id, state_snapshot, snapshot_kind, keyframe_distance) VALUES (?, ?, ?, ?, ?)"
+
+
+def _copy_state(value):
+    """
+    Copies a JSON-shaped value (dicts, lists and scalars). Much cheaper than
+    copy.deepcopy for state snapshots, which only ever hold JSON types.
+    A TrackStore is immutable, so it is shared rather than copied.
+    """
+    if isinstance(value, TrackStore):
+        return value
+    if isinstance(value, dict):
+        return {key: _copy_state(item) if isinstance(item, (dict, list)) else item for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy_state(item) if isinstance(item, (dict, list)) else item for item in value]
+    return value
+
+def _serialized(method):
+    """
+    Serializes a method that writes to the database, so history work running
+    on several executor threads never interleaves transactions.
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._conn_lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+def _reader(method):
+    """
+    Guards a read-only method. Reads share the writers' lock when all threads
+    use one connection; in performance mode each thread has its own
+    connection and WAL lets reads run without it.
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._read_guard():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class _GroupCommitWriter:
+    """
+    Batches node inserts from concurrent commits into a single transaction.
+    Each commit queues its insert and then competes for the write lock; the
+    winner (the "leader") writes every insert queued so far in one transaction,
+    so commits that arrived while the previous transaction was running share
+    the next one. A commit returns only once its insert is written, so it is
+    exactly as durable as an unbatched commit.
+    """
+    def __init__(self, manager, window: float = 0.0, max_batch: int = 256):
+        """
+        Args:
+            manager (HistoryManager): The manager whose database is written to.
+            window (float): Extra time, in seconds, a leader waits for more inserts
+                            to join its batch. 0 batches only what is already queued.
+            max_batch (int): The maximum number of inserts per transaction.
+        """
+        self.manager = manager
+        self.window = window
+        self.max_batch = max_batch
+        self.batches = 0
+        self.rows = 0
+        self._pending = []
+        self._pending_lock = threading.Lock()
+
+    def write(self, row: tuple):
+        """Queues one insert and blocks until the batch containing it is committed."""
+        item = {"row": row, "done": False, "error": None}
+        with self._pending_lock:
+            self._pending.append(item)
+        while not item["done"]:
+            with self.manager._conn_lock:
+                if item["done"]:
+                    break
+                if self.window > 0:
+                    time.sleep(self.window)
+                with self._pending_lock:
+                    batch = self._pending[:self.max_batch]
+                    del self._pending[:self.max_batch]
+                self._flush(batch)
+        if item["error"]:
+            raise item["error"]
+
+    def _flush(self, batch: list):
+        """Writes a batch in one transaction. Must hold the manager's write lock."""
+        try:
+            conn = self.manager.conn
+            with conn:
+                conn.executemany(INSERT_NODE_SQL, [item["row"] for item in batch])
+                now = time.time()
+                for item in batch:
+                    self.manager._advance_heads(item["row"][0], item["row"][1], now)
+            self.batches += 1
+            self.rows += len(batch)
+        except Exception as e:
+            for item in batch:
+                item["error"] = e
+        finally:
+            for item in batch:
+                item["done"] = True
+
+    def close(self):
+        """Writes any inserts that are still queued."""
+        with self.manager._conn_lock:
+            with self._pending_lock:
+                batch, self._pending = self._pending, []
+            if batch:
+                self._flush(batch)
+
 
 class HistoryManager:
     """
@@ -14,39 +158,246 @@ class HistoryManager:
     This class abstracts the database operations for creating a state tree,
     allowing for undo functionality and preserving a non-linear history.
     """
-    def __init__(self, database_path):
+    def __init__(self, database_path, storage_mode: str = "full", keyframe_interval: int = 32, cache_size: int = 128,
+                 performance_mode: bool = False, group_commit: bool = False, group_commit_window: float = 0.0,
+                 snapshot_codec: str = "json"):
         """
         Initializes the HistoryManager with a path to a SQLite database.
 
         Args:
             database_path (str): The file path for the SQLite database.
+            storage_mode (str): "full" stores every node as a complete snapshot.
+                                "delta" stores each node as a delta against its parent,
+                                with a full keyframe every `keyframe_interval` nodes.
+            keyframe_interval (int): The maximum length of a delta chain in "delta" mode.
+            cache_size (int): The number of decoded states kept in the in-memory LRU cache.
+                              0 disables the cache.
+            performance_mode (bool): Enables WAL and the PERFORMANCE_PRAGMAS, and gives each
+                                     thread its own connection so reads run concurrently.
+            group_commit (bool): Batches the inserts of concurrent commits into shared
+                                 transactions (see _GroupCommitWriter).
+            group_commit_window (float): Extra time, in seconds, a group commit waits for
+                                         more inserts to join its transaction.
+            snapshot_codec (str): How new snapshots and deltas are encoded: "json", "binary"
+                                  or "binary+zlib" (see snapshot_codec.py). Rows written with
+                                  any codec can be read whatever the setting.
         """
+        if storage_mode not in STORAGE_MODES:
+            raise ValueError(f"Unknown storage mode '{storage_mode}'. Expected one of {STORAGE_MODES}.")
+        if keyframe_interval < 1:
+            raise ValueError("keyframe_interval must be at least 1.")
+        if cache_size < 0:
+            raise ValueError("cache_size cannot be negative.")
         self.database_path = database_path
-        self.conn = None
+        self.storage_mode = storage_mode
+        self.keyframe_interval = keyframe_interval
+        self.codec = get_codec(snapshot_codec)
+        self.cache_size = cache_size
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # node_id -> (parent_id, decoded state), most recently used last.
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._conn_lock = threading.RLock()
+        self.performance_mode = performance_mode
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._conn = None
+        self._next_take = None  # The number of the next "take-N" branch; read from the database on first use.
         self.connect()
         self.create_table()
+        self._group_writer = _GroupCommitWriter(self, group_commit_window) if group_commit else None
 
     def connect(self):
         """
-        Establishes a connection to the SQLite database.
+        Establishes a connection to the SQLite database. In performance mode
+        this connection belongs to the calling thread, and other threads open
+        their own on first use.
         """
-        self.conn = sqlite3.connect(self.database_path, check_same_thread=False)
+        conn = sqlite3.connect(self.database_path, check_same_thread=False)
+        if self.performance_mode:
+            for pragma in PERFORMANCE_PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+        else:
+            self._conn = conn
+        with self._connections_lock:
+            self._connections.append(conn)
+        return conn
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """
+        The connection for the calling thread: the shared connection, or in
+        performance mode a per-thread connection opened on first use.
+        """
+        if not self.performance_mode:
+            return self._conn
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self.connect()
+        return conn
+
+    def _read_guard(self):
+        """Returns the lock reads must hold, or a no-op context in performance mode."""
+        return nullcontext() if self.performance_mode else self._conn_lock
 
     def create_table(self):
         """
         Creates the 'state_tree' table if it does not already exist.
         The table stores the nodes of the state history tree.
+        Databases created before delta storage existed are migrated in place:
+        their rows are marked as full snapshots and keep reading correctly.
+        New databases use incremental auto-vacuum, so compact() can hand the
+        pages it frees back to the file system without a full VACUUM.
         """
+        # Only takes effect before the first table is created.
+        self.conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
         with self.conn:
             self.conn.execute("""
                 CREATE TABLE IF NOT EXISTS state_tree (
                     node_id TEXT PRIMARY KEY,
                     parent_id TEXT,
                     state_snapshot TEXT,
+                    snapshot_kind TEXT NOT NULL DEFAULT 'full',
+                    keyframe_distance INTEGER NOT NULL DEFAULT 0,
                     FOREIGN KEY (parent_id) REFERENCES state_tree(node_id)
                 )
             """)
+            columns = {row[1] for row in self.conn.execute("PRAGMA table_info(state_tree)")}
+            if "snapshot_kind" not in columns:
+                self.conn.execute("ALTER TABLE state_tree ADD COLUMN snapshot_kind TEXT NOT NULL DEFAULT 'full'")
+            if "keyframe_distance" not in columns:
+                self.conn.execute("ALTER TABLE state_tree ADD COLUMN keyframe_distance INTEGER NOT NULL DEFAULT 0")
+            # Child lookups, root lookups and redo all filter on parent_id.
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_state_tree_parent_id ON state_tree(parent_id)")
+            # Nodes removed by compact(), stored as they were in state_tree but
+            # with the snapshot zlib-compressed. Archived deltas resolve against
+            # their parent, which is either still live or archived as well.
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS state_archive (
+                    node_id TEXT PRIMARY KEY,
+                    parent_id TEXT,
+                    archived_at REAL NOT NULL,
+                    snapshot_kind TEXT NOT NULL,
+                    state_snapshot BLOB NOT NULL
+                )
+            """)
+            # The tip of every branch ("take") of the history, moved forward by
+            # each commit in the same transaction, so resuming a session and
+            # listing takes never scan state_tree. Named branches are the ones
+            # created with name_branch(); the others are created by forks.
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS history_heads (
+                    branch TEXT PRIMARY KEY,
+                    node_id TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    named INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_history_heads_node_id ON history_heads(node_id)")
+            # Resuming reads the newest head; the index ends with the rowid, so
+            # ORDER BY updated_at, rowid reads one entry however many takes there are.
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_history_heads_updated_at ON history_heads(updated_at)")
+            if self.conn.execute("SELECT NOT EXISTS (SELECT 1 FROM history_heads) AND EXISTS (SELECT 1 FROM state_tree)").fetchone()[0]:
+                # Databases created before heads existed get one take per leaf, in creation order.
+                now = time.time()
+                self.conn.execute("""
+                    INSERT INTO history_heads (branch, node_id, updated_at)
+                    SELECT 'take-' || ROW_NUMBER() OVER (ORDER BY s.rowid), s.node_id, ?
+                    FROM state_tree s
+                    WHERE NOT EXISTS (SELECT 1 FROM state_tree c WHERE c.parent_id = s.node_id)
+                    ORDER BY s.rowid
+                """, (now,))
+
+    def _cache_get(self, node_id: str) -> tuple[str | None, dict] | None:
+        """
+        Looks up a node in the state cache and marks it as recently used.
+
+        Returns:
+            tuple[str | None, dict] | None: The cached (parent_id, state) pair, or None on a miss.
+                                            The state is shared and must not be mutated.
+        """
+        with self._cache_lock:
+            entry = self._cache.get(node_id)
+            if entry is None:
+                self.cache_misses += 1
+                return None
+            self._cache.move_to_end(node_id)
+            self.cache_hits += 1
+            return entry
+
+    def _cache_put(self, node_id: str, parent_id: str | None, state: dict):
+        """
+        Stores a decoded state in the cache, evicting the least recently used
+        entries beyond `cache_size`. The cache takes ownership of `state`, and
+        turns its track list into a TrackStore so readers can share it.
+        """
+        tracks = state.get("tracks")
+        if isinstance(tracks, list) and not isinstance(tracks, TrackStore):
+            try:
+                state["tracks"] = TrackStore(tracks)
+            except ValueError:
+                pass  # Tracks without unique IDs stay a plain list and are copied on every read.
+        if self.cache_size == 0:
+            return
+        with self._cache_lock:
+            self._cache[node_id] = (parent_id, state)
+            self._cache.move_to_end(node_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def cache_stats(self) -> dict:
+        """
+        Returns the hit/miss counters and occupancy of the state cache.
+        """
+        with self._cache_lock:
+            lookups = self.cache_hits + self.cache_misses
+            return {
+                "hits": self.cache_hits,
+                "misses": self.cache_misses,
+                "hit_rate": self.cache_hits / lookups if lookups else 0.0,
+                "size": len(self._cache),
+                "capacity": self.cache_size,
+            }
+
+    def _encode_snapshot(self, state_snapshot: dict, parent_id: str | None) -> tuple[str, str | bytes, int]:
+        """
+        Encodes a state snapshot for storage according to the storage mode and codec.
+
+        Args:
+            state_snapshot (dict): The state to encode.
+            parent_id (str | None): The ID of the node the state is based on.
+
+        Returns:
+            tuple[str, str | bytes, int]: The snapshot kind ('full' or 'delta'), the encoded
+                                          snapshot, and the node's distance from its keyframe.
+        """
+        encode = self.codec.encode
+        if self.storage_mode != "delta" or parent_id is None:
+            return "full", encode(state_snapshot), 0
+
+        row = self.conn.execute(
+            "SELECT keyframe_distance FROM state_tree WHERE node_id = ?", (parent_id,)
+        ).fetchone()
+        if not row or row[0] + 1 >= self.keyframe_interval:
+            return "full", encode(state_snapshot), 0
+
+        parent_state = self.get_state(parent_id)
+        if parent_state is None:
+            return "full", encode(state_snapshot), 0
+
+        encoded_delta = encode(diff_states(parent_state, state_snapshot))
+        if len(encoded_delta) < SMALL_DELTA_BYTES:
+            return "delta", encoded_delta, row[0] + 1
+        encoded_state = encode(state_snapshot)
+        if len(encoded_delta) >= len(encoded_state):
+            # Not worth a delta, and a keyframe shortens every chain below it.
+            return "full", encoded_state, 0
+        return "delta", encoded_delta, row[0] + 1
 
+    @instrument("history.commit")
     def commit(self, state_snapshot: dict, parent_id: str | None) -> str:
         """
         Commits a new state to the history tree, generating a new ID for it.
@@ -62,17 +413,27 @@ class HistoryManager:
         node_id = str(uuid.uuid4())
         state_snapshot["history_node_id"] = node_id  # Mutate the state with its new ID
 
-        state_json = json.dumps(state_snapshot)
-        with self.conn:
-            self.conn.execute(
-                "INSERT INTO state_tree (node_id, parent_id, state_snapshot) VALUES (?, ?, ?)",
-                (node_id, parent_id, state_json)
-            )
+        with self._read_guard():
+            snapshot_kind, encoded, keyframe_distance = self._encode_snapshot(state_snapshot, parent_id)
+        row = (node_id, parent_id, encoded, snapshot_kind, keyframe_distance)
+        if self._group_writer:
+            self._group_writer.write(row)
+        else:
+            with self._conn_lock, self.conn:
+                self.conn.execute(INSERT_NODE_SQL, row)
+                self._advance_heads(node_id, parent_id, time.time())
+        self._cache_put(node_id, parent_id, _copy_state(state_snapshot))
         return node_id
 
+    @instrument("history.get_state")
     def get_state(self, node_id: str) -> dict | None:
         """
         Retrieves a state snapshot by its node ID.
+        Recently used states are served from the in-memory cache. The caller
+        receives its own copy of the state dict, but its 'tracks' are an
+        immutable TrackStore of read-only tracks shared with the cache: derive
+        changed track lists with TrackStore.replace() and TrackStore.add();
+        editing a track in place raises TypeError.
 
         Args:
             node_id (str): The ID of the state node to retrieve.
@@ -80,28 +441,310 @@ class HistoryManager:
         Returns:
             dict | None: The state snapshot as a dictionary, or None if not found.
         """
-        cursor = self.conn.execute("SELECT state_snapshot FROM state_tree WHERE node_id = ?", (node_id,))
+        entry = self._cache_get(node_id)
+        if entry is None:
+            entry = self._load_state(node_id)
+            if entry is None:
+                return None
+            self._cache_put(node_id, *entry)
+        return _copy_state(entry[1])
+
+    @_reader
+    def _load_state(self, node_id: str) -> tuple[str | None, dict] | None:
+        """
+        Reads and decodes a node from the database, bypassing the cache.
+        Delta-encoded nodes are rebuilt from their nearest keyframe ancestor.
+        Nodes removed by compact() are read back from the archive.
+
+        Returns:
+            tuple[str | None, dict] | None: The node's (parent_id, state), or None if not found.
+        """
+        cursor = self.conn.execute("SELECT parent_id, snapshot_kind, state_snapshot FROM state_tree WHERE node_id = ?", (node_id,))
         row = cursor.fetchone()
-        if row:
-            return json.loads(row[0])
-        return None
+        if not row:
+            return self._load_archived(node_id)
+        parent_id = row[0]
+        if row[1] == "full":
+            return parent_id, decode_snapshot(row[2])
+
+        # Walk up to the nearest keyframe in a single query, then replay the deltas.
+        cursor = self.conn.execute("""
+            WITH RECURSIVE chain(node_id, parent_id, snapshot_kind, state_snapshot, depth) AS (
+                SELECT node_id, parent_id, snapshot_kind, state_snapshot, 0
+                FROM state_tree WHERE node_id = ?
+                UNION ALL
+                SELECT s.node_id, s.parent_id, s.snapshot_kind, s.state_snapshot, chain.depth + 1
+                FROM state_tree s JOIN chain ON s.node_id = chain.parent_id
+                WHERE chain.snapshot_kind != 'full'
+            )
+            SELECT snapshot_kind, state_snapshot, parent_id FROM chain ORDER BY depth DESC
+        """, (node_id,))
+        rows = cursor.fetchall()
+        if rows[0][0] == "full":
+            state = decode_snapshot(rows[0][1])
+            deltas = rows[1:]
+        else:
+            # The chain may continue into nodes that compact() has archived.
+            archived = self._load_archived(rows[0][2]) if rows[0][2] is not None else None
+            if archived is None:
+                print(f"History node {node_id} has no keyframe ancestor; its state cannot be rebuilt.")
+                return None
+            state = archived[1]
+            deltas = rows
+        for _, encoded_delta, _ in deltas:
+            state = apply_delta(state, decode_snapshot(encoded_delta))
+        return parent_id, state
 
+    def _load_archived(self, node_id: str) -> tuple[str | None, dict] | None:
+        """
+        Reads a node that compact() moved to the archive table.
+
+        Returns:
+            tuple[str | None, dict] | None: The node's (parent_id, state), or None if it was never archived.
+        """
+        row = self.conn.execute(
+            "SELECT parent_id, snapshot_kind, state_snapshot FROM state_archive WHERE node_id = ?", (node_id,)
+        ).fetchone()
+        if not row:
+            return None
+        parent_id, snapshot = row[0], decode_snapshot(zlib.decompress(row[2]))
+        if row[1] == "full":
+            return parent_id, snapshot
+        base = self._load_state(parent_id) if parent_id is not None else None
+        if base is None:
+            print(f"Archived history node {node_id} has no keyframe ancestor; its state cannot be rebuilt.")
+            return None
+        return parent_id, apply_delta(base[1], snapshot)
+
+    @instrument("history.update_state")
+    @_serialized
     def update_state(self, node_id: str, state_snapshot: dict):
         """
         Updates the state snapshot for an existing node.
         This is useful for the initial root node creation, where the node's own
         ID needs to be stored within its state snapshot.
+        The node is stored as a keyframe, and any delta-encoded children are
+        rewritten as keyframes first so they keep their own contents.
 
         Args:
             node_id (str): The ID of the state node to update.
             state_snapshot (dict): The new state snapshot to save.
         """
-        state_json = json.dumps(state_snapshot)
+        encoded = self.codec.encode(state_snapshot)
+        child_ids = [row[0] for row in self.conn.execute(
+            "SELECT node_id FROM state_tree WHERE parent_id = ? AND snapshot_kind = 'delta'", (node_id,)
+        )]
+        children = [(self.codec.encode(self.get_state(child_id)), child_id) for child_id in child_ids]
         with self.conn:
-            self.conn.execute(
-                "UPDATE state_tree SET state_snapshot = ? WHERE node_id = ?",
-                (state_json, node_id)
+            self.conn.executemany(
+                "UPDATE state_tree SET state_snapshot = ?, snapshot_kind = 'full', keyframe_distance = 0 WHERE node_id = ?",
+                children + [(encoded, node_id)]
             )
+        self._cache_put(node_id, self.get_parent_id(node_id), decode_snapshot(encoded))
+
+    @_serialized
+    def convert_storage(self, storage_mode: str, keyframe_interval: int | None = None,
+                        snapshot_codec: str | None = None) -> int:
+        """
+        Re-encodes every node in the history in the given storage mode.
+        This is the migration path for existing databases: an old full-snapshot
+        project.db can be converted to delta storage (and back), or from JSON
+        to the binary codec, in one transaction.
+        Decoded states are unchanged by the conversion.
+
+        Args:
+            storage_mode (str): The target storage mode, "full" or "delta".
+            keyframe_interval (int | None): A new keyframe interval, if it should change.
+            snapshot_codec (str | None): A new snapshot codec, if it should change.
+
+        Returns:
+            int: The number of nodes that were re-encoded.
+        """
+        if storage_mode not in STORAGE_MODES:
+            raise ValueError(f"Unknown storage mode '{storage_mode}'. Expected one of {STORAGE_MODES}.")
+        if snapshot_codec is not None:
+            self.codec = get_codec(snapshot_codec)
+        self.storage_mode = storage_mode
+        if keyframe_interval is not None:
+            self.keyframe_interval = keyframe_interval
+
+        # Parents must be re-encoded before their children, so walk the tree
+        # breadth-first. The walk also starts at nodes whose parent was archived
+        # by compact(), which are not below the root any more.
+        cursor = self.conn.execute("""
+            WITH RECURSIVE tree(node_id, parent_id, depth) AS (
+                SELECT s.node_id, s.parent_id, 0 FROM state_tree s
+                WHERE s.parent_id IS NULL OR NOT EXISTS (SELECT 1 FROM state_tree p WHERE p.node_id = s.parent_id)
+                UNION ALL
+                SELECT s.node_id, s.parent_id, tree.depth + 1
+                FROM state_tree s JOIN tree ON s.parent_id = tree.node_id
+            )
+            SELECT node_id, parent_id FROM tree ORDER BY depth
+        """)
+        converted = 0
+        with self.conn:
+            for node_id, parent_id in cursor.fetchall():
+                state = self.get_state(node_id)
+                snapshot_kind, encoded, keyframe_distance = self._encode_snapshot(state, parent_id)
+                self.conn.execute(
+                    "UPDATE state_tree SET state_snapshot = ?, snapshot_kind = ?, keyframe_distance = ? WHERE node_id = ?",
+                    (encoded, snapshot_kind, keyframe_distance, node_id)
+                )
+                converted += 1
+        return converted
+
+    def iter_nodes(self, node_id: str | None = None, page_size: int = 500):
+        """
+        Yields the nodes of the history as stored, parents before children:
+        every node, or only the path from the root to `node_id`. Full
+        snapshots and deltas are decoded but not rebuilt into states, so
+        memory use does not grow with the history. Nodes are read a page at a
+        time, and no lock is held between pages, so commits keep running
+        during a long export.
+
+        A delta whose parent is no longer in the history (it was archived by
+        compact()) is yielded as a full snapshot, so every yielded node can be
+        decoded from the nodes before it.
+
+        Args:
+            node_id (str | None): The node whose path to yield. None yields every node.
+            page_size (int): The number of nodes read per query.
+
+        Yields:
+            tuple[str, str | None, str, dict]: Each node's ID, parent ID, snapshot kind
+                                               ('full' or 'delta') and decoded snapshot.
+
+        Raises:
+            ValueError: If `node_id` is not in the history.
+        """
+        if node_id is None:
+            last_rowid = 0
+            while True:
+                with self._read_guard():
+                    rows = self.conn.execute("""
+                        SELECT s.rowid, s.node_id, s.parent_id, s.snapshot_kind, s.state_snapshot,
+                               s.parent_id IS NOT NULL AND p.node_id IS NULL
+                        FROM state_tree s LEFT JOIN state_tree p ON p.node_id = s.parent_id
+                        WHERE s.rowid > ? ORDER BY s.rowid LIMIT ?
+                    """, (last_rowid, page_size)).fetchall()
+                if not rows:
+                    return
+                for _, *row in rows:
+                    yield self._exported_node(*row)
+                last_rowid = rows[-1][0]
+
+        path = self.get_ancestors(node_id)[::-1] + [node_id]
+        for start in range(0, len(path), page_size):
+            page = path[start:start + page_size]
+            with self._read_guard():
+                rows = {row[0]: row for row in self.conn.execute(
+                    "SELECT node_id, parent_id, snapshot_kind, state_snapshot FROM state_tree "
+                    "WHERE node_id IN (SELECT value FROM json_each(?))", (json.dumps(page),)
+                )}
+            for position, page_node_id in enumerate(page):
+                if page_node_id not in rows:
+                    raise ValueError(f"History node {page_node_id} does not exist.")
+                # The first node of the path is the root, unless its parent was archived.
+                orphan = start + position == 0 and rows[page_node_id][1] is not None
+                yield self._exported_node(*rows[page_node_id], orphan)
+
+    def _exported_node(self, node_id: str, parent_id: str | None, snapshot_kind: str, snapshot,
+                       orphan: bool) -> tuple[str, str | None, str, dict]:
+        """Decodes a row for iter_nodes, rebuilding a delta whose parent is not exported as a full snapshot."""
+        if snapshot_kind == "delta" and orphan:
+            return node_id, parent_id, "full", self.get_state(node_id)
+        return node_id, parent_id, snapshot_kind, decode_snapshot(snapshot)
+
+    @instrument("history.import_nodes")
+    @_serialized
+    def import_nodes(self, nodes, batch_size: int = 500) -> dict:
+        """
+        Adds nodes yielded by iter_nodes (possibly from another database) to
+        the history, in one transaction: if any node is rejected, or `nodes`
+        raises, nothing is imported. Nodes are inserted in batches of
+        `batch_size`, and only the current batch is held in memory.
+
+        Every node's parent must already be in the history or come earlier in
+        `nodes`. A node that is already in the history with the same parent is
+        skipped, so importing the path to a node into a copy of the same
+        project only adds what is missing. Snapshots are stored with this
+        manager's codec, as the kind they were exported as.
+
+        Args:
+            nodes: An iterable of (node_id, parent_id, snapshot_kind, snapshot) tuples,
+                   parents before children.
+            batch_size (int): The number of nodes inserted per statement.
+
+        Returns:
+            dict: The number of nodes 'imported', and 'skipped' because they already existed.
+
+        Raises:
+            ValueError: If a node's parent is missing, a node conflicts with an existing
+                        one, or the import would give the history a second root.
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1.")
+        totals = {"imported": 0, "skipped": 0}
+        root_id = self.get_root_node_id()
+        with self.conn:
+            batch = []
+            for node in nodes:
+                batch.append(node)
+                if len(batch) >= batch_size:
+                    root_id = self._import_batch(batch, root_id, totals)
+                    batch = []
+            if batch:
+                self._import_batch(batch, root_id, totals)
+        return totals
+
+    def _import_batch(self, batch: list, root_id: str | None, totals: dict) -> str | None:
+        """
+        Checks and inserts one batch of import_nodes. Must run inside its transaction.
+
+        Returns:
+            str | None: The history's root node ID after the batch.
+        """
+        referenced = {node[0] for node in batch} | {node[1] for node in batch if node[1] is not None}
+        # (parent_id, keyframe_distance) of every node the batch refers to that
+        # is already stored, including nodes inserted by earlier batches.
+        stored = {row[0]: (row[1], row[2]) for row in self.conn.execute(
+            "SELECT node_id, parent_id, keyframe_distance FROM state_tree WHERE node_id IN (SELECT value FROM json_each(?))",
+            (json.dumps(list(referenced)),)
+        )}
+        distances = {}
+        rows = []
+        for node_id, parent_id, snapshot_kind, snapshot in batch:
+            if snapshot_kind not in ("full", "delta"):
+                raise ValueError(f"History node {node_id} has unknown snapshot kind '{snapshot_kind}'.")
+            if node_id in distances:
+                raise ValueError(f"History node {node_id} appears twice in the import.")
+            if node_id in stored:
+                if stored[node_id][0] != parent_id:
+                    raise ValueError(f"History node {node_id} already exists with a different parent.")
+                totals["skipped"] += 1
+                continue
+            if parent_id is None:
+                if snapshot_kind != "full":
+                    raise ValueError(f"Root node {node_id} must be a full snapshot.")
+                if root_id is not None:
+                    raise ValueError(f"Cannot import root node {node_id}: the history already has root {root_id}.")
+                root_id = node_id
+                distance = 0
+            elif parent_id in distances:
+                distance = distances[parent_id] + 1
+            elif parent_id in stored:
+                distance = stored[parent_id][1] + 1
+            else:
+                raise ValueError(f"History node {node_id} refers to parent {parent_id}, "
+                                 f"which is neither in the history nor earlier in the import.")
+            distances[node_id] = distance if snapshot_kind == "delta" else 0
+            rows.append((node_id, parent_id, self.codec.encode(snapshot), snapshot_kind, distances[node_id]))
+        self.conn.executemany(INSERT_NODE_SQL, rows)
+        now = time.time()
+        for row in rows:
+            self._advance_heads(row[0], row[1], now)
+        totals["imported"] += len(rows)
+        return root_id
 
     def get_parent(self, node_id: str) -> dict | None:
         """
@@ -114,14 +757,13 @@ class HistoryManager:
             dict | None: The parent state snapshot as a dictionary, or None if the node or its parent is not found.
         """
         # First, find the parent_id
-        cursor = self.conn.execute("SELECT parent_id FROM state_tree WHERE node_id = ?", (node_id,))
-        row = cursor.fetchone()
-        if row and row[0]:
-            parent_id = row[0]
+        parent_id = self.get_parent_id(node_id)
+        if parent_id:
             # Then, get the state for that parent_id
             return self.get_state(parent_id)
         return None
 
+    @_reader
     def get_parent_id(self, node_id: str) -> str | None:
         """
         Retrieves the parent ID of a given node.
@@ -132,12 +774,117 @@ class HistoryManager:
         Returns:
             str | None: The parent node's ID, or None if not found.
         """
+        # A peek: parent lookups neither count toward the state cache's hit
+        # rate nor keep states in it.
+        with self._cache_lock:
+            entry = self._cache.get(node_id)
+        if entry is not None:
+            return entry[0]
         cursor = self.conn.execute("SELECT parent_id FROM state_tree WHERE node_id = ?", (node_id,))
         row = cursor.fetchone()
         if row:
             return row[0]
         return None
 
+    @_reader
+    def get_ancestors(self, node_id: str, depth: int | None = None) -> list[str]:
+        """
+        Retrieves the IDs of a node's ancestors in a single recursive query.
+
+        Args:
+            node_id (str): The ID of the node to start from.
+            depth (int | None): The maximum number of generations to walk up. None walks up to the root.
+
+        Returns:
+            list[str]: The ancestor IDs, nearest (the parent) first.
+        """
+        cursor = self.conn.execute("""
+            WITH RECURSIVE ancestors(node_id, depth) AS (
+                SELECT parent_id, 1 FROM state_tree WHERE node_id = :node_id
+                UNION ALL
+                SELECT s.parent_id, ancestors.depth + 1
+                FROM state_tree s JOIN ancestors ON s.node_id = ancestors.node_id
+                WHERE :depth IS NULL OR ancestors.depth < :depth
+            )
+            SELECT node_id FROM ancestors WHERE node_id IS NOT NULL ORDER BY depth
+        """, {"node_id": node_id, "depth": depth})
+        return [row[0] for row in cursor.fetchall()]
+
+    @_reader
+    def has_node(self, node_id: str) -> bool:
+        """
+        True if a node is in the history. Unlike get_state(), this does not
+        look in the archive: archived nodes cannot be exported or named as branches.
+        """
+        return self.conn.execute("SELECT 1 FROM state_tree WHERE node_id = ?", (node_id,)).fetchone() is not None
+
+    @_reader
+    def get_children(self, node_id: str) -> list[str]:
+        """
+        Retrieves the IDs of a node's direct children.
+
+        Args:
+            node_id (str): The ID of the parent node.
+
+        Returns:
+            list[str]: The child IDs, oldest first.
+        """
+        cursor = self.conn.execute("SELECT node_id FROM state_tree WHERE parent_id = ? ORDER BY rowid", (node_id,))
+        return [row[0] for row in cursor.fetchall()]
+
+    @instrument("history.undo")
+    def undo_n(self, node_id: str, steps: int = 1) -> str | None:
+        """
+        Finds the node reached by undoing `steps` changes from a node.
+        If the history is shorter than `steps`, the root node is returned.
+
+        Args:
+            node_id (str): The ID of the current node.
+            steps (int): The number of changes to undo.
+
+        Returns:
+            str | None: The ID of the target node, or None if there is nothing to undo.
+        """
+        ancestors = self.get_ancestors(node_id, depth=max(steps, 1))
+        return ancestors[-1] if ancestors else None
+
+    @instrument("history.redo")
+    @_reader
+    def redo(self, node_id: str, steps: int = 1) -> str | None:
+        """
+        Finds the node reached by redoing `steps` changes from a node.
+        At each step the most recently created child is followed, which is the
+        change that was last made (and then undone) from that point.
+
+        Args:
+            node_id (str): The ID of the current node.
+            steps (int): The number of changes to redo.
+
+        Returns:
+            str | None: The ID of the target node, or None if there is nothing to redo.
+        """
+        cursor = self.conn.execute("""
+            WITH RECURSIVE descendants(node_id, depth) AS (
+                SELECT :node_id, 0
+                UNION ALL
+                SELECT (SELECT c.node_id FROM state_tree c
+                        WHERE c.parent_id = descendants.node_id
+                        ORDER BY c.rowid DESC LIMIT 1),
+                       descendants.depth + 1
+                FROM descendants
+                WHERE descendants.node_id IS NOT NULL AND descendants.depth < :steps
+            )
+            SELECT node_id FROM descendants
+            WHERE node_id IS NOT NULL AND depth > 0
+            ORDER BY depth DESC LIMIT 1
+        """, {"node_id": node_id, "steps": max(steps, 1)})
+        row = cursor.fetchone()
+        if row:
+            return row[0]
+        return None
+
+    @instrument("history.get_root_node_id")
+    @_reader
     def get_root_node_id(self) -> str | None:
         """
         Finds the ID of the root node (the one with no parent).
@@ -149,9 +896,329 @@ class HistoryManager:
             return row[0]
         return None
 
+    @_reader
+    def stored_codec(self) -> str | None:
+        """
+        Works out which codec the stored snapshots were written with, from
+        their first bytes. A "binary+zlib" history also holds plain binary rows
+        (snapshots too small to be worth compressing), so any compressed row
+        makes it "binary+zlib"; one where no snapshot was large enough to
+        compress reads as "binary", which stored the same bytes. Rows from
+        before codecs existed count as "json".
+
+        Returns:
+            str | None: The codec name, or None if the history is empty.
+        """
+        cursor = self.conn.execute("SELECT DISTINCT hex(substr(state_snapshot, 1, 1)) FROM state_tree")
+        found = {FIRST_BYTE_CODECS.get(int(row[0], 16)) for row in cursor if row[0]}
+        for name in ("binary+zlib", "binary", "json"):
+            if name in found:
+                return name
+        return None
+
+    def _advance_heads(self, node_id: str, parent_id: str | None, now: float):
+        """
+        Records a new node in 'history_heads'. Must run in the transaction that
+        inserts the node. Every branch whose tip is the parent moves to the
+        new node; if there is none, the node starts a new branch: "main" for
+        the root, "take-N" for a commit made after an undo. Extending a branch
+        costs one indexed UPDATE; take numbers come from a counter.
+        """
+        if parent_id is None:
+            branch = "main"
+        else:
+            cursor = self.conn.execute(
+                "UPDATE history_heads SET node_id = ?, updated_at = ? WHERE node_id = ?", (node_id, now, parent_id)
+            )
+            if cursor.rowcount:
+                return
+            branch = self._next_take_name()
+        while True:
+            try:
+                self.conn.execute(
+                    "INSERT INTO history_heads (branch, node_id, updated_at) VALUES (?, ?, ?)", (branch, node_id, now)
+                )
+                return
+            except sqlite3.IntegrityError:
+                branch = self._next_take_name()  # Taken, e.g. by a branch the user named "take-N".
+
+    def _next_take_name(self) -> str:
+        if self._next_take is None:
+            self._next_take = self.conn.execute("SELECT COALESCE(MAX(rowid), 0) + 1 FROM history_heads").fetchone()[0]
+        number = self._next_take
+        self._next_take += 1
+        return f"take-{number}"
+
+    @instrument("history.get_latest_node_id")
+    @_reader
+    def get_latest_node_id(self) -> str | None:
+        """
+        Finds the most recently committed tip of any branch: where a session
+        that does not know its history node should resume. Reads one entry of
+        the updated_at index, however many branches and nodes there are.
+
+        Returns:
+            str | None: The node ID, or None if the history is empty.
+        """
+        row = self.conn.execute(
+            "SELECT node_id FROM history_heads ORDER BY updated_at DESC, rowid DESC LIMIT 1"
+        ).fetchone()
+        return row[0] if row else None
+
+    @_reader
+    def find_tip(self, node_id: str, since: float) -> str:
+        """
+        Finds where work requested at a node should be committed once it is
+        done: the most recently moved branch tip that is the node itself or
+        moved onto one of its descendants at or after `since`. Commands run
+        while the work was in progress are then kept, instead of being forked
+        away. Branches that were already below the node at `since` (e.g. ones
+        the user had undone) are not followed.
+
+        Args:
+            node_id (str): The node the work was requested at.
+            since (float): When it was requested, as a time.time() timestamp.
+
+        Returns:
+            str: The tip's node ID; `node_id` itself if nothing was committed below it.
+        """
+        row = self.conn.execute("""
+            WITH RECURSIVE subtree(node_id) AS (
+                SELECT :node_id
+                UNION ALL
+                SELECT s.node_id FROM state_tree s JOIN subtree ON s.parent_id = subtree.node_id
+            )
+            SELECT h.node_id FROM history_heads h JOIN subtree ON h.node_id = subtree.node_id
+            WHERE h.node_id = :node_id OR h.updated_at >= :since
+            ORDER BY h.updated_at DESC, h.rowid DESC LIMIT 1
+        """, {"node_id": node_id, "since": since}).fetchone()
+        return row[0] if row else node_id
+
+    def commit_on_tip(self, state: dict, since: float, apply) -> dict:
+        """
+        Commits the result of slow work (e.g. a music generation) requested at
+        `state`: `apply` is called with the state at find_tip() and returns the
+        new state, which is committed as its child. Finding the tip and
+        committing hold the write lock, so no other commit lands in between.
+
+        Args:
+            state (dict): The state the work was requested at. Used as is when
+                          it has no history node.
+            since (float): When the work was requested, as a time.time() timestamp.
+            apply: Builds the new state from the current one. It must not mutate its argument.
+
+        Returns:
+            dict: The committed state, with its history_node_id set.
+        """
+        with self._conn_lock:
+            parent_id = state.get("history_node_id")
+            if parent_id is not None:
+                parent_id = self.find_tip(parent_id, since)
+                state = self.get_state(parent_id) or state
+            new_state = apply(state)
+            self.commit(new_state, parent_id)
+        return new_state
+
+    @_reader
+    def get_branch(self, branch: str) -> str | None:
+        """
+        Finds the tip of a branch.
+
+        Args:
+            branch (str): The branch name, e.g. "main", "take-3" or a name given with name_branch().
+
+        Returns:
+            str | None: The tip's node ID, or None if there is no such branch.
+        """
+        row = self.conn.execute("SELECT node_id FROM history_heads WHERE branch = ?", (branch,)).fetchone()
+        return row[0] if row else None
+
+    @_reader
+    def list_branches(self, limit: int | None = None) -> list[dict]:
+        """
+        Lists the branches ("takes") of the history, most recently updated first.
+
+        Args:
+            limit (int | None): The most branches to return. None returns all of them.
+
+        Returns:
+            list[dict]: Each branch's 'branch' name, tip 'node_id', 'updated_at'
+                        timestamp, and whether it was 'named' with name_branch().
+        """
+        cursor = self.conn.execute(
+            "SELECT branch, node_id, updated_at, named FROM history_heads ORDER BY updated_at DESC, rowid DESC LIMIT ?",
+            (-1 if limit is None else limit,)
+        )
+        return [{"branch": branch, "node_id": node_id, "updated_at": updated_at, "named": bool(named)}
+                for branch, node_id, updated_at, named in cursor.fetchall()]
+
+    @_serialized
+    def name_branch(self, branch: str, node_id: str):
+        """
+        Creates a named branch at a node, or moves an existing branch there.
+        Commits made on top of the node then move the branch forward. Named
+        branches are kept by compact() by default.
+
+        Raises:
+            ValueError: If the node does not exist.
+        """
+        if not self.conn.execute("SELECT 1 FROM state_tree WHERE node_id = ?", (node_id,)).fetchone():
+            raise ValueError(f"History node {node_id} does not exist.")
+        with self.conn:
+            self.conn.execute("""
+                INSERT INTO history_heads (branch, node_id, updated_at, named) VALUES (?, ?, ?, 1)
+                ON CONFLICT(branch) DO UPDATE SET node_id = excluded.node_id, updated_at = excluded.updated_at, named = 1
+            """, (branch, node_id, time.time()))
+
+    @_serialized
+    def delete_branch(self, branch: str) -> bool:
+        """
+        Removes a branch. Its nodes stay in the history.
+
+        Returns:
+            bool: True if the branch existed.
+        """
+        with self.conn:
+            return self.conn.execute("DELETE FROM history_heads WHERE branch = ?", (branch,)).rowcount > 0
+
+    @instrument("history.compact")
+    def compact(self, heads: list[str] | None = None, keep_recent: int = 500, archive: bool = True,
+                batch_size: int = 200, vacuum_pages: int | None = None) -> dict:
+        """
+        Removes abandoned branches from the history. A node is kept if it is an
+        ancestor of (or is) one of the `heads`, or of one of the `keep_recent`
+        most recently created nodes, so recent undo/redo branches survive.
+        Every other node is deleted from 'state_tree', after being stored in
+        the compressed 'state_archive' table when `archive` is set, and the
+        freed pages are released with an incremental vacuum.
+
+        Nodes are removed in batches of `batch_size`, each in its own short
+        transaction, so commits from running requests are only held up for
+        one batch at a time. Nodes committed while compaction runs, and their
+        ancestors, are never removed.
+
+        Args:
+            heads (list[str] | None): The node IDs to keep reachable. None keeps the most recent node
+                                      and the tips of named branches (see name_branch()).
+            keep_recent (int): The number of most recent nodes whose ancestry is also kept.
+            archive (bool): Archive the removed nodes instead of discarding them.
+            batch_size (int): The number of nodes removed per transaction.
+            vacuum_pages (int | None): The most pages to release. None releases all free pages.
+
+        Returns:
+            dict: The number of nodes kept, archived and discarded, and the pages freed.
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1.")
+        with self._read_guard():
+            start_rowid = self.conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM state_tree").fetchone()[0]
+            if heads is None:
+                heads = [row[0] for row in self.conn.execute(
+                    "SELECT node_id FROM (SELECT node_id FROM state_tree ORDER BY rowid DESC LIMIT 1) "
+                    "UNION SELECT node_id FROM history_heads WHERE named"
+                )]
+            # Descendants before ancestors (a child is always created after its
+            # parent), so no live node is ever left with a missing parent.
+            candidates = [row[0] for row in self.conn.execute(f"""
+                WITH RECURSIVE keep(node_id) AS (
+                    SELECT value FROM json_each(:heads)
+                    UNION
+                    SELECT node_id FROM (SELECT node_id FROM state_tree ORDER BY rowid DESC LIMIT :keep_recent)
+                    UNION
+                    {_PARENT_STEP}
+                )
+                SELECT node_id FROM state_tree WHERE node_id NOT IN keep ORDER BY rowid DESC
+            """, {"heads": json.dumps(heads), "keep_recent": max(keep_recent, 0)})]
+            total = self.conn.execute("SELECT COUNT(*) FROM state_tree").fetchone()[0]
+
+        archived = discarded = 0
+        protected = set()
+        checked_rowid = start_rowid
+        for start in range(0, len(candidates), batch_size):
+            with self._conn_lock:
+                # Keep the ancestry of anything committed since compaction started.
+                newest = self.conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM state_tree").fetchone()[0]
+                if newest > checked_rowid:
+                    protected.update(row[0] for row in self.conn.execute(f"""
+                        WITH RECURSIVE keep(node_id) AS (
+                            SELECT node_id FROM state_tree WHERE rowid > :rowid
+                            UNION
+                            {_PARENT_STEP}
+                        )
+                        SELECT node_id FROM keep
+                    """, {"rowid": checked_rowid}))
+                    checked_rowid = newest
+                batch = [node_id for node_id in candidates[start:start + batch_size] if node_id not in protected]
+                if not batch:
+                    continue
+                rows = []
+                if archive:
+                    now = time.time()
+                    rows = [
+                        (node_id, parent_id, now, snapshot_kind,
+                         zlib.compress(snapshot if isinstance(snapshot, bytes) else snapshot.encode()))
+                        for node_id, parent_id, snapshot_kind, snapshot in self.conn.execute(
+                            "SELECT node_id, parent_id, snapshot_kind, state_snapshot FROM state_tree "
+                            "WHERE node_id IN (SELECT value FROM json_each(?))", (json.dumps(batch),)
+                        )
+                    ]
+                with self.conn:
+                    self.conn.executemany(
+                        "INSERT OR REPLACE INTO state_archive (node_id, parent_id, archived_at, snapshot_kind, state_snapshot) "
+                        "VALUES (?, ?, ?, ?, ?)", rows
+                    )
+                    self.conn.executemany("DELETE FROM state_tree WHERE node_id = ?", [(node_id,) for node_id in batch])
+                    self.conn.execute("DELETE FROM history_heads WHERE node_id IN (SELECT value FROM json_each(?))",
+                                      (json.dumps(batch),))
+            with self._cache_lock:
+                for node_id in batch:
+                    self._cache.pop(node_id, None)
+            archived += len(rows)
+            discarded += len(batch) - len(rows)
+
+        return {
+            "kept": total - archived - discarded,
+            "archived": archived,
+            "discarded": discarded,
+            "pages_freed": self.vacuum(vacuum_pages),
+        }
+
+    @_serialized
+    def vacuum(self, max_pages: int | None = None) -> int:
+        """
+        Releases free database pages back to the file system. Databases created
+        before incremental auto-vacuum was enabled are converted first, with a
+        one-time full VACUUM.
+
+        Args:
+            max_pages (int | None): The most pages to release. None releases all of them.
+
+        Returns:
+            int: The number of pages released.
+        """
+        if self.conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 0:
+            self.conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            before = self.conn.execute("PRAGMA page_count").fetchone()[0]
+            self.conn.execute("VACUUM")
+            return before - self.conn.execute("PRAGMA page_count").fetchone()[0]
+        before = self.conn.execute("PRAGMA page_count").fetchone()[0]
+        if max_pages is None:
+            # executescript steps the pragma to completion; execute() would
+            # release a single page.
+            self.conn.executescript("PRAGMA incremental_vacuum;")
+        else:
+            self.conn.executescript(f"PRAGMA incremental_vacuum({int(max_pages)});")
+        return before - self.conn.execute("PRAGMA page_count").fetchone()[0]
+
     def close(self):
         """
-        Closes the database connection.
+        Closes the database connection(s), after any queued group-commit
+        inserts have been written.
         """
-        if self.conn:
-            self.conn.close() 
\ No newline at end of file
+        if self._group_writer:
+            self._group_writer.close()
+            self._group_writer = None
+        with self._conn_lock, self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = [] 
\ No newline at end of file
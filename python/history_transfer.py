@@ -0,0 +1,174 @@
+# _implementation/python/history_transfer.py
+# This file defines the export format for a project's history, used to back
+# up a project or move it to another machine without copying project.db from
+# under the running server. An export is newline-delimited JSON:
+#
+#   {"format": "jam-history", "version": 1, "node_id": null}
+#   {"node_id": "...", "parent_id": null, "kind": "full", "snapshot": {...}}
+#   {"node_id": "...", "parent_id": "...", "kind": "delta", "snapshot": {...}}
+#   ...
+#   {"end": true, "nodes": 1234}
+#
+# The header's node_id is the node whose path was exported, or null for the
+# whole tree. Nodes come parents first and keep their storage kind, so delta
+# histories stay small; snapshots are plain JSON whatever codec wrote them.
+# The closing record lets an import tell a complete export from a truncated
+# one. Both directions stream, a record at a time.
+
+import json
+import os
+import shutil
+import uuid
+
+from history_manager import HistoryManager
+
+FORMAT = "jam-history"
+FORMAT_VERSION = 1
+
+
+def export_lines(history: HistoryManager, node_id: str | None = None, page_size: int = 500):
+    """
+    Yields an export of the history, one line at a time.
+
+    Args:
+        history (HistoryManager): The history to export.
+        node_id (str | None): Exports only the path from the root to this node. None exports every node.
+        page_size (int): The number of nodes read from the database at a time.
+
+    Yields:
+        str: The lines of the export, each ending in a newline.
+
+    Raises:
+        ValueError: If `node_id` is not in the history.
+    """
+    yield json.dumps({"format": FORMAT, "version": FORMAT_VERSION, "node_id": node_id}) + "\n"
+    count = 0
+    for exported_id, parent_id, snapshot_kind, snapshot in history.iter_nodes(node_id, page_size):
+        yield json.dumps({"node_id": exported_id, "parent_id": parent_id, "kind": snapshot_kind, "snapshot": snapshot},
+                         separators=(",", ":")) + "\n"
+        count += 1
+    yield json.dumps({"end": True, "nodes": count}) + "\n"
+
+
+def chunked(lines, chunk_bytes: int = 64 * 1024):
+    """Joins export lines into chunks of about `chunk_bytes`, for writing to a socket or file."""
+    chunk, size = [], 0
+    for line in lines:
+        chunk.append(line)
+        size += len(line)
+        if size >= chunk_bytes:
+            yield "".join(chunk)
+            chunk, size = [], 0
+    if chunk:
+        yield "".join(chunk)
+
+
+def read_nodes(lines):
+    """
+    Parses an export, yielding its nodes as they are read.
+
+    Args:
+        lines: The lines of the export, as str or bytes. Blank lines are ignored.
+
+    Yields:
+        tuple[str, str | None, str, dict]: Each node's ID, parent ID, snapshot kind and snapshot,
+                                           as HistoryManager.import_nodes takes them.
+
+    Raises:
+        ValueError: If the export is malformed, of another format or version, or truncated.
+    """
+    count = 0
+    header = None
+    for number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Line {number} of the export is not valid JSON: {e}") from e
+        if not isinstance(record, dict):
+            raise ValueError(f"Line {number} of the export is not a JSON object.")
+        if header is None:
+            if record.get("format") != FORMAT:
+                raise ValueError("This is not a history export (the first line has no 'jam-history' header).")
+            if record.get("version") != FORMAT_VERSION:
+                raise ValueError(f"Unsupported history export version {record.get('version')}.")
+            header = record
+            continue
+        if record.get("end"):
+            if record.get("nodes") != count:
+                raise ValueError(f"The export lists {record.get('nodes')} nodes but contains {count}.")
+            return
+        try:
+            node = (record["node_id"], record["parent_id"], record["kind"], record["snapshot"])
+        except KeyError as e:
+            raise ValueError(f"Line {number} of the export has no {e} field.") from None
+        if not isinstance(node[0], str) or not isinstance(node[3], dict):
+            raise ValueError(f"Line {number} of the export is not a history node.")
+        count += 1
+        yield node
+    raise ValueError("The export is truncated: it has no closing record.")
+
+
+def import_lines(history: HistoryManager, lines, batch_size: int = 500) -> dict:
+    """
+    Imports an export into a history, in one transaction (see HistoryManager.import_nodes).
+
+    Returns:
+        dict: The number of nodes 'imported' and 'skipped'.
+
+    Raises:
+        ValueError: If the export is malformed or does not fit the history.
+    """
+    return history.import_nodes(read_nodes(lines), batch_size=batch_size)
+
+
+def _copy_exclusive(source_path: str, database_path: str):
+    """Copies a file to a path that must not exist yet, removing the copy if it fails partway."""
+    with open(source_path, "rb") as source, open(database_path, "xb") as target:
+        try:
+            shutil.copyfileobj(source, target)
+            target.flush()
+            os.fsync(target.fileno())
+        except BaseException:
+            target.close()
+            os.remove(database_path)
+            raise
+
+
+def import_new_database(database_path: str, lines, snapshot_codec: str = "json", batch_size: int = 500) -> dict:
+    """
+    Creates a database holding an export. The database is built under a
+    temporary name and linked into place once the import has succeeded, so
+    a failed import leaves nothing behind and an existing database is never
+    overwritten. On filesystems without hard links it is copied into place
+    instead, with the same guarantees.
+
+    Returns:
+        dict: The number of nodes 'imported' and 'skipped'.
+
+    Raises:
+        FileExistsError: If `database_path` already exists.
+        ValueError: If the export is malformed.
+    """
+    if os.path.exists(database_path):
+        raise FileExistsError(f"{database_path} already exists.")
+    temp_path = f"{database_path}.import-{uuid.uuid4().hex}"
+    try:
+        history = HistoryManager(temp_path, snapshot_codec=snapshot_codec)
+        try:
+            totals = import_lines(history, lines, batch_size=batch_size)
+        finally:
+            history.close()
+        # Unlike a rename, a link fails if the database appeared in the meantime.
+        try:
+            os.link(temp_path, database_path)
+        except FileExistsError:
+            raise
+        except OSError:
+            _copy_exclusive(temp_path, database_path)  # The filesystem has no hard links.
+        return totals
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
@@ -0,0 +1,263 @@
+# _implementation/python/intent_parser.py
+# This file defines a local, rule-based parser for the simple commands the
+# agent hears most often ("mute track 2", "volume of track_0 to 0.5", "undo").
+# The router tries it before the LLM, so these commands skip a network round
+# trip entirely. It also provides the cache and counters used for commands
+# that do fall through to the LLM.
+
+import re
+import threading
+from collections import OrderedDict
+
+NUMBER_WORDS = {
+    "zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12,
+    "thirteen": 13, "fourteen": 14, "fifteen": 15, "sixteen": 16, "seventeen": 17,
+    "eighteen": 18, "nineteen": 19, "twenty": 20, "thirty": 30, "forty": 40,
+    "fifty": 50, "sixty": 60, "seventy": 70, "eighty": 80, "ninety": 90,
+    "hundred": 100, "a hundred": 100, "one hundred": 100,
+}
+
+# Values that are relative to the parameter's range rather than absolute numbers.
+RANGE_WORDS = {"off": 0.0, "none": 0.0, "silent": 0.0, "quarter": 0.25, "a quarter": 0.25,
+               "half": 0.5, "a half": 0.5, "full": 1.0, "max": 1.0, "maximum": 1.0}
+
+_NUMBER = r"(?:\d+(?:\.\d+)?|\.\d+|" + "|".join(sorted(NUMBER_WORDS, key=len, reverse=True)) + r")"
+_VALUE = r"(?P<value>" + "|".join(sorted(RANGE_WORDS, key=len, reverse=True)) + r"|" + _NUMBER + r"(?:\s*(?:%|percent))?)"
+_TRACK = r"(?:the\s+)?track[\s_]*(?P<track>\d+|" + "|".join(w for w in NUMBER_WORDS if " " not in w) + r")"
+_STEPS = r"(?P<steps>" + _NUMBER + r")"
+
+RECORD_PATTERNS = [
+    r"(?:start\s+)?record(?:ing)?(?:\s+(?:a\s+)?(?:new\s+)?loop)?",
+]
+STOP_PATTERNS = [
+    r"stop(?:[\s_]+recording)?(?:\s+and\s+save(?:\s+(?:it|the\s+loop))?)?",
+]
+UNDO_PATTERNS = [
+    r"undo(?:\s+(?:that|it|the\s+last\s+(?:change|action|thing)))?",
+    r"undo\s+(?:the\s+)?(?:last\s+)?" + _STEPS + r"(?:\s+(?:changes|actions|steps|things))?",
+    r"undo(?:\s+that)?\s+" + _STEPS + r"\s+times",
+    r"go\s+back\s+" + _STEPS + r"\s+steps?",
+]
+REDO_PATTERNS = [
+    r"redo(?:\s+(?:that|it|the\s+last\s+(?:change|action|thing)))?",
+    r"redo\s+(?:the\s+)?(?:last\s+)?" + _STEPS + r"(?:\s+(?:changes|actions|steps|things))?",
+    r"redo(?:\s+that)?\s+" + _STEPS + r"\s+times",
+]
+# "mute"/"unmute" name the state the track should end up in; only "toggle" flips it.
+TOGGLE_PATTERNS = [
+    r"(?P<verb>mute|unmute|silence|toggle)(?:\s+playback)?(?:\s+(?:of|on|for))?\s+" + _TRACK,
+    _TRACK + r"\s+(?P<verb>mute|unmute|on|off)",
+]
+PLAYING_AFTER = {"mute": False, "silence": False, "off": False, "unmute": True, "on": True}
+VOLUME_PATTERNS = [
+    r"(?:(?:set|change|turn|put)\s+)?(?:the\s+)?volume\s+(?:of|on|for)\s+" + _TRACK + r"\s+(?:to|at)\s+" + _VALUE,
+    r"(?:(?:set|change|turn|put)\s+)?" + _TRACK + r"(?:'s|s)?\s+volume\s+(?:to|at)\s+" + _VALUE,
+    r"(?:set|turn|bring)\s+" + _TRACK + r"\s+(?:up\s+|down\s+)?to\s+" + _VALUE,
+]
+EFFECT_PATTERNS = [
+    r"(?:(?:set|change|turn|put|add|apply)\s+)?(?:the\s+)?(?P<effect>reverb|delay)\s+(?:of|on|to|for)\s+" + _TRACK + r"\s+(?:to|at)\s+" + _VALUE,
+    r"(?:(?:set|change|turn|put)\s+)?" + _TRACK + r"(?:'s|s)?\s+(?P<effect>reverb|delay)\s+(?:to|at)\s+" + _VALUE,
+    r"(?:add|apply|put)\s+" + _VALUE + r"\s+(?:of\s+)?(?P<effect>reverb|delay)\s+(?:to|on)\s+" + _TRACK,
+]
+# Accepting the last suggestion ("yes", "sounds good"): generates the suggested music.
+# Only matched while a suggestion is pending; otherwise "ok" is just "ok".
+ACCEPT_PATTERNS = [
+    r"(?:yes|yeah|yep|sure|ok|okay|alright)(?:\s+(?:please|do\s+it|let'?s\s+do\s+it|go\s+for\s+it|sounds\s+good))?",
+    r"(?:let'?s\s+)?do\s+it",
+    r"go\s+for\s+it",
+    r"(?:that\s+)?sounds\s+(?:good|great|cool)",
+    r"let'?s\s+(?:hear|try)\s+(?:it|that)",
+]
+SUGGESTION_PATTERNS = [
+    r"(?:give\s+me\s+a\s+|any\s+)?(?:suggestion|suggestions|idea|ideas)",
+    r"what\s+should\s+(?:i|we)\s+(?:add|do|play)(?:\s+next)?",
+]
+
+
+def _compile(patterns):
+    return [re.compile(pattern + r"$") for pattern in patterns]
+
+
+_RULES = [
+    ("record", _compile(RECORD_PATTERNS)),
+    ("stop_recording", _compile(STOP_PATTERNS)),
+    ("undo", _compile(UNDO_PATTERNS)),
+    ("redo", _compile(REDO_PATTERNS)),
+    ("toggle_track_playback", _compile(TOGGLE_PATTERNS)),
+    ("modify_track_volume", _compile(VOLUME_PATTERNS)),
+    ("modify_track_effect", _compile(EFFECT_PATTERNS)),
+    ("get_creative_suggestion", _compile(SUGGESTION_PATTERNS)),
+    ("accept_suggestion", _compile(ACCEPT_PATTERNS)),
+]
+
+
+def normalize_command(command: str) -> str:
+    """
+    Normalizes a spoken command for matching and caching: lowercase, no
+    punctuation other than decimal points, percent signs and underscores,
+    and single spaces.
+    """
+    text = command.lower().strip()
+    text = re.sub(r"\.(?!\d)", " ", text)
+    text = re.sub(r"[^\w\s.%']", " ", text)
+    return " ".join(text.split())
+
+
+def _parse_number(text: str) -> float:
+    if text in NUMBER_WORDS:
+        return float(NUMBER_WORDS[text])
+    return float(text)
+
+
+def _parse_value(text: str, scale: float) -> float | None:
+    """
+    Converts a spoken value into a parameter value in the range 0..scale.
+    Range words ("half", "full") and numbers followed by "%" or "percent"
+    are relative to the range. Any other number is taken as is, in the
+    parameter's own units: "0.5" is a volume of 0.5 and "40" a reverb of 40.
+
+    A bare number that does not fit the range ("volume to 1.5", "volume to
+    50") or that could be a fraction of a 0..100 range ("reverb to 0.5") is
+    not guessed at; the command is left to the LLM.
+
+    Returns:
+        float | None: The value, or None if it is out of range or ambiguous.
+    """
+    text = text.strip()
+    if text in RANGE_WORDS:
+        return RANGE_WORDS[text] * scale
+
+    is_percent = text.endswith("%") or text.endswith("percent")
+    number = _parse_number(re.sub(r"\s*(%|percent)$", "", text))
+    if is_percent:
+        value = number / 100 * scale
+    elif scale > 1 and 0 < number <= 1:
+        return None
+    else:
+        value = number
+
+    if 0 <= value <= scale:
+        return round(value, 4)
+    return None
+
+
+def _track_id(text: str) -> str:
+    return f"track_{int(_parse_number(text))}"
+
+
+def parse_intent(command: str, pending_suggestion: bool = False) -> dict | None:
+    """
+    Parses a command into a tool call using local rules.
+
+    Args:
+        command (str): The raw or normalized command text.
+        pending_suggestion (bool): Whether a suggestion made at the current
+                                   history node is waiting for an answer. Only
+                                   then is "yes" or "sounds good" accepting it.
+
+    Returns:
+        dict | None: A tool call in the same shape the LLM returns
+                     ({"name": ..., "args": {...}}), or None if no rule
+                     matched and the command should go to the LLM.
+    """
+    text = normalize_command(command)
+    for tool_name, patterns in _RULES:
+        if tool_name == "accept_suggestion" and not pending_suggestion:
+            continue
+        for pattern in patterns:
+            match = pattern.match(text)
+            if not match:
+                continue
+            groups = match.groupdict()
+            if tool_name in ("record", "stop_recording", "get_creative_suggestion"):
+                return {"name": tool_name, "args": {}}
+            if tool_name == "accept_suggestion":
+                return {"name": "generate_new_music", "args": {"from_suggestion": True}}
+            if tool_name in ("undo", "redo"):
+                steps = int(_parse_number(groups["steps"])) if groups.get("steps") else 1
+                return {"name": tool_name, "args": {"steps": max(steps, 1)}}
+            if tool_name == "toggle_track_playback":
+                args = {"track_id": _track_id(groups["track"])}
+                if groups["verb"] in PLAYING_AFTER:
+                    args["is_playing"] = PLAYING_AFTER[groups["verb"]]
+                return {"name": tool_name, "args": args}
+            if tool_name == "modify_track_volume":
+                volume = _parse_value(groups["value"], scale=1.0)
+                if volume is None:
+                    return None
+                return {"name": tool_name, "args": {"track_id": _track_id(groups["track"]), "volume": volume}}
+            if tool_name == "modify_track_effect":
+                effect = groups["effect"]
+                value = _parse_value(groups["value"], scale=100.0)
+                if value is None:
+                    return None
+                return {"name": f"modify_track_{effect}", "args": {"track_id": _track_id(groups["track"]), effect: value}}
+    return None
+
+
+class ToolCallCache:
+    """
+    A bounded LRU cache of normalized command -> tool calls, for commands that
+    had to be routed by the LLM. The router only sends the command text to the
+    model, so the same text always routes the same way. An utterance can map
+    to several tool calls ("mute track 1 and add reverb to track 2"); they are
+    cached together, in order.
+    """
+    def __init__(self, max_size: int = 256):
+        """
+        Args:
+            max_size (int): The maximum number of cached commands. 0 disables the cache.
+        """
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, normalized_command: str) -> list[dict] | None:
+        with self._lock:
+            tool_calls = self._entries.get(normalized_command)
+            if tool_calls is None:
+                return None
+            self._entries.move_to_end(normalized_command)
+            return [{"name": call["name"], "args": dict(call["args"])} for call in tool_calls]
+
+    def put(self, normalized_command: str, tool_calls: list[dict]):
+        if self.max_size == 0:
+            return
+        with self._lock:
+            self._entries[normalized_command] = [
+                {"name": call["name"], "args": dict(call.get("args", {}))} for call in tool_calls
+            ]
+            self._entries.move_to_end(normalized_command)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RoutingStats:
+    """
+    Counts how commands were routed: by the local parser, from the LLM result
+    cache, or by a call to the LLM.
+    """
+    SOURCES = ("local", "cache", "llm")
+
+    def __init__(self):
+        self._counts = {source: 0 for source in self.SOURCES}
+        self._lock = threading.Lock()
+
+    def record(self, source: str):
+        with self._lock:
+            self._counts[source] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts = dict(self._counts)
+        total = sum(counts.values())
+        return {
+            **counts,
+            "total": total,
+            "local_hit_rate": counts["local"] / total if total else 0.0,
+            "llm_avoided_rate": (counts["local"] + counts["cache"]) / total if total else 0.0,
+        }
@@ -3,19 +3,39 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
-from fastapi import FastAPI
+import asyncio
+import json
+import os
+import re
+import tempfile
+import threading
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, Field
 import uvicorn
 from typing import List, Dict, TypedDict, Optional
 from functools import partial
 
-from langchain_core.tools import tool
-from langchain_openai import ChatOpenAI
-from langgraph.graph import StateGraph, END
+# The LangChain packages and langgraph take most of the import time, so they
+# are only imported when the agent is loaded (see load_agent).
 
+from admission import RequestCoalescer, AdmissionController, Overloaded
+from audio_cache import AudioCache
+import downloads
+from events import emit_event, emit_response, capture_events
+from executors import history_executor, analysis_executor, run_blocking, offload, GENERATION_WORKERS
+from generation_jobs import GenerationJobQueue, SUCCEEDED
 from history_manager import HistoryManager
-from nodes.music_generation_node import music_generation_node
+from history_transfer import export_lines, chunked, import_new_database
+from intent_parser import parse_intent, normalize_command, ToolCallCache, RoutingStats
+import metrics
+from metrics import instrument, timed, request_trace
+from projects import ProjectRegistry, Project, PROJECT_ID_PATTERN
+from snapshot_delta import diff_states
+from nodes.music_generation_node import music_generation_node, queue_generations
 from nodes.suggestion_nodes import analysis_node, suggestion_node
+from track_store import TrackStore
 
 
 # --- State Definition ---
@@ -37,6 +57,9 @@ class AgentState(TypedDict):
     modification_args: Optional[Dict]
     next_track_id: int
     next_node: Optional[str] # The decision from the router
+    tool_calls: Optional[List[Dict]] # Every tool call, when an utterance asks for several
+    analysis: Optional[Dict] # Audio features from analysis_node, for suggestion_node
+    analysis_summary: Optional[str]
 
 # --- Node Functions ---
 
@@ -55,12 +78,12 @@ def record_node(state: AgentState, history: HistoryManager):
 def stop_node(state: AgentState, history: HistoryManager):
     print("Executing stop node")
     new_state = state.copy()
-    new_state["tracks"] = [t.copy() for t in state["tracks"]]
     new_track_id = f"track_{state['next_track_id']}"
     new_track = Track(id=new_track_id, name=f"Loop {state['next_track_id']}", volume=1.0, is_playing=True, path=None, reverb=0.0, delay=0.0)
-    new_state["tracks"].append(new_track)
+    new_state["tracks"] = TrackStore.of(state["tracks"]).add(new_track)
     new_state["next_track_id"] += 1
     new_state["response"] = {"action": "stop_recording_and_create_loop", "track": new_track}
+    emit_response(new_state["response"])
     history.commit(new_state, state.get("history_node_id"))
     return new_state
 
@@ -70,31 +93,29 @@ def modify_track_node(state: AgentState, history: HistoryManager):
     if not args or "track_id" not in args: return fallback_node(state, history)
     
     new_state = state.copy()
-    new_state["tracks"] = [t.copy() for t in state["tracks"]]
+    tracks = TrackStore.of(state["tracks"])
     track_id = args["track_id"]
     response_args = {}
     action_key = ""
 
-    for track in new_state["tracks"]:
-        if track["id"] == track_id:
-            if "volume" in args:
-                action_key = "volume"
-                track["volume"] = args["volume"]
-                response_args = {"volume": args["volume"]}
-            elif "reverb" in args:
-                action_key = "reverb"
-                track["reverb"] = args["reverb"]
-                response_args = {"value": args["reverb"]}
-            elif "delay" in args:
-                action_key = "delay"
-                track["delay"] = args["delay"]
-                response_args = {"value": args["delay"]}
-            else:
-                return fallback_node(state, history)
-            break
+    if tracks.get(track_id) is not None:
+        if "volume" in args:
+            action_key = "volume"
+            response_args = {"volume": args["volume"]}
+        elif "reverb" in args:
+            action_key = "reverb"
+            response_args = {"value": args["reverb"]}
+        elif "delay" in args:
+            action_key = "delay"
+            response_args = {"value": args["delay"]}
+        else:
+            return fallback_node(state, history)
+        # Only the modified track is copied; the rest are shared with the previous state.
+        new_state["tracks"] = tracks.replace(track_id, **{action_key: args[action_key]})
             
     action = f"set_{action_key}"
     new_state["response"] = {"action": action, "track_id": track_id, **response_args}
+    emit_response(new_state["response"])
     history.commit(new_state, state.get("history_node_id"))
     return new_state
 
@@ -104,155 +125,421 @@ def toggle_playback_node(state: AgentState, history: HistoryManager):
     if not args or "track_id" not in args: return fallback_node(state, history)
     
     new_state = state.copy()
-    new_state["tracks"] = [t.copy() for t in state["tracks"]]
+    tracks = TrackStore.of(state["tracks"])
     track_id = args["track_id"]
     action = ""
     volume_for_unmute = 1.0
 
-    for track in new_state["tracks"]:
-        if track["id"] == track_id:
-            track["is_playing"] = not track["is_playing"]
-            action = "unmute_track" if track["is_playing"] else "mute_track"
-            volume_for_unmute = track["volume"]
-            break
+    track = tracks.get(track_id)
+    if track is not None:
+        # An explicit target ("mute", "unmute") leaves a track that is already there as it is.
+        is_playing = args["is_playing"] if args.get("is_playing") is not None else not track["is_playing"]
+        new_state["tracks"] = tracks.replace(track_id, is_playing=is_playing)
+        action = "unmute_track" if is_playing else "mute_track"
+        volume_for_unmute = track["volume"]
             
     new_state["response"] = {"action": action, "track_id": track_id, "volume": volume_for_unmute}
+    emit_response(new_state["response"])
     history.commit(new_state, state.get("history_node_id"))
     return new_state
 
+def _load_state_response(target_state: dict) -> dict:
+    """Sets a 'load_state' response on a state restored from history and returns it."""
+    state_payload = target_state.copy()
+    if "response" in state_payload: del state_payload["response"]
+    target_state["response"] = {"action": "load_state", "state": state_payload}
+    return target_state
+
+# The parts of AgentState the client mirrors. history_node_id is not listed:
+# it is at the top level of every response already.
+CLIENT_STATE_KEYS = ("tracks", "next_track_id")
+
+def _client_state(state: dict) -> dict:
+    """Returns the parts of a state the client mirrors."""
+    return {key: state[key] for key in CLIENT_STATE_KEYS if key in state}
+
+def _state_diff_response(response: dict, base_state: dict, base_node_id: str) -> dict:
+    """
+    Turns a 'load_state' response into an 'apply_state_diff' response, which
+    only lists what differs between the client's state (the one at
+    `base_node_id`) and the state to load: tracks added and removed, the
+    changed fields of the other tracks, and other changed keys. The diff has
+    the format of snapshot_delta.diff_states.
+
+    The 'load_state' response is returned unchanged when the diff cannot
+    describe the change (the tracks were reordered) or would touch at least
+    as many tracks as a full reload carries.
+    """
+    target_state = _client_state(response["state"])
+    diff = diff_states(base_state, target_state)
+    if "tracks" in diff.get("set", {}):
+        return response
+    track_diff = diff.get("tracks", {})
+    touched = len(track_diff.get("changed", ())) + len(track_diff.get("added", ())) + len(track_diff.get("removed", ()))
+    if touched and touched >= len(target_state.get("tracks", ())):
+        return response
+    diff_response = {key: value for key, value in response.items() if key not in ("action", "state")}
+    diff_response.update({"action": "apply_state_diff", "base_history_node_id": base_node_id, "diff": diff})
+    return diff_response
+
+def _history_steps(state: AgentState) -> int:
+    """Reads the number of undo/redo steps requested by the router, defaulting to one."""
+    args = state.get("modification_args") or {}
+    try:
+        return max(int(args.get("steps", 1)), 1)
+    except (TypeError, ValueError):
+        return 1
+
 def undo_node(state: AgentState, history: HistoryManager):
     print("Executing undo_node")
     current_node_id = state.get("history_node_id")
-    parent_id = history.get_parent_id(current_node_id) if current_node_id else None
+    target_id = history.undo_n(current_node_id, _history_steps(state)) if current_node_id else None
     
-    if not parent_id:
+    if not target_id:
         state["response"] = {"speak": "You are at the beginning of the history."}
         return state
         
-    reverted_state = history.get_state(parent_id)
+    reverted_state = history.get_state(target_id)
     if not reverted_state:
         state["response"] = {"speak": "I could not find the previous state to restore."}
         return state
 
-    state_payload = reverted_state.copy()
-    if "response" in state_payload: del state_payload["response"]
-    reverted_state["response"] = {"action": "load_state", "state": state_payload}
-    return reverted_state
+    return _load_state_response(reverted_state)
+
+def redo_node(state: AgentState, history: HistoryManager):
+    print("Executing redo_node")
+    current_node_id = state.get("history_node_id")
+    target_id = history.redo(current_node_id, _history_steps(state)) if current_node_id else None
+
+    if not target_id:
+        state["response"] = {"speak": "There is nothing to redo."}
+        return state
+
+    restored_state = history.get_state(target_id)
+    if not restored_state:
+        state["response"] = {"speak": "I could not find the state to restore."}
+        return state
+
+    return _load_state_response(restored_state)
 
 def fallback_node(state: AgentState, history: HistoryManager):
     state["response"] = {"speak": "I'm not sure how to do that."}
     return state
+
+class StagedHistory:
+    """
+    Stands in for the HistoryManager while a batch of tool calls runs. Nodes
+    commit to it as usual, but nothing is written: the working state keeps
+    its parent's history_node_id, and the batch commits once at the end.
+    Reads are passed through to the real history.
+    """
+    def __init__(self, history: HistoryManager):
+        self.history = history
+        self.pending = False
+
+    def commit(self, state_snapshot: dict, parent_id: str | None) -> str:
+        state_snapshot["history_node_id"] = parent_id
+        self.pending = True
+        return parent_id
+
+    def __getattr__(self, name):
+        return getattr(self.history, name)
+
+def _combine_responses(responses: list[dict], final_state: dict) -> dict:
+    """
+    Merges the responses of a batch into one. "actions" lists every
+    audio-engine action in order, and the spoken texts are joined. A client
+    that reads only the top-level action must still end up in the batch's
+    final state: a single action stays at the top level, and several become
+    a 'load_state' of the final state, carrying the job_id of any generation
+    the batch started.
+    """
+    actions = [response for response in responses if "action" in response]
+    if len(actions) == 1:
+        combined = {key: value for key, value in actions[0].items() if key != "speak"}
+    elif actions:
+        state_payload = {**_client_state(final_state), "history_node_id": final_state.get("history_node_id")}
+        combined = {"action": "load_state", "state": state_payload}
+        combined.update({"job_id": action["job_id"] for action in actions if "job_id" in action})
+    else:
+        combined = {}
+    combined["actions"] = actions
+    speak = " ".join(response["speak"] for response in responses if response.get("speak"))
+    if speak:
+        combined["speak"] = speak
+    return combined
+
+def batch_node(state: AgentState, history: HistoryManager, jobs: GenerationJobQueue, analyzer=None):
+    """
+    Runs every tool call from one utterance, in order, against one working
+    state, and commits the result as a single history node with one combined
+    response.
+
+    Changes staged earlier in the batch count as the most recent step: an
+    undo first discards them and only then steps back through the history,
+    and there is nothing to redo after them. Music generation is queued after the commit,
+    so the job builds on the batch's result; several generations become one
+    job that runs them concurrently and commits their tracks together.
+    """
+    tool_calls = state.get("tool_calls") or []
+    print(f"Executing batch_node with {len(tool_calls)} tool calls")
+    staged = StagedHistory(history)
+    working = state
+    responses = []
+    generations = []
+
+    for tool_call in tool_calls:
+        node_name = _node_for_tool(tool_call["name"])
+        args = tool_call.get("args", {})
+        if node_name == "generate_new_music_node":
+            generations.append(args)
+            continue
+        working = {**working, "modification_args": args}
+        if node_name == "undo_node" and staged.pending:
+            working = _undo_staged(working, history)
+            staged.pending = "action" not in working["response"]
+        elif node_name == "redo_node" and staged.pending:
+            working["response"] = {"speak": "There is nothing to redo."}
+        elif node_name == "get_creative_suggestion_node":
+            working = suggestion_node(analysis_node(working, staged, analyzer=analyzer), staged, jobs=jobs)
+            working.pop("analysis", None)
+            working.pop("analysis_summary", None)
+        else:
+            working = BATCH_NODES.get(node_name, fallback_node)(working, staged)
+            if node_name in ("undo_node", "redo_node") and "action" in working["response"]:
+                staged.pending = False
+        responses.append(working.pop("response", {}))
+
+    if staged.pending:
+        history.commit(working, working.get("history_node_id"))
+    if generations:
+        working = queue_generations(working, history, jobs, generations)
+        responses.append(working.pop("response"))
+
+    working["response"] = _combine_responses(responses, working)
+    return working
+
+def _undo_staged(working: dict, history: HistoryManager) -> dict:
+    """
+    Undoes within a batch that has staged changes: the first step drops
+    them, returning to the node the batch is working from; any further
+    steps go back from there.
+    """
+    base_id = working.get("history_node_id")
+    steps = _history_steps(working) - 1
+    target_id = (history.undo_n(base_id, steps) if steps else None) or base_id
+    target_state = history.get_state(target_id)
+    if not target_state:
+        working["response"] = {"speak": "I could not find the previous state to restore."}
+        return working
+    return _load_state_response(target_state)
     
 # --- LLM Router and Tools ---
+# The tool functions are plain functions here; get_llm_with_tools() turns them
+# into LangChain tools when the chat model is created.
 
-@tool
 def record():
     """Call this to start recording a new audio loop."""
     pass
 
-@tool
 def stop_recording():
     """Call this to stop recording and save the loop."""
     pass
 
-@tool
-def undo():
-    """Undo the most recent action, reverting the session to its previous state."""
+def undo(steps: int = Field(1, description="How many recent actions to undo, e.g., 5 for 'undo the last five changes'.")):
+    """Undo the most recent action(s), reverting the session to an earlier state."""
+    pass
+
+def redo(steps: int = Field(1, description="How many undone actions to redo.")):
+    """Redo action(s) that were previously undone."""
     pass
 
-@tool
 def modify_track_volume(track_id: str = Field(..., description="The ID of the track to modify, e.g., 'track_0'."), volume: float = Field(..., description="The new volume level, from 0.0 to 1.0.")):
     """Change the volume of a specific track."""
     pass
 
-@tool
 def modify_track_reverb(track_id: str = Field(..., description="The ID of the track to modify, e.g., 'track_0'."), reverb: float = Field(..., description="The new reverb level, from 0.0 to 100.0.")):
     """Apply a reverb effect to a specific track."""
     pass
 
-@tool
 def modify_track_delay(track_id: str = Field(..., description="The ID of the track to modify, e.g., 'track_0'."), delay: float = Field(..., description="The new delay level, from 0.0 to 100.0.")):
     """Apply a delay effect to a specific track."""
     pass
 
-@tool
-def toggle_track_playback(track_id: str = Field(..., description="The ID of the track to mute or unmute, e.g., 'track_0'.")):
+def toggle_track_playback(track_id: str = Field(..., description="The ID of the track to mute or unmute, e.g., 'track_0'."),
+                          is_playing: Optional[bool] = Field(None, description="False to mute, True to unmute. Leave it out only to flip the track's current state.")):
     """Mute or unmute a specific track."""
     pass
 
-@tool
 def generate_new_music(prompt: str = Field(..., description="A description of the music to generate, e.g., 'a funky bassline'.")):
-    """Generate a new musical piece using AI."""
+    """Generate a new musical piece using AI. For several parts (e.g. 'a drum loop, a bassline and a pad'), call this once per part."""
     pass
 
-@tool
 def get_creative_suggestion():
     """Get a creative suggestion for what to add to the current session."""
     pass
 
-tools = [record, stop_recording, undo, modify_track_volume, modify_track_reverb, modify_track_delay, toggle_track_playback, generate_new_music, get_creative_suggestion]
-llm = ChatOpenAI(model="gpt-4o", temperature=0)
-llm_with_tools = llm.bind_tools(tools)
+tool_functions = [record, stop_recording, undo, redo, modify_track_volume, modify_track_reverb, modify_track_delay, toggle_track_playback, generate_new_music, get_creative_suggestion]
+llm = None
+llm_with_tools = None
+
+def get_llm_with_tools():
+    """Creates the tool-bound chat model on first use."""
+    global llm, llm_with_tools
+    if llm_with_tools is None:
+        from langchain_core.tools import tool
+        from langchain_openai import ChatOpenAI
+        llm = ChatOpenAI(model="gpt-4o", temperature=0)
+        llm_with_tools = llm.bind_tools([tool(func) for func in tool_functions])
+    return llm_with_tools
+
+route_cache = ToolCallCache(max_size=int(os.environ.get("JAM_ROUTE_CACHE_SIZE", "256")))
+routing_stats = RoutingStats()
+
+# Identical commands share one execution while it runs and for this many seconds after.
+request_coalescer = RequestCoalescer(window=float(os.environ.get("JAM_COALESCE_WINDOW", "1.0")),
+                                     enabled=os.environ.get("JAM_COALESCE", "1") == "1")
+admission = AdmissionController(
+    per_client_limit=int(os.environ.get("JAM_CLIENT_MAX_RUNNING", "2")),
+    per_client_queue=int(os.environ.get("JAM_CLIENT_MAX_QUEUED", "4")),
+    global_limit=int(os.environ.get("JAM_MAX_RUNNING", "16")),
+    queue_timeout=float(os.environ.get("JAM_ADMISSION_TIMEOUT", "10")),
+)
+# Tools whose work is slow or costly enough to be subject to admission control.
+EXPENSIVE_TOOLS = ("generate_new_music", "get_creative_suggestion")
+
+def _is_expensive(command: str) -> bool:
+    """
+    True if a command needs admission: it will be routed by the LLM, or it
+    asks for music generation or a suggestion. Commands the local parser or
+    the route cache already understand otherwise cost only a commit, and
+    record/stop are never held up.
+    """
+    tool_call = parse_intent(command)
+    if tool_call:
+        return tool_call["name"] in EXPENSIVE_TOOLS
+    tool_calls = route_cache.get(normalize_command(command))
+    return tool_calls is None or any(call["name"] in EXPENSIVE_TOOLS for call in tool_calls)
+
+async def route_command(command: str, pending_suggestion: bool = False) -> list[dict]:
+    """
+    Decides which tools a command maps to. The local rule-based parser is tried
+    first; commands it does not understand are routed by the LLM, and the
+    LLM's choice is cached by normalized command text. A bare "yes" or "ok"
+    only accepts a suggestion locally when `pending_suggestion` is set.
+
+    Returns:
+        list[dict]: The tool calls ({"name": ..., "args": {...}}) in order; empty if no tool applies.
+    """
+    tool_call = parse_intent(command, pending_suggestion)
+    if tool_call:
+        routing_stats.record("local")
+        return [tool_call]
+
+    normalized = normalize_command(command)
+    tool_calls = route_cache.get(normalized)
+    if tool_calls:
+        routing_stats.record("cache")
+        return tool_calls
+
+    routing_stats.record("llm")
+    with timed("router.llm"):
+        tool_calls = (await get_llm_with_tools().ainvoke(command)).tool_calls
+    if not tool_calls:
+        return []
+    tool_calls = [{"name": call["name"], "args": call.get("args", {})} for call in tool_calls]
+    route_cache.put(normalized, tool_calls)
+    return tool_calls
+
+def _node_for_tool(tool_name: str) -> str:
+    """Maps a tool name to the node that carries it out."""
+    if tool_name in ["modify_track_volume", "modify_track_reverb", "modify_track_delay"]:
+        return "modify_track_node"
+    return tool_name.replace("_last_action", "") + "_node"
 
-def router_node(state: AgentState) -> dict:
+async def router_node(state: AgentState) -> dict:
     """
-    This node is the new entry point. It uses the LLM to decide which
-    tool to use, and it updates the state with the arguments for that tool
-    and the name of the next node to run.
+    This node is the new entry point. It decides which tool to use (locally
+    when possible, otherwise with the LLM), and it updates the state with the
+    arguments for that tool and the name of the next node to run.
     """
     command = state.get("command", "")
+    tool_calls = []
     if not command:
         next_node = "no_op_node"
         modification_args = {}
     else:
-        tool_calls = llm_with_tools.invoke(command).tool_calls
+        pending = generation_jobs is not None and generation_jobs.has_suggestion(state.get("history_node_id"))
+        tool_calls = await route_command(command, pending)
         if not tool_calls:
             next_node = "fallback_node"
             modification_args = {}
+        elif len(tool_calls) > 1:
+            # Several actions in one utterance run together, with one commit.
+            next_node = "batch_node"
+            modification_args = {}
         else:
-            first_call = tool_calls[0]
-            tool_name = first_call['name']
-            modification_args = first_call.get('args', {})
-            
-            # Map tool names to node names
-            if tool_name in ["modify_track_volume", "modify_track_reverb", "modify_track_delay"]:
-                next_node = "modify_track_node"
-            else:
-                next_node = tool_name.replace("_last_action", "") + "_node"
+            next_node = _node_for_tool(tool_calls[0]['name'])
+            modification_args = tool_calls[0].get('args', {})
     
+    route = {"next_node": next_node, "modification_args": modification_args}
+    if next_node == "batch_node":
+        route["tool_calls"] = tool_calls
+    emit_event("route", route)
     return {
         "modification_args": modification_args,
-        "next_node": next_node
+        "next_node": next_node,
+        "tool_calls": tool_calls if next_node == "batch_node" else None
     }
 
 def select_next_node(state: AgentState) -> str:
     """This function is used in the conditional edge to route to the next node."""
     return state.get("next_node", "fallback_node")
 
+# The nodes a batch can run directly. Generation and suggestions are handled by batch_node itself.
+BATCH_NODES = {
+    "record_node": record_node,
+    "stop_recording_node": stop_node,
+    "undo_node": undo_node,
+    "redo_node": redo_node,
+    "modify_track_node": modify_track_node,
+    "toggle_track_playback_node": toggle_playback_node,
+}
+
 # --- Graph Construction ---
 
-def create_graph(history_manager: HistoryManager) -> StateGraph:
+def create_graph(history_manager: HistoryManager, generation_jobs: GenerationJobQueue, analyzer=None):
+    from langgraph.graph import StateGraph, END
+
     graph_builder = StateGraph(AgentState)
     
     node_functions = {
         "record_node": record_node,
         "stop_recording_node": stop_node,
         "undo_node": undo_node,
+        "redo_node": redo_node,
         "modify_track_node": modify_track_node,
         "toggle_track_playback_node": toggle_playback_node,
-        "generate_new_music_node": music_generation_node,
-        "get_creative_suggestion_node": analysis_node,
+        "generate_new_music_node": partial(music_generation_node, jobs=generation_jobs),
+        "get_creative_suggestion_node": partial(analysis_node, analyzer=analyzer),
         "no_op_node": no_op_node,
-        "fallback_node": fallback_node
+        "fallback_node": fallback_node,
+        "batch_node": partial(batch_node, jobs=generation_jobs, analyzer=analyzer)
     }
+    # Audio analysis is CPU-bound and can take a while on new files, so it
+    # gets its own pool rather than holding up history work.
+    node_executors = {"get_creative_suggestion_node": analysis_executor}
     
-    # Add all the worker nodes
+    # Add all the worker nodes. They block on SQLite, so each runs on a
+    # bounded executor instead of the event loop.
     for name, func in node_functions.items():
-        graph_builder.add_node(name, partial(func, history=history_manager))
+        executor = node_executors.get(name, history_executor)
+        # The timer wraps the offloaded node, so executor queueing counts towards it.
+        graph_builder.add_node(name, instrument(f"node.{name}")(offload(partial(func, history=history_manager), executor)))
 
     # Add the router and suggestion nodes
-    graph_builder.add_node("router", router_node)
-    graph_builder.add_node("suggestion_node", suggestion_node)
+    graph_builder.add_node("router", instrument("node.router")(router_node))
+    graph_builder.add_node("suggestion_node", instrument("node.suggestion_node")(partial(suggestion_node, history=history_manager, jobs=generation_jobs)))
     
     # The graph starts at the router
     graph_builder.set_entry_point("router")
@@ -278,53 +565,561 @@ def create_graph(history_manager: HistoryManager) -> StateGraph:
 
     return graph_builder.compile()
 
-# --- FastAPI App ---
+# --- Services ---
+# Nothing is opened at import time. init_services() opens the default project
+# (project.db) and the generation queue, which the record/stop fast path
+# needs; load_agent() adds the LLM client, the audio analyzer and the compiled
+# graph. The startup hook does the first right away and the second in the
+# background, and both also run on demand. Requests that name a project_id
+# use that project's own database and graph instead (see projects.py).
+
+history: HistoryManager | None = None  # The default project's history.
+projects: ProjectRegistry | None = None
+audio_cache: AudioCache | None = None
+generation_jobs: GenerationJobQueue | None = None
+audio_analyzer = None
+graph = None  # The default project's graph.
+_services_lock = threading.Lock()
+_agent_lock = threading.Lock()
+
+def open_history(database_path: str) -> HistoryManager:
+    """Opens a project's history database, creating its root node if it is new."""
+    history_manager = HistoryManager(
+        database_path,
+        storage_mode=os.environ.get("JAM_HISTORY_STORAGE", "full"),
+        keyframe_interval=int(os.environ.get("JAM_KEYFRAME_INTERVAL", "32")),
+        cache_size=int(os.environ.get("JAM_HISTORY_CACHE_SIZE", "128")),
+        performance_mode=os.environ.get("JAM_HISTORY_PERFORMANCE", "0") == "1",
+        group_commit=os.environ.get("JAM_HISTORY_GROUP_COMMIT", "0") == "1",
+        snapshot_codec=os.environ.get("JAM_HISTORY_CODEC", "json"),
+    )
+    if history_manager.get_root_node_id() is None:
+        history_manager.commit({"tracks": [], "next_track_id": 0}, parent_id=None)
+    return history_manager
+
+def init_services():
+    """Opens the default project, the audio cache and the generation queue, once."""
+    global history, projects, audio_cache, generation_jobs
+    with _services_lock:
+        if history is not None:
+            return
+        registry = ProjectRegistry(
+            os.environ.get("JAM_PROJECTS_DIR", "projects"),
+            open_history,
+            default_path="project.db",
+            max_open=int(os.environ.get("JAM_MAX_OPEN_PROJECTS", "64")),
+            # Keep a project open while generation jobs will still commit to it.
+            is_busy=lambda project_history: generation_jobs.pending_for(project_history) > 0,
+        )
+        history_manager = registry.get(None).history
+
+        audio_cache = AudioCache(
+            os.environ.get("JAM_AUDIO_CACHE_DIR", "audio_cache"),
+            max_bytes=int(os.environ.get("JAM_AUDIO_CACHE_MB", "512")) * 1024 * 1024,
+        )
+        generation_jobs = GenerationJobQueue(
+            history_manager,
+            audio_cache=audio_cache,
+            max_workers=GENERATION_WORKERS,
+            # Speculative generation of suggested music; off unless a limit is set.
+            speculative_limit=int(os.environ.get("JAM_SPECULATIVE_LIMIT", "0")),
+            speculative_budget=int(os.environ.get("JAM_SPECULATIVE_BUDGET_PER_HOUR", "20")),
+            speculative_ttl=float(os.environ.get("JAM_SPECULATIVE_TTL", "600")),
+            # Several tracks asked for in one utterance are generated concurrently.
+            fanout_limit=int(os.environ.get("JAM_GENERATION_FANOUT", "4")),
+            fanout_deadline=float(os.environ.get("JAM_GENERATION_DEADLINE", "120")),
+        )
+        projects = registry
+        history = history_manager
+
+def load_agent():
+    """
+    Imports the LLM and analysis stacks, creates the chat model and the audio
+    analyzer, and compiles the graph, once.
+    This is the slow part of startup; it blocks, so call it off the event loop.
+
+    Returns:
+        The compiled graph.
+    """
+    global graph, audio_analyzer
+    with _agent_lock:
+        if graph is None:
+            init_services()
+            get_llm_with_tools()
+            from audio_analysis import AudioAnalyzer
+            audio_analyzer = AudioAnalyzer(max_entries=int(os.environ.get("JAM_ANALYSIS_CACHE_SIZE", "256")))
+            graph = create_graph(history, generation_jobs, audio_analyzer)
+            projects.get(None).graph = graph
+            print("Agent loaded.")
+    return graph
+
+def load_project_graph(project: Project):
+    """Compiles a project's graph, bound to its history, once."""
+    load_agent()
+    with _agent_lock:
+        if project.graph is None:
+            project.graph = create_graph(project.history, generation_jobs, audio_analyzer)
+    return project.graph
+
+async def get_graph(project: Project | None = None):
+    """
+    Returns the compiled graph of a project (the default project if None),
+    waiting for (or starting) load_agent if needed.
+    """
+    project = project or projects.get(None)
+    if project.graph is not None:
+        return project.graph
+    return await asyncio.get_running_loop().run_in_executor(None, load_project_graph, project)
+
+# Seconds between background history compactions; 0 turns them off.
+HISTORY_COMPACT_INTERVAL = float(os.environ.get("JAM_HISTORY_COMPACT_INTERVAL", "0"))
+# Compaction keeps the ancestry of this many of the most recent history nodes.
+HISTORY_KEEP_RECENT = int(os.environ.get("JAM_HISTORY_KEEP_RECENT", "500"))
+
+async def compact_history_periodically(interval: float):
+    """
+    Prunes abandoned history branches every `interval` seconds. Compaction
+    runs on the default executor, not history_executor, and works in short
+    batches, so /command keeps committing while it runs. Each project is
+    acquired while it is compacted, so the registry does not close it midway.
+    """
+    def compact(project_id: str) -> dict:
+        project = projects.acquire(project_id)
+        try:
+            return project.history.compact(keep_recent=HISTORY_KEEP_RECENT)
+        finally:
+            projects.release(project)
+
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval)
+        for project in projects.open_projects():
+            try:
+                stats = await loop.run_in_executor(None, compact, project.project_id)
+                print(f"History compaction of project '{project.project_id}': {stats}")
+            except Exception as e:
+                print(f"History compaction of project '{project.project_id}' failed: {e}")
 
-history = HistoryManager("project.db")
-if history.get_root_node_id() is None:
-    history.commit({"tracks": [], "next_track_id": 0}, parent_id=None)
+def _report_agent_warmup(future: asyncio.Future):
+    """Logs why the background load_agent failed; get_graph retries it on the next command."""
+    if not future.cancelled() and future.exception() is not None:
+        print(f"Loading the agent failed: {future.exception()!r}")
 
-graph = create_graph(history)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    init_services()
+    # Warm the agent in the background; record/stop do not need it.
+    asyncio.get_running_loop().run_in_executor(None, load_agent).add_done_callback(_report_agent_warmup)
+    compaction = asyncio.create_task(compact_history_periodically(HISTORY_COMPACT_INTERVAL)) if HISTORY_COMPACT_INTERVAL > 0 else None
+    yield
+    if compaction:
+        compaction.cancel()
+    generation_jobs.shutdown(wait=False)
+
+# The names clients may give branches of a project's history.
+BRANCH_NAME_PATTERN = re.compile(r"[A-Za-z0-9][A-Za-z0-9 _.-]{0,63}")
 
 class CommandRequest(BaseModel):
     text: str
     history_node_id: Optional[str] = None
+    # The project to run the command in; None uses the default project.
+    project_id: Optional[str] = Field(None, pattern=f"^{PROJECT_ID_PATTERN.pattern}$")
+    # Lets the server answer undo, redo and reloads with the difference from
+    # the state at history_node_id ('apply_state_diff') instead of 'load_state'.
+    accept_diff: bool = False
+    # Identifies the client for admission control; defaults to its address.
+    client_id: Optional[str] = None
+    # Without a history_node_id, the command runs at the tip of this branch, or
+    # at the most recently committed node of any branch when None.
+    branch: Optional[str] = Field(None, pattern=f"^{BRANCH_NAME_PATTERN.pattern}$")
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
-@app.post("/command")
-async def process_command(req: CommandRequest):
+async def execute_command(req: CommandRequest, client: str | None = None) -> dict:
     """
-    Handles incoming commands. For time-sensitive actions like 'record' and
-    'stop_recording', it bypasses the LangGraph for immediate execution.
+    Runs a command and returns its response. For time-sensitive actions like
+    'record' and 'stop_recording', it bypasses the LangGraph for immediate
+    execution, and are available before the LLM stack has finished loading.
     All other commands are routed through the LLM-powered graph.
+    Each command runs against the history of its request's project.
+
+    Identical requests (same project, history node or branch and normalized text) that
+    arrive while one is running, or just after, share its execution and its
+    response. Expensive commands (see _is_expensive) run under the client's
+    admission limits.
+
+    Args:
+        req (CommandRequest): The command.
+        client (str | None): The client's address, used when the request has no client_id.
+
+    Raises:
+        Overloaded: If the command was shed by admission control.
     """
-    node_id = req.history_node_id or history.get_root_node_id()
-    initial_state = history.get_state(node_id)
+    init_services()
+    key = (req.project_id, req.history_node_id, req.branch, normalize_command(req.text), req.accept_diff)
+    return await request_coalescer.run(key, partial(_admit_command, req, req.client_id or client or "anonymous"))
+
+async def _admit_command(req: CommandRequest, client: str) -> dict:
+    if not _is_expensive(req.text):
+        return await _run_command(req)
+    async with admission.admit(client):
+        return await _run_command(req)
+
+async def _run_command(req: CommandRequest) -> dict:
+    project = await run_blocking(history_executor, projects.acquire, req.project_id)
+    try:
+        return await _execute_in_project(req, project)
+    finally:
+        projects.release(project)
+
+async def _execute_in_project(req: CommandRequest, project: Project) -> dict:
+    history = project.history
+    node_id = req.history_node_id
+    if node_id is None and req.branch is not None:
+        node_id = await run_blocking(history_executor, history.get_branch, req.branch)
+        if node_id is None:
+            return {"speak": f"Error: There is no branch called '{req.branch}'."}
+    elif node_id is None:
+        # A client without a history node resumes where the project was last changed.
+        node_id = await run_blocking(history_executor, history.get_latest_node_id)
+    initial_state = await run_blocking(history_executor, history.get_state, node_id)
     if not initial_state:
         return {"speak": "Error: Could not load session state."}
+    # The state the client holds, when it is known and the client can apply a diff to it.
+    base_state = _client_state(initial_state) if req.accept_diff and req.history_node_id else None
     
     initial_state["command"] = req.text
+    local_intent = parse_intent(req.text)
+    fast_path_tool = local_intent["name"] if local_intent else None
     
     # --- Fast Path for Real-Time Commands ---
-    if req.text == "record":
+    if fast_path_tool == "record":
         print("Fast path: Executing record_node directly.")
-        final_state = record_node(initial_state, history)
-    elif req.text == "stop_recording":
+        routing_stats.record("local")
+        emit_event("route", {"next_node": "record_node", "modification_args": {}})
+        with timed("node.record_node"):
+            final_state = record_node(initial_state, history)
+    elif fast_path_tool == "stop_recording":
         print("Fast path: Executing stop_node directly.")
-        final_state = stop_node(initial_state, history)
+        routing_stats.record("local")
+        emit_event("route", {"next_node": "stop_recording_node", "modification_args": {}})
+        with timed("node.stop_recording_node"):
+            final_state = await run_blocking(history_executor, stop_node, initial_state, history)
     else:
         # --- Default Path for LLM-Routed Commands ---
         print("Default path: Invoking LangGraph.")
-        final_state = graph.invoke(initial_state)
+        final_state = await (await get_graph(project)).ainvoke(initial_state)
     
     response = final_state.get("response", {})
+    if base_state is not None and response.get("action") == "load_state":
+        response = _state_diff_response(response, base_state, req.history_node_id)
     if "history_node_id" in final_state:
         response["history_node_id"] = final_state["history_node_id"]
     
     print(f"Responding with: {response}")
     return response
 
+# What the agent says when a command is shed by admission control.
+OVERLOADED_SPEAK = "I'm still working on your last few requests. Please try that again in a moment."
+
+@app.post("/command")
+async def process_command(req: CommandRequest, request: Request):
+    """
+    Handles incoming commands and responds with a single JSON body once the
+    command (including its history commit) has finished. A command shed by
+    admission control gets a 429 response with a Retry-After header.
+    """
+    with request_trace("/command", command=req.text):
+        try:
+            response = await execute_command(req, client=request.client.host if request.client else None)
+        except Overloaded as e:
+            return JSONResponse({"speak": OVERLOADED_SPEAK, "retry_after": e.retry_after}, status_code=429,
+                                headers={"Retry-After": str(max(int(e.retry_after), 1))})
+        with timed("serialize"):
+            return JSONResponse(response)
+
+def _sse(event: str, data: dict) -> str:
+    """Formats one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _final_events(response: dict, sent: set) -> list[str]:
+    """
+    Formats the end of a command stage: the speak and action events that the
+    node did not already stream, followed by the resulting history node.
+    """
+    chunks = []
+    if "speak" in response and "speak" not in sent:
+        chunks.append(_sse("speak", {"speak": response["speak"]}))
+    if "action" in response and "action" not in sent:
+        chunks.append(_sse("action", {k: v for k, v in response.items() if k not in ("speak", "history_node_id")}))
+    if "history_node_id" in response:
+        chunks.append(_sse("history", {"history_node_id": response["history_node_id"]}))
+    return chunks
+
+@app.post("/command/stream")
+async def stream_command(req: CommandRequest, request: Request):
+    """
+    Streaming variant of /command, as server-sent events. Events are sent as
+    soon as each stage is known, so the client can act before persistence:
+
+    - route:    the routing decision ({"next_node", "modification_args"})
+    - speak:    text for the agent to say
+    - action:   the audio-engine action, shaped like a /command response
+    - progress: progress of long-running work, such as music generation
+    - history:  the history_node_id after the change was committed
+    - done:     the complete response, exactly as /command would return it
+
+    For music generation the stream stays open until the background job
+    finishes, and then repeats speak/action/history/done for the new track.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+
+    def sink(event: str, data: dict):
+        loop.call_soon_threadsafe(queue.put_nowait, (event, data))
+
+    async def run():
+        with capture_events(sink), request_trace("/command/stream", command=req.text):
+            try:
+                response = await execute_command(req, client=request.client.host if request.client else None)
+            except Overloaded as e:
+                response = {"speak": OVERLOADED_SPEAK, "retry_after": e.retry_after}
+            except Exception as e:
+                print(f"Streaming command failed: {e}")
+                response = {"speak": "I'm sorry, something went wrong with that command."}
+        queue.put_nowait(("result", response))
+
+    async def event_stream():
+        task = asyncio.create_task(run())
+        sent = set()
+        job_id = None
+        backlog = []  # Job events that arrived before the command's own result.
+        while True:
+            if job_id and backlog:
+                event, data = backlog.pop(0)
+            else:
+                event, data = await queue.get()
+            if job_id is None and event != "result" and "job_id" in data:
+                backlog.append((event, data))
+                continue
+
+            if event in ("result", "job_result"):
+                response = data["result"] if event == "job_result" else data
+                for chunk in _final_events(response, sent):
+                    yield chunk
+                sent.clear()
+                if event == "result" and response.get("action") == "generation_started":
+                    job_id = response["job_id"]
+                    continue
+                yield _sse("done", response)
+                break
+
+            if event in ("speak", "action"):
+                sent.add(event)
+            yield _sse(event, data)
+        await task
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+@app.get("/jobs/stats")
+async def get_generation_job_stats():
+    """Reports generation queue depth, wait time and run time, for sizing the worker pool."""
+    init_services()
+    return {**generation_jobs.stats(), "audio_cache": audio_cache.stats(), "downloads": downloads.stats()}
+
+@app.get("/jobs/{job_id}")
+async def get_generation_job(job_id: str):
+    """
+    Reports the status of a music generation job. Once it has succeeded, its
+    'result' holds the 'add_new_track' response, including the new history_node_id.
+    A job that generates several tracks also lists each one's outcome under 'generations'.
+    """
+    init_services()
+    job = generation_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Unknown generation job.")
+    return job
+
+@app.get("/jobs/{job_id}/audio")
+async def get_generation_job_audio(job_id: str, track: int = 0):
+    """
+    Delivers the audio file of a finished music generation job. For a job
+    that generated several tracks, `track` selects one by its position.
+    """
+    init_services()
+    job = generation_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Unknown generation job.")
+    if job["status"] != SUCCEEDED:
+        raise HTTPException(status_code=409, detail=f"Generation job is {job['status']}.")
+    if "generations" not in job:
+        return FileResponse(job["output_path"], media_type="audio/mpeg")
+    if not 0 <= track < len(job["generations"]):
+        raise HTTPException(status_code=404, detail="Unknown track of generation job.")
+    generation = job["generations"][track]
+    if generation["status"] != SUCCEEDED:
+        raise HTTPException(status_code=409, detail=f"Generation of track {track} {generation['status']}.")
+    return FileResponse(generation["output_path"], media_type="audio/mpeg")
+
+async def _acquire_existing_project(project_id: str) -> Project:
+    """Acquires a project that already exists, for an endpoint; the caller releases it."""
+    try:
+        project_id = projects.validate(project_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not os.path.exists(projects.path_for(project_id)):
+        raise HTTPException(status_code=404, detail="Unknown project.")
+    return await run_blocking(history_executor, projects.acquire, project_id)
+
+# Import bodies larger than this are spooled to disk instead of memory.
+IMPORT_SPOOL_BYTES = 8 * 1024 * 1024
+
+class ProjectStreamingResponse(StreamingResponse):
+    """
+    Streams a body read from an acquired project and releases the project
+    when the response ends, however it ends: the body was sent, the client
+    disconnected, or sending failed before the body was read at all.
+    """
+    def __init__(self, project: Project, content, **kwargs):
+        super().__init__(content, **kwargs)
+        self.project = project
+        self.content = content
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # Ends a body that was not read to the end, so it lets go of the database first.
+            self.content.close()
+            projects.release(self.project)
+
+@app.get("/projects/{project_id}/history/export")
+async def export_project_history(project_id: str, node_id: Optional[str] = None):
+    """
+    Streams a project's history (or only the path from the root to `node_id`)
+    as newline-delimited JSON, in chunks, without loading it into memory. See
+    history_transfer.py for the format; the export can be restored with the
+    import endpoint or `history_cli.py import`.
+    """
+    init_services()
+    project = await _acquire_existing_project(project_id)
+    try:
+        # iter_nodes only exports nodes still in the history, not archived ones.
+        if node_id is not None and not await run_blocking(history_executor, project.history.has_node, node_id):
+            raise HTTPException(status_code=404, detail="Unknown history node.")
+        return ProjectStreamingResponse(project, chunked(export_lines(project.history, node_id=node_id)),
+                                        media_type="application/x-ndjson")
+    except BaseException:
+        projects.release(project)
+        raise
+
+@app.post("/projects/{project_id}/history/import")
+async def import_project_history(project_id: str, request: Request):
+    """
+    Creates a project from an export streamed in the request body. The body is
+    spooled to a temporary file as it arrives and imported in one transaction;
+    the project only appears once the whole import has succeeded. Importing
+    over an existing project is refused.
+    """
+    init_services()
+    try:
+        project_id = projects.validate(project_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    database_path = projects.path_for(project_id)
+    if os.path.exists(database_path):
+        raise HTTPException(status_code=409, detail="The project already exists; import into a new project ID.")
+    os.makedirs(os.path.dirname(os.path.abspath(database_path)), exist_ok=True)
+    loop = asyncio.get_running_loop()
+    with tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_BYTES) as body:
+        # Once the body is past IMPORT_SPOOL_BYTES, writes go to disk, so they run off the event loop.
+        async for chunk in request.stream():
+            await loop.run_in_executor(None, body.write, chunk)
+        body.seek(0)
+        try:
+            totals = await loop.run_in_executor(
+                None, partial(import_new_database, database_path, body,
+                              snapshot_codec=os.environ.get("JAM_HISTORY_CODEC", "json"))
+            )
+        except FileExistsError:
+            raise HTTPException(status_code=409, detail="The project already exists; import into a new project ID.")
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except OSError as e:
+            raise HTTPException(status_code=500, detail=f"Could not store the imported project: {e}")
+    return {"project_id": project_id, **totals}
+
+class BranchRequest(BaseModel):
+    node_id: str
+
+@app.get("/projects/{project_id}/branches")
+async def list_project_branches(project_id: str, limit: Optional[int] = None):
+    """
+    Lists the branches ("takes") of a project's history with the node at
+    their tip, most recently changed first. The first one is where a command
+    without a history_node_id or branch runs.
+    """
+    init_services()
+    project = await _acquire_existing_project(project_id)
+    try:
+        return {"branches": await run_blocking(history_executor, project.history.list_branches, limit)}
+    finally:
+        projects.release(project)
+
+@app.put("/projects/{project_id}/branches/{name}")
+async def name_project_branch(project_id: str, name: str, req: BranchRequest):
+    """Names the branch ending at a history node, or moves a named branch there."""
+    if not BRANCH_NAME_PATTERN.fullmatch(name):
+        raise HTTPException(status_code=400, detail="Invalid branch name.")
+    init_services()
+    project = await _acquire_existing_project(project_id)
+    try:
+        await run_blocking(history_executor, project.history.name_branch, name, req.node_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    finally:
+        projects.release(project)
+    return {"branch": name, "node_id": req.node_id}
+
+@app.delete("/projects/{project_id}/branches/{name}")
+async def delete_project_branch(project_id: str, name: str):
+    """Removes a branch. The history nodes on it are kept until compaction."""
+    init_services()
+    project = await _acquire_existing_project(project_id)
+    try:
+        deleted = await run_blocking(history_executor, project.history.delete_branch, name)
+    finally:
+        projects.release(project)
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Unknown branch.")
+    return {"deleted": name}
+
+@app.get("/stats/admission")
+async def get_admission_stats():
+    """Reports how many commands were coalesced with an identical one, and admitted, queued or shed."""
+    return {"coalescing": request_coalescer.stats(), "admission": admission.stats()}
+
+@app.get("/stats/routing")
+async def get_routing_stats():
+    """Reports how commands were routed (local parser, LLM cache, LLM) and the local hit rate."""
+    return {**routing_stats.snapshot(), "cache_size": len(route_cache)}
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Exposes per-stage latency histograms and request counters in the
+    Prometheus text format. Only available when JAM_METRICS=1.
+    """
+    if not metrics.ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled; set JAM_METRICS=1 to enable them.")
+    routing = routing_stats.snapshot()
+    lines = [
+        "# HELP jam_routed_commands_total Commands routed, by source (local parser, LLM cache, LLM).",
+        "# TYPE jam_routed_commands_total counter",
+        *(f'jam_routed_commands_total{{source="{source}"}} {routing[source]}' for source in ("local", "cache", "llm")),
+    ]
+    return PlainTextResponse(metrics.render_prometheus() + "\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     uvicorn.run(app, host="127.0.0.1", port=8000)
 
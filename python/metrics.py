@@ -0,0 +1,196 @@
+# _implementation/python/metrics.py
+# This file defines the latency instrumentation: timers around graph nodes,
+# the router's model call, history operations and the generation phases.
+# Timings are aggregated into histograms served in the Prometheus text format
+# by /metrics, and each request's stages are logged as one JSON trace record.
+#
+# Instrumentation is off unless JAM_METRICS=1. When it is off, `instrument`
+# returns the function unchanged and `timed` returns a shared no-op context
+# manager, so the instrumented code paths cost nothing measurable.
+
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+ENABLED = os.environ.get("JAM_METRICS", "0") == "1"
+
+# Upper bounds in seconds, from sub-millisecond SQLite reads to minute-long generations.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_NULL_TIMER = nullcontext()
+_trace = ContextVar("metrics_trace", default=None)
+
+
+class Histogram:
+    """A Prometheus-style histogram of durations, with one series per stage label."""
+    def __init__(self, name: str, help_text: str, buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}  # stage -> [bucket counts..., count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            series = self._series.get(stage)
+            if series is None:
+                series = self._series[stage] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += 1
+            series[-1] += seconds
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {stage: list(values) for stage, values in self._series.items()}
+        for stage, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{stage="{stage}",le="+Inf"}} {values[-2]}')
+            lines.append(f'{self.name}_count{{stage="{stage}"}} {values[-2]}')
+            lines.append(f'{self.name}_sum{{stage="{stage}"}} {values[-1]}')
+        return lines
+
+
+class Counter:
+    """A Prometheus-style counter with one series per label value."""
+    def __init__(self, name: str, help_text: str, label: str):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_value: str, amount: int = 1):
+        with self._lock:
+            self._values[label_value] = self._values.get(label_value, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for label_value, value in sorted(values.items()):
+            lines.append(f'{self.name}{{{self.label}="{label_value}"}} {value}')
+        return lines
+
+
+stage_duration = Histogram("jam_stage_duration_seconds", "Time spent in each stage of command handling.")
+stage_errors = Counter("jam_stage_errors_total", "Stages that raised an exception.", "stage")
+requests_total = Counter("jam_requests_total", "Requests handled, by endpoint.", "endpoint")
+
+
+def observe(stage: str, seconds: float, failed: bool = False):
+    """
+    Records one stage duration in the histogram and, inside a traced request,
+    in that request's trace.
+    """
+    stage_duration.observe(stage, seconds)
+    if failed:
+        stage_errors.inc(stage)
+    trace = _trace.get()
+    if trace is not None:
+        trace["stages"].append({"stage": stage, "ms": round(seconds * 1000, 3)})
+
+
+class _Timer:
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(self.stage, time.perf_counter() - self.start, failed=exc_type is not None)
+        return False
+
+
+def timed(stage: str):
+    """
+    Returns a context manager that times its block as `stage`.
+
+    Args:
+        stage (str): The stage name, e.g. "router.llm" or "history.commit".
+    """
+    if not ENABLED:
+        return _NULL_TIMER
+    return _Timer(stage)
+
+
+def instrument(stage: str):
+    """
+    Decorates a function (sync or async) so each call is timed as `stage`.
+    With instrumentation off, the function is returned unchanged.
+    """
+    def decorator(func):
+        if not ENABLED:
+            return func
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with _Timer(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _Timer(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def request_trace(endpoint: str, **fields):
+    """
+    Traces one request: every stage timed inside the block (including work
+    offloaded through executors.run_blocking, which carries the context over)
+    is collected, and a single JSON record is logged when the block exits.
+
+    Args:
+        endpoint (str): The endpoint name, e.g. "/command".
+        **fields: Extra fields for the trace record, such as the command text.
+    """
+    if not ENABLED:
+        yield None
+        return
+    trace = {"trace_id": uuid.uuid4().hex[:16], "endpoint": endpoint, **fields, "stages": []}
+    token = _trace.set(trace)
+    start = time.perf_counter()
+    failed = False
+    try:
+        yield trace
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        _trace.reset(token)
+        seconds = time.perf_counter() - start
+        stage_duration.observe(f"request{endpoint}", seconds)
+        requests_total.inc(endpoint)
+        if failed:
+            stage_errors.inc(f"request{endpoint}")
+        trace["total_ms"] = round(seconds * 1000, 3)
+        trace["failed"] = failed
+        print(f"TRACE {json.dumps(trace)}")
+
+
+def render_prometheus() -> str:
+    """Renders every metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in (requests_total, stage_duration, stage_errors):
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
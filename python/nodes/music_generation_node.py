@@ -1,6 +1,7 @@
 # _implementation/python/nodes/music_generation_node.py
 # This file defines the music generation node for the LangGraph agent.
-# It uses the Replicate API to generate a new music track.
+# It uses the Replicate API to generate a new music track, or several at
+# once when one utterance asks for more than one.
 
 from dotenv import load_dotenv
 # Load environment variables from .env file
@@ -9,115 +10,256 @@ load_dotenv()
 
 import os
 import shutil
-import requests
-import replicate
+import time
 from typing import Dict
 
+from downloads import DownloadError, shared_downloader
+from events import emit_event, emit_response
+from metrics import timed
+from track_store import TrackStore
+
 
 # Check for Replicate API token
 if not os.environ.get("REPLICATE_API_TOKEN"):
     print("\n\n⚠️ IMPORTANT: Set the REPLICATE_API_TOKEN environment variable to enable music generation.\n\n")
 
-def generate_and_download_music(prompt: str, output_path: str) -> bool:
+# Using the specific model version and parameters from the user's working example.
+MUSICGEN_MODEL = "meta/musicgen:671ac645ce5e552cc63a54a2bbff63fcf798043055d2dac5fc9e36a837eedcfb"
+MUSICGEN_INPUT = {
+    "top_k": 250,
+    "top_p": 0,
+    "duration": 8,
+    "temperature": 1,
+    "continuation": False,
+    "model_version": "stereo-large",
+    "output_format": "mp3",
+    "continuation_start": 0,
+    "multi_band_diffusion": False,
+    "normalization_strategy": "peak",
+    "classifier_free_guidance": 3
+}
+
+def generate_and_download_music(prompt: str, output_path: str, cache=None) -> bool:
     """
-    Calls the Replicate API to generate music and downloads the output.
+    Calls the Replicate API to generate music and downloads the output (see
+    downloads.py: retried, resumed and written atomically). When an AudioCache is given, an identical earlier request (same model
+    version and input) is served from the cache instead.
 
     Args:
         prompt (str): The text prompt for the music generation.
         output_path (str): The path to save the downloaded audio file.
+        cache (AudioCache | None): The cache of previously generated audio.
 
     Returns:
         bool: True if generation and download were successful, False otherwise.
     """
+    model_input = {**MUSICGEN_INPUT, "prompt": prompt}
+    cache_key = cache.key_for(MUSICGEN_MODEL, model_input) if cache else None
+    with timed("generation.cache_fetch"):
+        cache_hit = bool(cache) and cache.fetch(cache_key, output_path)
+    if cache_hit:
+        emit_event("progress", {"stage": "cache_hit"})
+        print(f"Served generated music for prompt '{prompt}' from the audio cache.")
+        return True
+
     if not os.environ.get("REPLICATE_API_TOKEN"):
         print("Cannot generate music: REPLICATE_API_TOKEN is not set.")
         return False
+
+    # Imported on first use, so starting the server does not pay for it.
+    import replicate
         
     try:
         print(f"Running Replicate with prompt: {prompt}")
-        # Using the specific model version and parameters from the user's working example.
-        output_url = replicate.run(
-            "meta/musicgen:671ac645ce5e552cc63a54a2bbff63fcf798043055d2dac5fc9e36a837eedcfb",
-            input={ 
-                "top_k": 250, 
-                "top_p": 0, 
-                "prompt": prompt, 
-                "duration": 8, 
-                "temperature": 1, 
-                "continuation": False, 
-                "model_version": "stereo-large", 
-                "output_format": "mp3", 
-                "continuation_start": 0, 
-                "multi_band_diffusion": False, 
-                "normalization_strategy": "peak", 
-                "classifier_free_guidance": 3 
-            }
-        )
+        emit_event("progress", {"stage": "generating"})
+        with timed("generation.replicate"):
+            output_url = replicate.run(MUSICGEN_MODEL, input=model_input)
         
         if not output_url:
             print("Replicate API did not return an output URL.")
             return False
 
         print(f"Downloading generated music from: {output_url}")
-        response = requests.get(output_url, stream=True)
-        response.raise_for_status()  # Raise an exception for bad status codes
-
-        with open(output_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
+        emit_event("progress", {"stage": "downloading"})
+        with timed("generation.download"):
+            download = shared_downloader().download(output_url, output_path)
         
-        print(f"Successfully saved music to {output_path}")
+        print(f"Successfully saved music to {output_path} ({download['bytes']} bytes, sha256 {download['sha256']})")
+        emit_event("progress", {"stage": "downloaded", "bytes": download["bytes"], "sha256": download["sha256"]})
+        if cache:
+            with timed("generation.cache_store"):
+                cache.store(cache_key, output_path)
         return True
 
     except replicate.exceptions.ReplicateError as e:
         print(f"Replicate API error: {e}")
         return False
-    except requests.exceptions.RequestException as e:
+    except DownloadError as e:
         print(f"Failed to download generated music: {e}")
         return False
     except Exception as e:
         print(f"An unexpected error occurred during music generation: {e}")
         return False
 
-def music_generation_node(state: Dict, history) -> Dict:
-    """
-    A node that calls a music generation service and adds the new track to the state.
-    """
-    print("Executing music_generation_node")
+DEFAULT_PROMPT = "a groovy 4-bar bass line, 120bpm"
+
+def _generated_track(number: int, output_path: str) -> Dict:
+    """Returns the track for generated audio, numbered with the session's next track ID."""
+    # In a real app, track properties might come from the generation service.
+    return {
+        "id": f"track_{number}",
+        "name": f"AI Loop {number}",
+        "volume": 1.0,
+        "is_playing": True,
+        "path": output_path
+    }
+
+def _with_tracks(state: Dict, output_paths: list[str]) -> tuple[Dict, list[Dict]]:
+    """Returns a copy of the state with a track added for each audio file, and the new tracks."""
     new_state = state.copy()
-    new_state["tracks"] = [t.copy() for t in state["tracks"]]
-    
-    # Extract the prompt from the router's arguments, with a fallback.
-    args = state.get("modification_args", {})
-    generation_prompt = args.get("prompt", "a groovy 4-bar bass line, 120bpm")
+    tracks = TrackStore.of(state["tracks"])
+    new_tracks = []
+    for output_path in output_paths:
+        new_track = _generated_track(new_state["next_track_id"], output_path)
+        tracks = tracks.add(new_track)
+        new_tracks.append(new_track)
+        new_state["next_track_id"] += 1
+    new_state["tracks"] = tracks
+    return new_state, new_tracks
 
-    # Define a path for the new audio file. In a real app, this would be in a project folder.
-    new_track_filename = f"generated_track_{state['next_track_id']}.mp3" # The model now produces .mp3
+def generate_track(state: Dict, prompt: str, output_path: str, history, cache=None, pregenerated: bool = False,
+                   requested_at: float | None = None) -> Dict:
+    """
+    Generates a track and adds it to the session. This is the slow part of
+    music generation; it runs on the generation job queue, so commands may
+    have been committed since the request. The track is added to the
+    current tip of the requester's branch (see HistoryManager.commit_on_tip),
+    not to the state it was requested from, so those commands are kept.
+
+    Args:
+        state (Dict): The session state the generation was requested from.
+        prompt (str): The text prompt for the music generation.
+        output_path (str): The path to save the downloaded audio file.
+        history: The HistoryManager the new state is committed to.
+        cache (AudioCache | None): The cache of previously generated audio.
+        pregenerated (bool): The audio is already at `output_path` (from a speculative
+                             generation), so only the track is added.
+        requested_at (float | None): When the generation was requested (time.time()).
+                                     Defaults to now.
 
+    Returns:
+        Dict: The new state, with its response set. It is only committed to
+              history if generation succeeded.
+    """
     # Call the actual generation and download function
-    if generate_and_download_music(generation_prompt, new_track_filename):
-        # In a real app, track properties might come from the generation service.
-        new_track = {
-            "id": f"track_{state['next_track_id']}",
-            "name": f"AI Loop {state['next_track_id']}",
-            "volume": 1.0,
-            "is_playing": True,
-            "path": new_track_filename
-        }
-        new_state["tracks"].append(new_track)
-        new_state["next_track_id"] += 1
+    if pregenerated or generate_and_download_music(prompt, output_path, cache=cache):
+        def add_track(current: Dict) -> Dict:
+            new_state, (new_track,) = _with_tracks(current, [output_path])
+            new_state["response"] = {
+                "action": "add_new_track",
+                "track": new_track,
+                "speak": f"I've created a new track for you: {new_track['name']}"
+            }
+            return new_state
 
+        # The history manager sets the new state's history_node_id.
+        new_state = history.commit_on_tip(state, time.time() if requested_at is None else requested_at, add_track)
+        emit_response(new_state["response"])
+    else:
+        new_state = state.copy()
+        new_state["response"] = {"speak": "I wasn't able to create any music right now. Maybe check if the Replicate API token is set correctly?"}
+        # Do not commit a new state if generation fails
+
+    return new_state
+
+def add_generated_tracks(state: Dict, output_paths: list[str], history, failed_prompts: list[str] = (),
+                         requested_at: float | None = None) -> Dict:
+    """
+    Adds one track per generated audio file to the session and commits them
+    as a single history node. This finishes a group of concurrent generations
+    (see GenerationJobQueue.submit_group). Like generate_track, the tracks are
+    added to the current tip of the requester's branch.
+
+    Args:
+        state (Dict): The session state the generations were requested from.
+        output_paths (list[str]): The generated audio files, in the order they were requested.
+        history: The HistoryManager the new state is committed to.
+        failed_prompts (list[str]): The prompts that produced no audio, to mention in the reply.
+        requested_at (float | None): When the generations were requested (time.time()).
+                                     Defaults to now.
+
+    Returns:
+        Dict: The new state, with its response set. Nothing is committed if no audio was generated.
+    """
+    missed = f" I couldn't make {' or '.join(failed_prompts)}." if failed_prompts else ""
+    if not output_paths:
+        new_state = state.copy()
+        new_state["response"] = {"speak": f"I wasn't able to create any music right now.{missed}"}
+        return new_state
+
+    def add_tracks(current: Dict) -> Dict:
+        new_state, new_tracks = _with_tracks(current, output_paths)
+        # Shaped like a batch response: the first track at the top level, every track under "actions".
+        actions = [{"action": "add_new_track", "track": track} for track in new_tracks]
+        names = " and ".join(track["name"] for track in new_tracks)
         new_state["response"] = {
-            "action": "add_new_track",
-            "track": new_track,
-            "speak": f"I've created a new track for you: {new_track['name']}"
+            **actions[0],
+            "actions": actions,
+            "speak": f"I've created {'a new track' if len(new_tracks) == 1 else f'{len(new_tracks)} new tracks'} for you: {names}.{missed}"
         }
+        return new_state
+
+    new_state = history.commit_on_tip(state, time.time() if requested_at is None else requested_at, add_tracks)
+    emit_response(new_state["response"])
+    return new_state
+
+def _generation_prompt(state: Dict, args: Dict, jobs) -> str | None:
+    """
+    Returns the prompt a generate_new_music call asks for: the last suggestion's
+    music when it accepts a suggestion ('from_suggestion'), otherwise its prompt.
+    """
+    if args.get("from_suggestion"):
+        return jobs.take_suggestion(state.get("history_node_id"))
+    return args.get("prompt", DEFAULT_PROMPT)
+
+def queue_generations(state: Dict, history, jobs, requests: list[Dict]) -> Dict:
+    """
+    Queues the music generations asked for in one utterance and acknowledges
+    them right away. A single generation is one job; several (e.g. "a drum
+    loop, a bassline and a pad") are one group job whose generations run
+    concurrently and whose tracks are committed together when they finish.
+
+    Args:
+        state (Dict): The session state the tracks should be added to.
+        history: The HistoryManager of the session.
+        jobs (GenerationJobQueue): The queue that runs the generations.
+        requests (list[Dict]): The arguments of each generate_new_music call.
+    """
+    prompts = [prompt for prompt in (_generation_prompt(state, args, jobs) for args in requests) if prompt]
+    if not prompts:
+        state["response"] = {"speak": "I don't have a suggestion waiting. What would you like me to add?"}
+        return state
 
-        # Commit the new state to history
-        parent_node_id = state.get("history_node_id")
-        history.commit(new_state, parent_node_id) # The history manager mutates new_state
+    if len(prompts) == 1:
+        job = jobs.submit(state, prompts[0], history=history)
+        speak = "I'm working on that now. I'll let you know when it's ready."
     else:
-        new_state["response"] = {"speak": "I wasn't able to create any music right now. Maybe check if the Replicate API token is set correctly?"}
-        # Do not commit a new state if generation fails
+        job = jobs.submit_group(state, prompts, history=history)
+        speak = f"I'm working on those {len(prompts)} tracks now. I'll let you know when they're ready."
+    state["response"] = {
+        "action": "generation_started",
+        "job_id": job["job_id"],
+        "speak": speak
+    }
+    return state
 
-    return new_state 
\ No newline at end of file
+def music_generation_node(state: Dict, history, jobs) -> Dict:
+    """
+    A node that queues a music generation job and acknowledges it right away.
+    The new track is delivered (and committed to history) when the job finishes;
+    the client polls /jobs/{job_id} for it. A command that accepts the last
+    suggestion ('from_suggestion') generates the suggested music, reusing its
+    speculative generation when there is one.
+    """
+    print("Executing music_generation_node")
+    return queue_generations(state, history, jobs, [state.get("modification_args") or {}])
@@ -2,45 +2,145 @@
 # This file defines the nodes responsible for analyzing the current
 # musical state and generating creative suggestions.
 
+import math
 from typing import Dict
 
-def analysis_node(state: Dict, history) -> Dict:
+# Below this share of the mix's energy, a band counts as missing.
+THIN_LOW_END = 0.12
+THIN_HIGH_END = 0.02
+# Tempo estimates with less autocorrelation than this are not trusted.
+MIN_TEMPO_CONFIDENCE = 0.3
+QUIET_MIX_DBFS = -35.0
+
+
+def summarize_mix(track_features: list[dict]) -> dict | None:
     """
-    Analyzes the current state and generates a human-readable summary.
-    This is a placeholder for a more sophisticated analysis engine.
+    Combines per-track features into a description of the whole mix. The
+    tempo is the median of the confident estimates, the key is estimated from
+    the summed chroma, and the band balance and loudness are averaged by
+    each track's energy.
+
+    Args:
+        track_features (list[dict]): The features of each playing track (see audio_analysis).
+
+    Returns:
+        dict | None: The mix features, or None if no track could be analyzed.
+    """
+    if not track_features:
+        return None
+    # NumPy is only imported once there is audio to analyze, to keep startup fast.
+    from audio_analysis import estimate_key
+
+    tempos = sorted(f["tempo_bpm"] for f in track_features
+                    if f["tempo_bpm"] and f["tempo_confidence"] >= MIN_TEMPO_CONFIDENCE)
+    energies = [10 ** (f["loudness_dbfs"] / 10) for f in track_features]
+    total_energy = sum(energies) or 1.0
+    chroma = [sum(f["chroma"][pitch] for f in track_features) for pitch in range(12)]
+    key, key_confidence = estimate_key(chroma)
+    return {
+        "tempo_bpm": tempos[len(tempos) // 2] if tempos else None,
+        "key": key,
+        "key_confidence": key_confidence,
+        "loudness_dbfs": round(10 * math.log10(total_energy), 1),
+        "band_balance": {
+            band: round(sum(e * f["band_balance"][band] for e, f in zip(energies, track_features)) / total_energy, 3)
+            for band in ("low", "mid", "high")
+        },
+        "spectral_centroid_hz": round(sum(e * f["spectral_centroid_hz"] for e, f in zip(energies, track_features)) / total_energy, 1),
+    }
+
+
+def analysis_node(state: Dict, history, analyzer=None) -> Dict:
+    """
+    Analyzes the audio of the tracks that are playing and summarizes the mix.
+    The per-track features and the mix summary are added to the state under
+    'analysis', and a spoken description under 'analysis_summary'.
+
+    Args:
+        state (Dict): The current graph state.
+        history: The HistoryManager (unused; nodes share one signature).
+        analyzer (AudioAnalyzer | None): Analyzes and caches the track files.
+                                         Without one, only the tracks are counted.
     """
     print("Executing analysis_node")
-    
-    track_count = len(state.get("tracks", []))
-    
-    # Simple, hardcoded summary based on the number of tracks.
+
+    tracks = state.get("tracks", [])
+    playing = [track for track in tracks if track.get("is_playing")]
+    track_features = {}
+    if analyzer is not None:
+        for track in playing:
+            if track.get("path"):
+                features = analyzer.analyze(track["path"])
+                if features is not None:
+                    track_features[track["id"]] = features
+    mix = summarize_mix(list(track_features.values()))
+
+    track_count = len(tracks)
     if track_count == 0:
         summary = "The session is currently empty."
     elif track_count == 1:
         summary = "There is currently one loop playing."
     else:
         summary = f"There are {track_count} tracks playing together."
-        
-    # We add the summary to the state to be passed to the next node.
+    if mix:
+        details = [f"around {mix['tempo_bpm']:.0f} BPM" if mix["tempo_bpm"] else None,
+                   f"in {mix['key']}" if mix["key"] else None]
+        details = [detail for detail in details if detail]
+        if details:
+            summary = f"{summary[:-1]}, {' '.join(details)}."
+
+    # We add the analysis to the state to be passed to the next node.
+    state["analysis"] = {"tracks": track_features, "mix": mix}
     state["analysis_summary"] = summary
     return state
 
-def suggestion_node(state: Dict, history) -> Dict:
+
+def suggestion_node(state: Dict, history, jobs=None) -> Dict:
     """
-    Generates a creative suggestion based on the analysis summary.
-    This is a placeholder for a real LLM-based suggestion engine.
+    Generates a creative suggestion from the analysis: it fills whatever the
+    mix is missing (a pulse, low end, top end), in the mix's key and tempo.
+    Without analyzed audio it falls back to a suggestion based on the track count.
+
+    When the suggestion is new music and a GenerationJobQueue is given, the
+    suggestion is registered with it, so that a "yes" generates that music,
+    and the queue may start generating it speculatively.
     """
     print("Executing suggestion_node")
-    
+
     summary = state.get("analysis_summary", "The session is empty.")
-    
-    # Simple, hardcoded suggestion.
+    mix = (state.get("analysis") or {}).get("mix")
+    prompt = None
+
     if "empty" in summary:
         suggestion = "How about starting with a simple drum beat?"
-    else:
+        prompt = "a simple drum beat, 120bpm"
+    elif not mix:
         suggestion = "A funky bassline might sound cool on top of that."
+        prompt = "a funky bassline"
+    else:
+        tempo = f" at {mix['tempo_bpm']:.0f} BPM" if mix["tempo_bpm"] else ""
+        key = f" in {mix['key']}" if mix["key"] else ""
+        prompt_tempo = f", {mix['tempo_bpm']:.0f}bpm" if mix["tempo_bpm"] else ""
+        bands = mix["band_balance"]
+        if not mix["tempo_bpm"]:
+            suggestion = "There's no steady pulse yet. A simple drum groove would help lock the loops together."
+            prompt = f"a simple drum groove{key}"
+        elif bands["low"] < THIN_LOW_END:
+            suggestion = f"The low end is pretty empty. How about a warm bassline{key}{tempo}?"
+            prompt = f"a warm bassline{key}{prompt_tempo}"
+        elif bands["high"] < THIN_HIGH_END:
+            suggestion = f"It sounds a little dark up top. Some shakers or open hi-hats{tempo} could add sparkle."
+            prompt = f"shakers and open hi-hats{prompt_tempo}"
+        elif mix["loudness_dbfs"] < QUIET_MIX_DBFS:
+            suggestion = "Everything is sitting quite low. Try bringing up the volume of your main loop."
+        else:
+            suggestion = f"The groove feels solid. A short melodic hook{key} could sit nicely on top."
+            prompt = f"a short melodic hook{key}{prompt_tempo}"
+
+    if prompt and jobs is not None:
+        jobs.suggest(state, prompt)
 
     # The final response is a spoken suggestion for the user.
     # We do not commit a new state, as this is a read-only operation.
     state["response"] = {"speak": suggestion}
-    return state 
\ No newline at end of file
+    return state
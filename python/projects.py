@@ -0,0 +1,161 @@
+# _implementation/python/projects.py
+# This file defines the ProjectRegistry, which lets one backend serve many
+# projects. Each project has its own SQLite history database, and so its own
+# root node, its own HistoryManager and its own database locks: commands on
+# one project never wait on another project's writes. Projects are opened on
+# first use, and the least recently used idle ones are closed when too many
+# are open.
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# Project IDs become file names, so they are restricted to a safe alphabet.
+PROJECT_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+DEFAULT_PROJECT_ID = "default"
+
+
+class Project:
+    """
+    An open project: its history and the per-project state built on it.
+    `graph` is compiled on first use by the server; `in_use` counts the
+    commands currently running against the project.
+    """
+    def __init__(self, project_id: str, history):
+        self.project_id = project_id
+        self.history = history
+        self.graph = None
+        self.in_use = 0
+        self.last_used = time.monotonic()
+
+
+class ProjectRegistry:
+    """
+    Opens, caches and closes projects. At most `max_open` projects stay open;
+    beyond that the least recently used idle projects are closed. A project
+    is idle when no command is running against it and `is_busy` (for example,
+    "has generation jobs that will commit to it") returns False.
+    """
+    def __init__(self, directory: str, open_history, default_path: str = "project.db", max_open: int = 64,
+                 is_busy=None):
+        """
+        Args:
+            directory (str): The directory that holds one database per project.
+            open_history: Called with a database path; returns a HistoryManager
+                          whose history has a root node.
+            default_path (str): The database of the default project, which is used
+                                when a request names no project.
+            max_open (int): The number of projects kept open at once.
+            is_busy: Called with a HistoryManager; returns True if it must stay open.
+        """
+        self.directory = directory
+        self.open_history = open_history
+        self.default_path = default_path
+        self.max_open = max_open
+        self.is_busy = is_busy or (lambda history: False)
+        self._projects = OrderedDict()
+        self._lock = threading.Lock()
+        # Opening a project creates its database; one lock per project ID keeps
+        # two first requests from opening it twice, without holding up others.
+        self._opening = {}
+
+    @staticmethod
+    def validate(project_id: str | None) -> str:
+        """
+        Returns the project ID to use for a request.
+
+        Raises:
+            ValueError: If the ID contains anything but letters, digits, '-' and '_'.
+        """
+        if project_id is None:
+            return DEFAULT_PROJECT_ID
+        if not PROJECT_ID_PATTERN.fullmatch(project_id):
+            raise ValueError("Project IDs may only contain letters, digits, '-' and '_' (at most 64 characters).")
+        return project_id
+
+    def path_for(self, project_id: str) -> str:
+        """Returns the database path of a project."""
+        if project_id == DEFAULT_PROJECT_ID:
+            return self.default_path
+        return os.path.join(self.directory, f"{project_id}.db")
+
+    def get(self, project_id: str | None) -> Project:
+        """
+        Returns an open project, opening (and if needed creating) it first.
+
+        Raises:
+            ValueError: If the project ID is invalid.
+        """
+        return self._open(project_id, acquire=False)
+
+    def acquire(self, project_id: str | None) -> Project:
+        """
+        Like get(), but also marks the project in use, so it is not closed,
+        until release() is called.
+        """
+        return self._open(project_id, acquire=True)
+
+    def _open(self, project_id: str | None, acquire: bool) -> Project:
+        project_id = self.validate(project_id)
+        with self._lock:
+            project = self._projects.get(project_id)
+            if project is not None:
+                self._projects.move_to_end(project_id)
+                project.last_used = time.monotonic()
+                project.in_use += acquire
+                return project
+            opening = self._opening.setdefault(project_id, threading.Lock())
+        with opening:
+            with self._lock:
+                project = self._projects.get(project_id)
+                if project is not None:
+                    project.in_use += acquire
+                    return project
+            if project_id != DEFAULT_PROJECT_ID:
+                os.makedirs(self.directory, exist_ok=True)
+            project = Project(project_id, self.open_history(self.path_for(project_id)))
+            project.in_use += acquire
+            with self._lock:
+                self._projects[project_id] = project
+                self._opening.pop(project_id, None)
+            print(f"Opened project '{project_id}'.")
+        self._evict(keep=project_id)
+        return project
+
+    def release(self, project: Project):
+        """Marks a project acquired with acquire() as no longer in use by the caller."""
+        with self._lock:
+            project.in_use -= 1
+            project.last_used = time.monotonic()
+
+    def open_projects(self) -> list[Project]:
+        """Returns the open projects, least recently used first."""
+        with self._lock:
+            return list(self._projects.values())
+
+    def _evict(self, keep: str):
+        """Closes the least recently used idle projects beyond `max_open`, other than `keep`."""
+        closing = []
+        with self._lock:
+            excess = len(self._projects) - self.max_open
+            for project_id, project in list(self._projects.items()):
+                if excess <= 0:
+                    break
+                if project_id in (DEFAULT_PROJECT_ID, keep) or project.in_use or self.is_busy(project.history):
+                    continue
+                del self._projects[project_id]
+                closing.append(project)
+                excess -= 1
+        for project in closing:
+            project.history.close()
+            print(f"Closed idle project '{project.project_id}'.")
+
+    def close(self):
+        """Closes every open project."""
+        with self._lock:
+            projects = list(self._projects.values())
+            self._projects.clear()
+        for project in projects:
+            project.history.close()
@@ -0,0 +1,328 @@
+# _implementation/python/snapshot_codec.py
+# This file defines the codecs the HistoryManager stores state snapshots (and
+# deltas) with. "json" is the original text encoding. "binary" is a compact
+# tagged encoding that knows the shape of AgentState: key names and common
+# values are written as small integers from fixed tables, tracks are written
+# as records (a field bitmask, then the values, without key names), and
+# numbers with up to four decimals are written as variable-length integers.
+# "binary+zlib" also compresses snapshots large enough to benefit.
+#
+# Binary snapshots start with a format version byte. A JSON snapshot always
+# starts with '{', so any stored snapshot, including rows written before
+# codecs existed, can be decoded without knowing which codec wrote it.
+
+import json
+import math
+import struct
+import zlib
+from functools import lru_cache
+
+BINARY_VERSION = 1
+BINARY_ZLIB_VERSION = 2
+# The codec that writes snapshots starting with each first byte.
+FIRST_BYTE_CODECS = {BINARY_VERSION: "binary", BINARY_ZLIB_VERSION: "binary+zlib", ord("{"): "json"}
+
+# Dict keys written as table indexes. Append only: a key's index is part of
+# the stored format, so existing entries must never move.
+KEY_TABLE = (
+    # AgentState
+    "history_node_id", "tracks", "command", "response", "modification_args", "next_track_id",
+    "next_node", "tool_calls", "analysis", "analysis_summary",
+    # Track
+    "id", "name", "volume", "is_playing", "path", "reverb", "delay",
+    # Deltas (see snapshot_delta.py)
+    "set", "unset", "changed", "added", "removed",
+    # Responses and tool arguments
+    "action", "speak", "track", "track_id", "value", "state", "job_id", "actions", "steps", "prompt", "args",
+)
+# String values written as table indexes. Append only, like KEY_TABLE.
+STRING_TABLE = (
+    "add_new_track", "generation_started", "load_state", "mute_track", "unmute_track", "set_volume",
+    "set_reverb", "set_delay", "start_recording", "stop_recording_and_create_loop",
+)
+# The fields of a track record, in the order their bits appear in its bitmask.
+TRACK_FIELDS = ("id", "name", "volume", "is_playing", "path", "reverb", "delay")
+
+_KEY_INDEX = {key: index for index, key in enumerate(KEY_TABLE)}
+_STRING_INDEX = {value: index for index, value in enumerate(STRING_TABLE)}
+_TRACK_FIELD_INDEX = {field: index for index, field in enumerate(TRACK_FIELDS)}
+_TRACK_FIELD_BITS = tuple((1 << index, field) for index, field in enumerate(TRACK_FIELDS))
+_EXTRA_FIELDS = 0x80  # Set in a track's bitmask when a map of other fields follows.
+
+# Value tags.
+_NONE, _FALSE, _TRUE, _INT, _DECIMAL, _FLOAT, _STR, _TABLE_STR, _LIST, _DICT, _TRACK = range(11)
+# Numbers stored as _DECIMAL are scaled by this, which covers every value the
+# intent parser produces (it rounds to four decimals).
+_DECIMAL_SCALE = 10000
+_DOUBLE = struct.Struct("<d")
+
+# Snapshots smaller than this are not worth compressing.
+COMPRESS_MIN_BYTES = 256
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _zigzag(value: int) -> int:
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def _unzigzag(value: int) -> int:
+    return value >> 1 if not value & 1 else -(value >> 1) - 1
+
+
+# The same names, IDs, paths and levels recur in every snapshot of a session,
+# so the encodings of keys and scalars are memoized. typed=True keeps 1, 1.0
+# and True apart.
+@lru_cache(maxsize=4096)
+def _encoded_key(key: str) -> bytes:
+    """A dict key: an even varint for a KEY_TABLE index, an odd one for a literal of that length."""
+    index = _KEY_INDEX.get(key)
+    if index is not None:
+        return _varint(index * 2)
+    raw = key.encode("utf-8")
+    return _varint(len(raw) * 2 + 1) + raw
+
+
+@lru_cache(maxsize=4096, typed=True)
+def _encoded_scalar(value) -> bytes:
+    """A tagged string, integer or float."""
+    if isinstance(value, str):
+        index = _STRING_INDEX.get(value)
+        if index is not None:
+            return bytes((_TABLE_STR,)) + _varint(index)
+        raw = value.encode("utf-8")
+        return bytes((_STR,)) + _varint(len(raw)) + raw
+    if isinstance(value, int):
+        return bytes((_INT,)) + _varint(_zigzag(value))
+    scaled = round(value * _DECIMAL_SCALE) if value == value and abs(value) < 1e12 else None
+    if scaled is not None and scaled / _DECIMAL_SCALE == value:
+        return bytes((_DECIMAL,)) + _varint(_zigzag(scaled))
+    return bytes((_FLOAT,)) + _DOUBLE.pack(value)
+
+
+def _is_track_record(value: dict) -> bool:
+    """
+    True if a dict can be written as a track record: it has an 'id', and its
+    track fields come first and in TRACK_FIELDS order, so decoding restores
+    the original key order.
+    """
+    if "id" not in value:
+        return False
+    last = -1
+    extras = False
+    for key in value:
+        index = _TRACK_FIELD_INDEX.get(key)
+        if index is None:
+            extras = True
+        elif extras or index < last:
+            return False
+        else:
+            last = index
+    return True
+
+
+def _write_value(out: bytearray, value):
+    if value is None:
+        out.append(_NONE)
+    elif value is True:
+        out.append(_TRUE)
+    elif value is False:
+        out.append(_FALSE)
+    elif isinstance(value, (str, int, float)):
+        if value == 0 and isinstance(value, float) and math.copysign(1, value) < 0:
+            # -0.0 equals 0.0, so it would share 0.0's memoized encoding.
+            out.append(_FLOAT)
+            out += _DOUBLE.pack(value)
+        else:
+            out += _encoded_scalar(value)
+    elif isinstance(value, dict):
+        if _is_track_record(value):
+            mask = 0
+            for key in value:
+                index = _TRACK_FIELD_INDEX.get(key)
+                mask |= _EXTRA_FIELDS if index is None else 1 << index
+            out.append(_TRACK)
+            out.append(mask)
+            for field in TRACK_FIELDS:
+                if field in value:
+                    item = value[field]
+                    if item.__class__ is str:
+                        out += _encoded_scalar(item)
+                    else:
+                        _write_value(out, item)
+            if mask & _EXTRA_FIELDS:
+                _write_value(out, {key: item for key, item in value.items() if key not in _TRACK_FIELD_INDEX})
+        else:
+            out.append(_DICT)
+            out += _varint(len(value))
+            for key, item in value.items():
+                # Non-string keys are written the way json.dumps would write them.
+                out += _encoded_key(key if isinstance(key, str) else json.dumps(key))
+                _write_value(out, item)
+    elif isinstance(value, (list, tuple)):
+        out.append(_LIST)
+        out += _varint(len(value))
+        for item in value:
+            _write_value(out, item)
+    else:
+        raise TypeError(f"Object of type {type(value).__name__} cannot be stored in a snapshot")
+
+
+def _read(data: bytes, position: int):
+    """Decodes the value that starts at data[position]."""
+    def varint() -> int:
+        nonlocal position
+        byte = data[position]
+        position += 1
+        if byte < 0x80:
+            return byte
+        result, shift = byte & 0x7F, 7
+        while True:
+            byte = data[position]
+            position += 1
+            result |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return result
+            shift += 7
+
+    def value():
+        nonlocal position
+        tag = data[position]
+        position += 1
+        if tag == _STR:
+            length = data[position]
+            if length < 0x80:
+                position += length + 1
+            else:
+                length = varint()
+                position += length
+            return data[position - length:position].decode("utf-8")
+        if tag == _DECIMAL:
+            scaled = data[position]
+            if scaled < 0x80:
+                position += 1
+            else:
+                scaled = varint()
+            return _unzigzag(scaled) / _DECIMAL_SCALE
+        if tag == _TRUE:
+            return True
+        if tag == _FALSE:
+            return False
+        if tag == _NONE:
+            return None
+        if tag == _TRACK:
+            mask = data[position]
+            position += 1
+            track = {}
+            for bit, field in _TRACK_FIELD_BITS:
+                if mask & bit:
+                    track[field] = value()
+            if mask & _EXTRA_FIELDS:
+                track.update(value())
+            return track
+        if tag == _TABLE_STR:
+            return STRING_TABLE[varint()]
+        if tag == _DICT:
+            result = {}
+            for _ in range(varint()):
+                code = varint()
+                if code & 1:
+                    position += code >> 1
+                    key = data[position - (code >> 1):position].decode("utf-8")
+                else:
+                    key = KEY_TABLE[code >> 1]
+                result[key] = value()
+            return result
+        if tag == _LIST:
+            return [value() for _ in range(varint())]
+        if tag == _INT:
+            return _unzigzag(varint())
+        if tag == _FLOAT:
+            position += 8
+            return _DOUBLE.unpack_from(data, position - 8)[0]
+        raise ValueError(f"Unknown value tag {tag} in binary snapshot")
+
+    return value()
+
+
+class JsonCodec:
+    """The original encoding: a snapshot is stored as JSON text."""
+    name = "json"
+
+    def encode(self, snapshot: dict) -> str:
+        return json.dumps(snapshot)
+
+
+class BinaryCodec:
+    """The compact binary encoding, optionally zlib-compressed."""
+    def __init__(self, compress: bool = False, level: int = 6):
+        """
+        Args:
+            compress (bool): Compresses snapshots of at least COMPRESS_MIN_BYTES,
+                             when that makes them smaller.
+            level (int): The zlib compression level.
+        """
+        self.compress = compress
+        self.level = level
+        self.name = "binary+zlib" if compress else "binary"
+
+    def encode(self, snapshot: dict) -> bytes:
+        out = bytearray((BINARY_VERSION,))
+        _write_value(out, snapshot)
+        if self.compress and len(out) >= COMPRESS_MIN_BYTES:
+            compressed = zlib.compress(bytes(out), self.level)
+            if len(compressed) + 1 < len(out):
+                return bytes((BINARY_ZLIB_VERSION,)) + compressed
+        return bytes(out)
+
+
+CODECS = {
+    "json": JsonCodec,
+    "binary": BinaryCodec,
+    "binary+zlib": lambda: BinaryCodec(compress=True),
+}
+
+
+def get_codec(name: str):
+    """
+    Returns the codec with the given name.
+
+    Raises:
+        ValueError: If there is no such codec.
+    """
+    if name not in CODECS:
+        raise ValueError(f"Unknown snapshot codec '{name}'. Expected one of {tuple(CODECS)}.")
+    return CODECS[name]()
+
+
+def decode_snapshot(stored) -> dict:
+    """
+    Decodes a stored snapshot written by any codec, or by versions that
+    predate codecs (JSON text).
+
+    Args:
+        stored (str | bytes): The stored snapshot.
+
+    Returns:
+        dict: The decoded snapshot.
+
+    Raises:
+        ValueError: If the snapshot has an unknown format version.
+    """
+    if isinstance(stored, str):
+        return json.loads(stored)
+    version = stored[0]
+    if version == BINARY_VERSION:
+        return _read(stored, 1)
+    if version == BINARY_ZLIB_VERSION:
+        return decode_snapshot(zlib.decompress(stored[1:]))
+    if version == ord("{"):
+        return json.loads(stored)
+    raise ValueError(f"Unknown snapshot format version {version}")
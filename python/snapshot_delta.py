@@ -0,0 +1,159 @@
+# _implementation/python/snapshot_delta.py
+# This file defines the delta encoding used by the HistoryManager's "delta"
+# storage mode. A delta describes how to turn a parent state snapshot into
+# a child snapshot, so a history node only stores what actually changed
+# (a volume nudge, a mute toggle, a new loop) instead of the whole session.
+
+import copy
+
+from track_store import TrackStore
+
+
+def _index_tracks(tracks) -> dict | None:
+    """
+    Indexes a list of tracks by their 'id'.
+
+    Returns:
+        dict | None: A mapping of track ID to track, or None if the tracks
+                     cannot be diffed by ID (not a list, missing or duplicate IDs).
+    """
+    if not isinstance(tracks, list):
+        return None
+    indexed = {}
+    for track in tracks:
+        if not isinstance(track, dict) or "id" not in track or track["id"] in indexed:
+            return None
+        indexed[track["id"]] = track
+    return indexed
+
+
+def _diff_tracks(old_tracks, new_tracks) -> dict | None:
+    """
+    Computes a per-track delta between two track lists.
+
+    Returns:
+        dict | None: The track delta (empty if nothing changed), or None if the
+                     lists cannot be expressed as a track delta and should be
+                     stored in full instead.
+    """
+    if isinstance(old_tracks, TrackStore) and old_tracks.same_layout(new_tracks):
+        return _diff_same_layout(old_tracks, new_tracks)
+
+    old_by_id = _index_tracks(old_tracks)
+    new_by_id = _index_tracks(new_tracks)
+    if old_by_id is None or new_by_id is None:
+        return None
+
+    removed = [track_id for track_id in old_by_id if track_id not in new_by_id]
+    added = []
+    changed = {}
+    for track in new_tracks:
+        previous = old_by_id.get(track["id"])
+        if previous is None:
+            added.append(track)
+            continue
+        if previous is track:
+            # Shared by structurally-shared TrackStores, so unchanged.
+            continue
+        if previous.keys() - track.keys():
+            # A field was dropped from the track; deltas only describe sets.
+            return None
+        fields = {key: value for key, value in track.items() if key not in previous or previous[key] != value}
+        if fields:
+            changed[track["id"]] = fields
+
+    # Deltas keep the surviving tracks in order and append new ones at the end.
+    expected_order = [track_id for track_id in old_by_id if track_id in new_by_id] + [t["id"] for t in added]
+    if expected_order != [t["id"] for t in new_tracks]:
+        return None
+
+    track_delta = {}
+    if changed:
+        track_delta["changed"] = changed
+    if added:
+        track_delta["added"] = added
+    if removed:
+        track_delta["removed"] = removed
+    return track_delta
+
+
+def _diff_same_layout(old_tracks: TrackStore, new_tracks: TrackStore) -> dict | None:
+    """
+    Computes the track delta between two TrackStores with the same IDs in the
+    same order. Tracks the two stores share are unchanged, so only the
+    replaced ones are compared.
+    """
+    changed = {}
+    for previous, track in zip(old_tracks, new_tracks):
+        if previous is track:
+            continue
+        if previous.keys() - track.keys():
+            return None
+        fields = {key: value for key, value in track.items() if key not in previous or previous[key] != value}
+        if fields:
+            changed[track["id"]] = fields
+    return {"changed": changed} if changed else {}
+
+
+def diff_states(parent: dict, child: dict) -> dict:
+    """
+    Computes the delta that turns the parent snapshot into the child snapshot.
+
+    Args:
+        parent (dict): The decoded parent state snapshot.
+        child (dict): The decoded child state snapshot.
+
+    Returns:
+        dict: A JSON-serializable delta. Empty sections are omitted.
+    """
+    delta = {}
+    set_keys = {}
+    for key, value in child.items():
+        if key == "tracks" and "tracks" in parent:
+            track_delta = _diff_tracks(parent["tracks"], value)
+            if track_delta is None:
+                set_keys[key] = value
+            elif track_delta:
+                delta["tracks"] = track_delta
+        elif key not in parent or parent[key] != value:
+            set_keys[key] = value
+
+    unset_keys = [key for key in parent if key not in child]
+    if set_keys:
+        delta["set"] = set_keys
+    if unset_keys:
+        delta["unset"] = unset_keys
+    return delta
+
+
+def apply_delta(parent: dict, delta: dict) -> dict:
+    """
+    Applies a delta produced by `diff_states` to a parent snapshot.
+    The parent is not modified.
+
+    Args:
+        parent (dict): The decoded parent state snapshot.
+        delta (dict): The delta to apply.
+
+    Returns:
+        dict: The reconstructed child state snapshot.
+    """
+    unset_keys = set(delta.get("unset", ()))
+    state = {key: value for key, value in parent.items() if key not in unset_keys}
+
+    track_delta = delta.get("tracks")
+    if track_delta:
+        changed = track_delta.get("changed", {})
+        removed = set(track_delta.get("removed", ()))
+        tracks = []
+        for track in state.get("tracks", []):
+            if track["id"] in removed:
+                continue
+            if track["id"] in changed:
+                track = {**track, **changed[track["id"]]}
+            tracks.append(track)
+        tracks.extend(copy.deepcopy(track_delta.get("added", [])))
+        state["tracks"] = tracks
+
+    state.update(copy.deepcopy(delta.get("set", {})))
+    return state
@@ -0,0 +1,7 @@
+# _implementation/python/tests/conftest.py
+# Makes the modules in python/ importable from the tests, however pytest is started.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,82 @@
+# _implementation/python/tests/test_batch.py
+# Tests for running several tool calls from one utterance (main.batch_node).
+
+import pytest
+
+import main
+from history_manager import HistoryManager
+
+
+@pytest.fixture
+def history(tmp_path):
+    manager = HistoryManager(str(tmp_path / "project.db"))
+    yield manager
+    manager.close()
+
+
+def track(number: int, volume: float = 1.0) -> dict:
+    return {"id": f"track_{number}", "name": f"Loop {number}", "volume": volume, "is_playing": True,
+            "path": None, "reverb": 0.0, "delay": 0.0}
+
+
+def run_batch(history, node_id: str, tool_calls: list[dict]) -> dict:
+    state = {**history.get_state(node_id), "tool_calls": tool_calls}
+    return main.batch_node(state, history, jobs=None)
+
+
+@pytest.fixture
+def two_utterances(history):
+    """A root with one track, then an utterance that turned it down to 0.5."""
+    root_id = history.commit({"tracks": [track(0)], "next_track_id": 1}, None)
+    previous_id = history.commit({"tracks": [track(0, volume=0.5)], "next_track_id": 1}, root_id)
+    return root_id, previous_id
+
+
+def test_undo_drops_the_staged_changes_first(history, two_utterances):
+    root_id, previous_id = two_utterances
+    final = run_batch(history, previous_id, [
+        {"name": "modify_track_volume", "args": {"track_id": "track_0", "volume": 0.9}},
+        {"name": "undo", "args": {}},
+    ])
+    assert final["history_node_id"] == previous_id
+    assert final["tracks"][0]["volume"] == 0.5
+    response = final["response"]
+    assert response["action"] == "load_state"
+    assert response["state"]["tracks"][0]["volume"] == 0.5
+    assert [action["action"] for action in response["actions"]] == ["set_volume", "load_state"]
+    # Nothing new was committed.
+    assert history.redo(previous_id) is None
+
+
+def test_further_undo_steps_go_back_from_the_batch_base(history, two_utterances):
+    root_id, previous_id = two_utterances
+    final = run_batch(history, previous_id, [
+        {"name": "toggle_track_playback", "args": {"track_id": "track_0"}},
+        {"name": "undo", "args": {"steps": 2}},
+    ])
+    assert final["history_node_id"] == root_id
+    assert final["response"]["state"]["tracks"][0]["volume"] == 1.0
+
+
+def test_undo_without_staged_changes_steps_back(history, two_utterances):
+    root_id, previous_id = two_utterances
+    final = run_batch(history, previous_id, [
+        {"name": "undo", "args": {}},
+        {"name": "modify_track_volume", "args": {"track_id": "track_0", "volume": 0.3}},
+    ])
+    assert history.get_state(final["history_node_id"])["tracks"][0]["volume"] == 0.3
+    assert history.get_parent(final["history_node_id"])["history_node_id"] == root_id
+    # The top level is the final state, not the first action.
+    assert final["response"]["action"] == "load_state"
+    assert final["response"]["state"]["tracks"][0]["volume"] == 0.3
+    assert final["response"]["state"]["history_node_id"] == final["history_node_id"]
+
+
+def test_single_action_stays_at_top_level(history, two_utterances):
+    _, previous_id = two_utterances
+    final = run_batch(history, previous_id, [
+        {"name": "modify_track_volume", "args": {"track_id": "track_0", "volume": 0.2}},
+        {"name": "unknown_tool", "args": {}},
+    ])
+    assert final["response"]["action"] == "set_volume"
+    assert final["response"]["volume"] == 0.2
@@ -0,0 +1,94 @@
+# _implementation/python/tests/test_generation_jobs.py
+# Tests for committing finished generations (generation_jobs.py) while the
+# session keeps changing.
+
+import threading
+import time
+
+import pytest
+
+import generation_jobs
+import main
+from generation_jobs import GenerationJobQueue
+from history_manager import HistoryManager
+
+
+@pytest.fixture
+def history(tmp_path):
+    manager = HistoryManager(str(tmp_path / "project.db"))
+    yield manager
+    manager.close()
+
+
+@pytest.fixture
+def release(monkeypatch, tmp_path):
+    """Holds every generation until the returned event is set; generations then write a file and succeed."""
+    event = threading.Event()
+
+    def generate(prompt, output_path, cache=None):
+        event.wait(5)
+        return True
+    monkeypatch.setattr(generation_jobs, "generate_and_download_music", generate)
+    monkeypatch.setattr("nodes.music_generation_node.generate_and_download_music", generate)
+    monkeypatch.chdir(tmp_path)
+    return event
+
+
+@pytest.fixture
+def jobs(history):
+    queue = GenerationJobQueue(history)
+    yield queue
+    queue.shutdown()
+
+
+def track(number: int) -> dict:
+    return {"id": f"track_{number}", "name": f"Loop {number}", "volume": 1.0, "is_playing": True,
+            "path": None, "reverb": 0.0, "delay": 0.0}
+
+
+def wait_for(jobs, job_id: str) -> dict:
+    for _ in range(500):
+        job = jobs.get(job_id)
+        if job["status"] in ("succeeded", "failed"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+
+def mute(history, node_id: str, track_id: str) -> str:
+    state = {**history.get_state(node_id), "modification_args": {"track_id": track_id, "is_playing": False}}
+    return main.toggle_playback_node(state, history)["history_node_id"]
+
+
+@pytest.mark.parametrize("prompts", [["a bass"], ["a bass", "a pad"]])
+def test_commands_run_during_a_generation_are_kept(history, jobs, release, prompts):
+    root_id = history.commit({"tracks": [track(0)], "next_track_id": 1}, None)
+    state = history.get_state(root_id)
+    job = jobs.submit(state, prompts[0]) if len(prompts) == 1 else jobs.submit_group(state, prompts)
+
+    muted_id = mute(history, root_id, "track_0")
+    release.set()
+    job = wait_for(jobs, job["job_id"])
+
+    assert job["status"] == "succeeded"
+    result_id = job["result"]["history_node_id"]
+    assert history.get_parent_id(result_id) == muted_id
+    result = history.get_state(result_id)
+    assert result["tracks"][0]["is_playing"] is False
+    assert [t["id"] for t in result["tracks"]] == [f"track_{i}" for i in range(len(prompts) + 1)]
+    assert history.get_latest_node_id() == result_id
+    assert [branch["branch"] for branch in history.list_branches()] == ["main"]
+
+
+def test_a_generation_does_not_follow_an_undone_branch(history, jobs, release):
+    root_id = history.commit({"tracks": [track(0)], "next_track_id": 1}, None)
+    undone_id = mute(history, root_id, "track_0")
+    # After undoing the mute, the client asks for music at the root.
+    job = jobs.submit(history.get_state(root_id), "a bass")
+    release.set()
+    job = wait_for(jobs, job["job_id"])
+
+    result_id = job["result"]["history_node_id"]
+    assert history.get_parent_id(result_id) == root_id
+    assert history.get_state(result_id)["tracks"][0]["is_playing"] is True
+    assert history.get_branch("main") == undone_id
@@ -0,0 +1,125 @@
+# _implementation/python/tests/test_history_manager.py
+# Tests for HistoryManager (history_manager.py).
+
+import zlib
+
+import pytest
+
+from history_manager import HistoryManager
+
+
+@pytest.fixture(params=["full", "delta"])
+def history(request, tmp_path):
+    manager = HistoryManager(str(tmp_path / "project.db"), storage_mode=request.param)
+    yield manager
+    manager.close()
+
+
+def session(track_count: int = 3) -> dict:
+    tracks = [{"id": f"track_{i}", "name": f"Loop {i}", "volume": 1.0, "is_playing": True,
+               "path": None, "reverb": 0.0, "delay": 0.0} for i in range(track_count)]
+    return {"tracks": tracks, "next_track_id": track_count}
+
+
+def test_returned_tracks_cannot_corrupt_the_cache(history):
+    node_id = history.commit(session(), None)
+    state = history.get_state(node_id)
+    with pytest.raises(TypeError):
+        state["tracks"][0]["volume"] = 0.1
+    with pytest.raises(TypeError):
+        state["tracks"][1].update(is_playing=False)
+    with pytest.raises(TypeError):
+        state["tracks"].append({"id": "track_9"})
+
+    # Editable copies are the caller's own.
+    track = state["tracks"][2].copy()
+    track["reverb"] = 80.0
+    state["next_track_id"] = 42
+
+    assert history.get_state(node_id) == {**session(), "history_node_id": node_id}
+
+
+def test_changed_tracks_are_committed_separately(history):
+    root_id = history.commit(session(), None)
+    state = history.get_state(root_id)
+    state["tracks"] = state["tracks"].replace("track_1", volume=0.5)
+    child_id = history.commit(state, root_id)
+
+    assert history.get_state(root_id)["tracks"][1]["volume"] == 1.0
+    assert history.get_state(child_id)["tracks"][1]["volume"] == 0.5
+    with pytest.raises(TypeError):
+        history.get_state(child_id)["tracks"][1]["volume"] = 0.2
+
+
+@pytest.mark.parametrize("codec", ["json", "binary", "binary+zlib"])
+def test_conversion_can_keep_the_stored_codec(tmp_path, codec):
+    path = str(tmp_path / "project.db")
+    writer = HistoryManager(path, snapshot_codec=codec)
+    assert writer.stored_codec() is None
+    node_id = None
+    for track_count in range(1, 12):
+        node_id = writer.commit(session(track_count), node_id)
+    writer.close()
+
+    # Opened with the default codec, as the CLI does.
+    history = HistoryManager(path)
+    assert history.stored_codec() == codec
+    history.convert_storage("full", snapshot_codec=history.stored_codec())
+    assert history.codec.name == history.stored_codec() == codec
+    assert history.get_state(node_id) == {**session(11), "history_node_id": node_id}
+    history.close()
+
+
+def test_archived_nodes_are_not_in_the_history(history):
+    root_id = history.commit(session(), None)
+    abandoned_id = history.commit(session(2), root_id)
+    kept_id = history.commit(session(4), root_id)
+    history.compact(heads=[kept_id], keep_recent=0)
+
+    assert history.has_node(kept_id)
+    assert not history.has_node(abandoned_id)
+    assert not history.has_node("missing")
+    # get_state still finds the archived node; exporting it would fail.
+    assert history.get_state(abandoned_id) is not None
+    with pytest.raises(ValueError):
+        list(history.iter_nodes(abandoned_id))
+
+
+def test_conversion_reaches_every_node_left_by_compaction(tmp_path):
+    history = HistoryManager(str(tmp_path / "project.db"), storage_mode="delta")
+    root_id = history.commit(session(), None)
+    history.commit(session(2), root_id)  # Abandoned, and archived below.
+    node_id = root_id
+    for track_count in range(4, 8):
+        node_id = history.commit(session(track_count), node_id)
+    history.compact(heads=[node_id], keep_recent=0)
+    # A live node whose parent is only in the archive, as iter_nodes allows for.
+    parent_id = history.get_parent_id(node_id)
+    row = history.conn.execute("SELECT node_id, parent_id, snapshot_kind, state_snapshot FROM state_tree "
+                               "WHERE node_id = ?", (parent_id,)).fetchone()
+    history.conn.execute("INSERT INTO state_archive VALUES (?, ?, 0, ?, ?)",
+                         (*row[:3], zlib.compress(row[3].encode())))
+    history.conn.execute("DELETE FROM state_tree WHERE node_id = ?", (parent_id,))
+    history.conn.commit()
+    history._cache.clear()
+
+    live = history.conn.execute("SELECT COUNT(*) FROM state_tree").fetchone()[0]
+    assert history.convert_storage("full", snapshot_codec="binary") == live
+    assert history.stored_codec() == "binary"
+    assert history.conn.execute("SELECT COUNT(*) FROM state_tree WHERE typeof(state_snapshot) = 'text' "
+                                "OR snapshot_kind != 'full'").fetchone()[0] == 0
+    assert history.get_state(node_id) == {**session(7), "history_node_id": node_id}
+    history.close()
+
+
+def test_parent_lookups_leave_the_cache_stats_alone(history):
+    root_id = history.commit(session(), None)
+    child_id = history.commit(session(2), root_id)
+    hits, misses = history.cache_hits, history.cache_misses
+    order = list(history._cache)
+
+    assert history.get_parent_id(child_id) == root_id
+    assert history.get_parent_id(root_id) is None
+    assert history.get_parent_id("missing") is None
+    assert (history.cache_hits, history.cache_misses) == (hits, misses)
+    assert list(history._cache) == order
@@ -0,0 +1,99 @@
+# _implementation/python/tests/test_intent_parser.py
+# Tests for the local command parser (intent_parser.py).
+
+import pytest
+
+from intent_parser import parse_intent, normalize_command
+
+
+def args_of(command: str) -> dict | None:
+    tool_call = parse_intent(command)
+    return tool_call["args"] if tool_call else None
+
+
+@pytest.mark.parametrize("command, volume", [
+    ("set the volume of track 1 to 0.5", 0.5),
+    ("set the volume of track 1 to 0", 0.0),
+    ("set the volume of track 1 to 1", 1.0),
+    ("set the volume of track 1 to 1.0", 1.0),
+    ("set the volume of track 1 to 50%", 0.5),
+    ("set the volume of track 1 to 150 percent", None),
+    ("set the volume of track 1 to half", 0.5),
+    ("track 1 volume to full", 1.0),
+])
+def test_volume_values(command, volume):
+    args = args_of(command)
+    assert (args["volume"] if args else None) == volume
+
+
+@pytest.mark.parametrize("command", [
+    "set the volume of track 1 to 1.5",
+    "set the volume of track 1 to 2",
+    "set the volume of track 1 to 50",
+    "set the volume of track 1 to fifty",
+])
+def test_volume_out_of_range_goes_to_llm(command):
+    assert parse_intent(command) is None
+
+
+@pytest.mark.parametrize("command, reverb", [
+    ("set the reverb of track 1 to 40", 40.0),
+    ("set the reverb of track 1 to 0", 0.0),
+    ("set the reverb of track 1 to 100", 100.0),
+    ("set the reverb of track 1 to 50%", 50.0),
+    ("add half reverb to track 1", 50.0),
+])
+def test_effect_values(command, reverb):
+    assert args_of(command) == {"track_id": "track_1", "reverb": reverb}
+
+
+@pytest.mark.parametrize("command", [
+    "set the reverb of track 1 to 0.5",
+    "set the reverb of track 1 to 1",
+    "set the reverb of track 1 to 1.0",
+    "set the delay of track 1 to 101",
+])
+def test_ambiguous_or_out_of_range_effects_go_to_llm(command):
+    assert parse_intent(command) is None
+
+
+@pytest.mark.parametrize("command, is_playing", [
+    ("mute track 2", False),
+    ("silence track 2", False),
+    ("track 2 off", False),
+    ("unmute track 2", True),
+    ("track 2 on", True),
+])
+def test_mute_and_unmute_name_the_target_state(command, is_playing):
+    assert parse_intent(command) == {"name": "toggle_track_playback",
+                                     "args": {"track_id": "track_2", "is_playing": is_playing}}
+
+
+def test_toggle_flips_the_track():
+    assert parse_intent("toggle track 2") == {"name": "toggle_track_playback", "args": {"track_id": "track_2"}}
+
+
+@pytest.mark.parametrize("command, name, args", [
+    ("Record.", "record", {}),
+    ("stop_recording", "stop_recording", {}),
+    ("undo", "undo", {"steps": 1}),
+    ("undo the last three changes", "undo", {"steps": 3}),
+    ("redo 2 times", "redo", {"steps": 2}),
+])
+def test_simple_commands(command, name, args):
+    assert parse_intent(command) == {"name": name, "args": args}
+
+
+def test_unknown_commands_go_to_llm():
+    assert parse_intent("make it sound like a rainy afternoon") is None
+
+
+def test_normalize_keeps_decimals_and_percent():
+    assert normalize_command("  Set Track 1 to 0.5, or 50%! ") == "set track 1 to 0.5 or 50%"
+
+
+@pytest.mark.parametrize("command", ["ok", "yes", "sure", "sounds good", "let's do it"])
+def test_accepting_needs_a_pending_suggestion(command):
+    assert parse_intent(command) is None
+    assert parse_intent(command, pending_suggestion=True) == {"name": "generate_new_music",
+                                                              "args": {"from_suggestion": True}}
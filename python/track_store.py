@@ -0,0 +1,131 @@
+# _implementation/python/track_store.py
+# This file defines the TrackStore, the session's track collection. It is a
+# list of track dicts (so it serializes to the exact JSON the Swift client
+# expects) with an index by track ID. A TrackStore is never changed in place:
+# `replace` and `add` return a new store that shares every untouched track
+# with the old one, so a command that tweaks one loop copies one track
+# instead of the whole session. The tracks themselves are FrozenTracks, so
+# a shared track cannot be edited by accident either.
+
+
+def _immutable(name: str, kind: str = "TrackStore", instead: str = "Use replace() or add()."):
+    def method(self, *args, **kwargs):
+        raise TypeError(f"{kind} is immutable; '{name}' is not supported. {instead}")
+    method.__name__ = name
+    return method
+
+
+class FrozenTrack(dict):
+    """
+    A read-only track dict, as held by a TrackStore. It is still a dict, so
+    it serializes like one; `copy()` and `{**track}` give an editable plain dict.
+    """
+    __slots__ = ()
+
+    def __reduce__(self):
+        return (type(self), (dict(self),))
+
+    __setitem__ = _immutable("__setitem__", "FrozenTrack", "Use TrackStore.replace().")
+    __delitem__ = _immutable("__delitem__", "FrozenTrack", "Use TrackStore.replace().")
+    __ior__ = _immutable("__ior__", "FrozenTrack", "Use TrackStore.replace().")
+    update = _immutable("update", "FrozenTrack", "Use TrackStore.replace().")
+    setdefault = _immutable("setdefault", "FrozenTrack", "Use TrackStore.replace().")
+    pop = _immutable("pop", "FrozenTrack", "Use TrackStore.replace().")
+    popitem = _immutable("popitem", "FrozenTrack", "Use TrackStore.replace().")
+    clear = _immutable("clear", "FrozenTrack", "Use TrackStore.replace().")
+
+
+def _frozen(track):
+    return track if isinstance(track, FrozenTrack) or not isinstance(track, dict) else FrozenTrack(track)
+
+
+class TrackStore(list):
+    """
+    An immutable list of tracks indexed by their 'id'. Versions derived from
+    one another share their unchanged tracks, which are FrozenTracks.
+    """
+    __slots__ = ("_index",)
+
+    def __init__(self, tracks=()):
+        """
+        Args:
+            tracks: The track dicts, in order. Each must have a unique 'id'.
+                    The store holds read-only copies of them.
+
+        Raises:
+            ValueError: If a track has no 'id' or an ID appears twice.
+        """
+        super().__init__(_frozen(track) for track in tracks)
+        index = {}
+        for position, track in enumerate(self):
+            if not isinstance(track, dict) or "id" not in track or track["id"] in index:
+                raise ValueError("Every track needs a unique 'id' to be stored in a TrackStore.")
+            index[track["id"]] = position
+        self._index = index
+
+    @classmethod
+    def of(cls, tracks) -> "TrackStore":
+        """Returns `tracks` itself if it is already a TrackStore, otherwise a TrackStore of it."""
+        return tracks if isinstance(tracks, cls) else cls(tracks)
+
+    @classmethod
+    def _derive(cls, tracks: list, index: dict) -> "TrackStore":
+        store = cls.__new__(cls)
+        list.extend(store, tracks)
+        store._index = index
+        return store
+
+    def get(self, track_id: str) -> dict | None:
+        """Returns the track with the given ID, or None."""
+        position = self._index.get(track_id)
+        return None if position is None else list.__getitem__(self, position)
+
+    def same_layout(self, other) -> bool:
+        """
+        Returns True if `other` is known to hold the same track IDs in the same
+        order, because one was derived from the other with `replace`.
+        """
+        return isinstance(other, TrackStore) and other._index is self._index
+
+    def replace(self, track_id: str, **changes) -> "TrackStore":
+        """
+        Returns a new store in which one track has the given fields changed.
+        Only that track is copied; the others (and the ID index) are shared.
+
+        Raises:
+            KeyError: If there is no track with the given ID.
+        """
+        position = self._index[track_id]
+        tracks = list(self)
+        tracks[position] = FrozenTrack({**tracks[position], **changes})
+        return self._derive(tracks, self._index)
+
+    def add(self, track: dict) -> "TrackStore":
+        """
+        Returns a new store with the track appended.
+
+        Raises:
+            ValueError: If a track with the same ID already exists.
+        """
+        if track.get("id") is None or track["id"] in self._index:
+            raise ValueError(f"Cannot add a track without a unique 'id': {track.get('id')!r}.")
+        index = dict(self._index)
+        index[track["id"]] = len(self)
+        return self._derive([*self, _frozen(track)], index)
+
+    def __reduce__(self):
+        # copy, deepcopy and pickle rebuild the store through __init__.
+        return (type(self), (list(self),))
+
+    append = _immutable("append")
+    extend = _immutable("extend")
+    insert = _immutable("insert")
+    remove = _immutable("remove")
+    pop = _immutable("pop")
+    clear = _immutable("clear")
+    sort = _immutable("sort")
+    reverse = _immutable("reverse")
+    __setitem__ = _immutable("__setitem__")
+    __delitem__ = _immutable("__delitem__")
+    __iadd__ = _immutable("__iadd__")
+    __imul__ = _immutable("__imul__")